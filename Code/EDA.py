@@ -2,18 +2,17 @@ import os
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+from LunarModules.Paths import ProjectPaths
 
-def RUN_EDA():
+def RUN_EDA(paths = None):
     '''
     full function that runs EDA code to gather data used in the notebook
+    :param paths: ProjectPaths of the data, None for the project this file is in
     :return:
     '''
     #getting paths
-    CODE_PATH = os.getcwd()
-    os.chdir('..')
-    BASE_PATH = os.getcwd()
-    os.chdir(CODE_PATH)
-    DATA_PATH = os.path.join(BASE_PATH, 'Data')
+    paths = ProjectPaths() if paths is None else paths
+    DATA_PATH = paths.data
 
     imgs = os.listdir(os.path.join(DATA_PATH, 'images', 'clean'))
 
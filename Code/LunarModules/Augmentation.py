@@ -0,0 +1,281 @@
+"""
+Augmentation.py
+Tensor based data augmentation that works on single samples (C, H, W) or whole batches (B, C, H, W).
+
+Geometric transforms are applied to images and masks together, photometric transforms to images only. Random
+parameters are drawn per sample but applied with batched tensor ops, so augmenting a collated batch costs a handful
+of kernel calls instead of a Python loop over images.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+
+CITATIONS:
+RGB -> HSV conversion follows torchvision: https://github.com/pytorch/vision/blob/main/torchvision/transforms/_functional_tensor.py
+"""
+import torch
+from torch.utils.data.dataloader import default_collate
+from LunarModules.Distributed import get_rank, get_world_size
+
+
+def _as_batch(x):
+    '''
+    add a batch dimension to a single sample
+    :return: batched tensor, True if a dimension was added
+    '''
+    if x.dim() == 3:
+        return x.unsqueeze(0), True
+    return x, False
+
+
+def _uniform(n, low, high, generator, device):
+    '''
+    n samples from U[low, high]
+    '''
+    return low + (high - low) * torch.rand(n, generator = generator, device = device)
+
+
+def _grayscale(img):
+    '''
+    ITU-R 601-2 luma, same weights as torchvision
+    :param img: (B, 3, H, W)
+    :return: (B, 1, H, W)
+    '''
+    r, g, b = img.unbind(dim = -3)
+    return (0.2989 * r + 0.587 * g + 0.114 * b).unsqueeze(-3)
+
+
+def _rgb_to_hsv(img):
+    '''
+    :param img: (..., 3, H, W) RGB between 0 and 1
+    :return: hue, saturation, value each (..., H, W), hue between 0 and 1
+    '''
+    r, g, b = img.unbind(dim = -3)
+    maxc = torch.max(img, dim = -3).values
+    minc = torch.min(img, dim = -3).values
+    cr = maxc - minc
+    eqc = cr == 0
+    s = cr / torch.where(eqc, torch.ones_like(maxc), maxc)
+    cr = torch.where(eqc, torch.ones_like(cr), cr)
+    h = torch.where(maxc == r, (g - b) / cr, torch.where(maxc == g, 2.0 + (b - r) / cr, 4.0 + (r - g) / cr))
+    h = torch.remainder(h / 6.0, 1.0)
+    return h, s, maxc
+
+
+def _hsv_to_rgb(h, s, v):
+    '''
+    closed form HSV -> RGB (https://en.wikipedia.org/wiki/HSL_and_HSV#HSV_to_RGB_alternative), each channel is
+    v - v * s * clamp(min(k, 4 - k), 0, 1) with k = (n + 6h) mod 6 and n = 5, 3, 1 for R, G, B
+    :return: (..., 3, H, W) RGB
+    '''
+    n = torch.tensor([5.0, 3.0, 1.0], dtype = h.dtype, device = h.device).view(3, 1, 1)
+    k = torch.remainder(n + 6.0 * h.unsqueeze(-3), 6.0)
+    weight = torch.minimum(k, 4.0 - k).clamp(0, 1)
+    return v.unsqueeze(-3) * (1 - s.unsqueeze(-3) * weight)
+
+
+class RandomFlip:
+    '''
+    Random vertical and horizontal flips, applied to the image and its mask together
+    '''
+    # dims to flip of each flip combination, 0 none, 1 vertical, 2 horizontal, 3 both
+    COMBINATION_DIMS = [[], [-2], [-1], [-2, -1]]
+
+    def __init__(self, p_vertical = 0.8, p_horizontal = 0.8):
+        '''
+        :param p_vertical: probability of a vertical flip
+        :param p_horizontal: probability of a horizontal flip
+        '''
+        self.p_vertical = p_vertical
+        self.p_horizontal = p_horizontal
+
+    def _flip_samples(self, x, combinations, out):
+        '''
+        flip every sample straight into out, on CPU there is no kernel launch to save and gathering the samples of a
+        combination first costs an extra copy of them
+        '''
+        for i, combination in enumerate(combinations.tolist()):
+            dims = self.COMBINATION_DIMS[combination]
+            out[i] = x[i].flip(dims) if dims else x[i]
+        return out
+
+    def _flip_combinations(self, x, combinations, out):
+        '''
+        one gather, flip and scatter per flip combination in the batch (at most 4), whatever the batch size
+        '''
+        for combination in combinations.unique().tolist():
+            dims = self.COMBINATION_DIMS[combination]
+            idx = (combinations == combination).nonzero().squeeze(1)
+            selected = x.index_select(0, idx)
+            out.index_copy_(0, idx, selected.flip(dims) if dims else selected)
+        return out
+
+    def __call__(self, images, masks, generator = None):
+        n = images.shape[0]
+        vertical = torch.rand(n, generator = generator, device = images.device) < self.p_vertical
+        horizontal = torch.rand(n, generator = generator, device = images.device) < self.p_horizontal
+        combinations = vertical.long() + 2 * horizontal.long()
+        if not combinations.any():
+            return images, masks
+
+        flip = self._flip_samples if images.device.type == 'cpu' else self._flip_combinations
+        return flip(images, combinations, torch.empty_like(images)), flip(masks, combinations, torch.empty_like(masks))
+
+
+class ColorJitter:
+    '''
+    Random brightness/contrast/saturation/hue jitter of the images (masks are untouched), like
+    torchvision.transforms.ColorJitter but with a different random factor for every sample of the batch
+    '''
+    def __init__(self, brightness = 0.5, contrast = 0.5, saturation = 0.5, hue = 0.5, chunk_size = 4):
+        '''
+        :param brightness: brightness factor is drawn from [1 - brightness, 1 + brightness]
+        :param contrast: contrast factor is drawn from [1 - contrast, 1 + contrast]
+        :param saturation: saturation factor is drawn from [1 - saturation, 1 + saturation]
+        :param hue: hue shift is drawn from [-hue, hue], at most 0.5
+        :param chunk_size: samples processed together on CPU, keeps the intermediate tensors in cache. None to
+                           process the whole batch at once. On GPU the whole batch is always processed at once
+        '''
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.hue = hue
+        self.chunk_size = chunk_size
+
+    def _draw(self, n, generator, device):
+        '''
+        draw the op order (same for the whole batch) and the per sample factors
+        :return: list of (op, factors of shape (n,))
+        '''
+        ranges = [
+            (max(0, 1 - self.brightness), 1 + self.brightness) if self.brightness > 0 else None,
+            (max(0, 1 - self.contrast), 1 + self.contrast) if self.contrast > 0 else None,
+            (max(0, 1 - self.saturation), 1 + self.saturation) if self.saturation > 0 else None,
+            (-self.hue, self.hue) if self.hue > 0 else None,
+        ]
+        ops = []
+        for op in torch.randperm(4, generator = generator, device = device).tolist():
+            if ranges[op] is not None:
+                ops.append((op, _uniform(n, ranges[op][0], ranges[op][1], generator, device)))
+        return ops
+
+    def _apply(self, rgb, ops):
+        view = (rgb.shape[0], 1, 1, 1)
+        for op, factor in ops:
+            if op == 0:
+                rgb = (rgb * factor.view(view)).clamp(0, 1)
+            elif op == 1:
+                mean = _grayscale(rgb).mean(dim = (-3, -2, -1), keepdim = True)
+                rgb = (factor.view(view) * rgb + (1 - factor.view(view)) * mean).clamp(0, 1)
+            elif op == 2:
+                rgb = (factor.view(view) * rgb + (1 - factor.view(view)) * _grayscale(rgb)).clamp(0, 1)
+            else:
+                h, s, v = _rgb_to_hsv(rgb)
+                rgb = _hsv_to_rgb(h + factor.view(-1, 1, 1), s, v)
+        return rgb
+
+    def __call__(self, images, masks, generator = None):
+        n = images.shape[0]
+        ops = self._draw(n, generator, images.device)
+        if len(ops) == 0:
+            return images, masks
+
+        # only jitter RGB, any extra (alpha) channel is passed through
+        out = torch.empty_like(images)
+        out[:, 3:] = images[:, 3:]
+        chunk_size = n if self.chunk_size is None or images.device.type != 'cpu' else self.chunk_size
+        for start in range(0, n, chunk_size):
+            end = min(start + chunk_size, n)
+            out[start:end, :3] = self._apply(images[start:end, :3], [(op, factor[start:end]) for op, factor in ops])
+        return out, masks
+
+
+class Augmentation:
+    '''
+    Runs a list of transforms on images (C, H, W) or (B, C, H, W) and their masks
+    '''
+    def __init__(self, transforms):
+        '''
+        :param transforms: list of callables transform(images, masks, generator) -> (images, masks)
+        '''
+        self.transforms = transforms
+
+    def __call__(self, images, masks, generator = None):
+        '''
+        :param images: image tensor, values between 0 and 1
+        :param masks: mask tensor (one hot or class channels)
+        :param generator: optional torch.Generator for reproducible augmentation
+        :return: augmented images, masks with the same shapes as the inputs
+        '''
+        images, single = _as_batch(images)
+        masks, _ = _as_batch(masks)
+        for transform in self.transforms:
+            images, masks = transform(images, masks, generator)
+        if single:
+            return images[0], masks[0]
+        return images, masks
+
+
+def default_augmentation():
+    '''
+    The augmentation used for training: random vertical/horizontal flips (p=0.8 each) of image and mask, and colour
+    jitter of the image
+    :return: Augmentation
+    '''
+    return Augmentation([
+        RandomFlip(p_vertical = 0.8, p_horizontal = 0.8),
+        ColorJitter(brightness = 0.5, contrast = 0.5, saturation = 0.5, hue = 0.5),
+    ])
+
+
+class AugmentationCollate:
+    '''
+    DataLoader collate_fn that collates the samples and then augments the whole batch at once
+    ie: DataLoader(dataset, batch_size = 32, collate_fn = AugmentationCollate(default_augmentation()))
+    '''
+    def __init__(self, augmentation):
+        '''
+        :param augmentation: Augmentation to run on each collated batch
+        '''
+        self.augmentation = augmentation
+
+    def __call__(self, samples):
+        images, masks = default_collate(samples)
+        return self.augmentation(images, masks)
+
+
+class BatchAugmentation:
+    '''
+    Batch transform stage between the DataLoader and the model: augments each batch after it was moved to the
+    training device. The random stream is reseeded every epoch from (seed, epoch, rank), so a run is reproducible and
+    every DDP rank augments its shard differently.
+    ie: Model(..., batch_transform = BatchAugmentation(default_augmentation(), seed = 42))
+    '''
+    def __init__(self, augmentation = None, seed = 42):
+        '''
+        :param augmentation: Augmentation to run, default is default_augmentation()
+        :param seed: base seed
+        '''
+        self.augmentation = augmentation if augmentation is not None else default_augmentation()
+        self.seed = seed
+        self.epoch = 0
+        self.generator = None
+
+    def set_epoch(self, epoch):
+        '''
+        reseed for an epoch, call at the start of every epoch
+        :param epoch: epoch number
+        :return:
+        '''
+        self.epoch = epoch
+        self.generator = None
+
+    def __call__(self, images, masks):
+        '''
+        :param images: (B, C, H, W) batch on the training device
+        :param masks: (B, num_classes, H, W) batch on the training device
+        :return: augmented images, masks
+        '''
+        if self.generator is None or self.generator.device != images.device:
+            self.generator = torch.Generator(device = images.device)
+            self.generator.manual_seed(self.seed + self.epoch * get_world_size() + get_rank())
+        return self.augmentation(images, masks, self.generator)
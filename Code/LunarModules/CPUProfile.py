@@ -0,0 +1,141 @@
+"""
+CPUProfile.py
+How the cores of a CPU run are shared between torch, the DataLoader workers and OpenCV.
+
+Left at their defaults every DataLoader worker process, OpenCV's thread pool (used by cv2.resize/imread in
+CustomDataLoader) and torch's intra-op pool each start one thread per core, so with workers the cores are oversubscribed
+and the training threads keep getting preempted. A profile splits the cores instead:
+    intra_op_threads    torch threads of the training process (convolutions, matmuls)
+    inter_op_threads    torch threads running independent ops at the same time
+    num_workers         DataLoader worker processes, each with 1 torch thread and cv2_threads OpenCV threads
+    pin                 pin the training process to its cores and every worker to its own core (Linux)
+
+The profiles are kept in the "cpu" section of experiment_config.json by core count, ie: {"cpu": {"8": {...}}}, written
+by benchmarks/cpu_threads.py which times the splits of a core count. A core count with no profile gets default_profile.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import os
+
+import cv2
+import torch
+
+
+def available_cores():
+    '''
+    cores this process may run on. Under torchrun the cores of the node are shared out between its local ranks, so the
+    processes of one node don't compete for the same cores.
+    :return: sorted list of core ids
+    '''
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    local_rank, local_world_size = int(os.environ.get('LOCAL_RANK', 0)), int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+    if local_world_size > 1 and len(cores) >= local_world_size:
+        share = len(cores) // local_world_size
+        cores = cores[local_rank * share:(local_rank + 1) * share]
+    return cores
+
+
+class CPUProfile:
+    '''
+    Thread and worker split of a CPU run
+    ie: profile = cpu_profile(config); profile.apply(); DataLoader(data, batch_size = 32, **profile.loader_kwargs())
+    '''
+    def __init__(self, intra_op_threads, inter_op_threads = 1, num_workers = 0, cv2_threads = 1, pin = False, cores = None):
+        '''
+        :param intra_op_threads: torch intra-op threads of the training process
+        :param inter_op_threads: torch inter-op threads of the training process
+        :param num_workers: DataLoader worker processes
+        :param cv2_threads: OpenCV threads of each worker (and of the training process), 0 to run OpenCV single threaded
+        :param pin: pin the training process and the workers to their cores
+        :param cores: core ids to share out, None for available_cores()
+        '''
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.num_workers = num_workers
+        self.cv2_threads = cv2_threads
+        self.pin = pin
+        self.cores = available_cores() if cores is None else list(cores)
+
+    def __repr__(self):
+        return f'CPUProfile(intra_op_threads={self.intra_op_threads}, inter_op_threads={self.inter_op_threads}, num_workers={self.num_workers}, cv2_threads={self.cv2_threads}, pin={self.pin}, cores={len(self.cores)})'
+
+    @classmethod
+    def from_dict(cls, values, cores = None):
+        return cls(values['intra_op_threads'], values.get('inter_op_threads', 1), values.get('num_workers', 0), values.get('cv2_threads', 1), values.get('pin', False), cores)
+
+    def to_dict(self):
+        return {'intra_op_threads': self.intra_op_threads, 'inter_op_threads': self.inter_op_threads, 'num_workers': self.num_workers, 'cv2_threads': self.cv2_threads, 'pin': self.pin}
+
+    def main_cores(self):
+        '''
+        :return: cores of the training process, the first intra_op_threads cores
+        '''
+        return self.cores[:max(self.intra_op_threads, 1)]
+
+    def worker_cores(self):
+        '''
+        :return: cores of the workers, the ones after the training process's (all of them if there are none left)
+        '''
+        return self.cores[max(self.intra_op_threads, 1):] or self.cores
+
+    def apply(self):
+        '''
+        set the threads (and affinity) of this process, call once before the first torch op
+        :return: self
+        '''
+        torch.set_num_threads(self.intra_op_threads)
+        try:
+            torch.set_num_interop_threads(self.inter_op_threads)
+        except RuntimeError:
+            # can only be set before torch runs its first parallel op
+            print(f'inter-op threads already in use, keeping {torch.get_num_interop_threads()}')
+        cv2.setNumThreads(self.cv2_threads)
+        if self.pin and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.main_cores())
+        return self
+
+    def init_worker(self, worker_id):
+        '''
+        worker_init_fn of the DataLoaders, runs in every worker process when it starts
+        :param worker_id: id of the worker, 0 to num_workers - 1
+        '''
+        torch.set_num_threads(1)
+        cv2.setNumThreads(self.cv2_threads)
+        if self.pin and hasattr(os, 'sched_setaffinity'):
+            cores = self.worker_cores()
+            os.sched_setaffinity(0, {cores[worker_id % len(cores)]})
+
+    def loader_kwargs(self):
+        '''
+        :return: DataLoader arguments of the workers, ie: DataLoader(data, batch_size = 32, **profile.loader_kwargs())
+        '''
+        if self.num_workers == 0:
+            return {}
+        return {'num_workers': self.num_workers, 'worker_init_fn': self.init_worker, 'persistent_workers': True}
+
+
+def default_profile(cores = None):
+    '''
+    split used when the config has none for the core count: a DataLoader worker per 4 cores (none under 4 cores), the
+    rest for torch, OpenCV single threaded in the workers
+    :param cores: core ids, None for available_cores()
+    :return: CPUProfile
+    '''
+    cores = available_cores() if cores is None else list(cores)
+    num_workers = len(cores) // 4
+    return CPUProfile(max(len(cores) - num_workers, 1), inter_op_threads = 1, num_workers = num_workers, cv2_threads = 1, pin = False, cores = cores)
+
+
+def cpu_profile(config, cores = None):
+    '''
+    profile of the core count of this process from the "cpu" section of the experiment config
+    :param config: experiment config dict (LunarModules/utils.py load_experiment_config)
+    :param cores: core ids, None for available_cores()
+    :return: CPUProfile
+    '''
+    cores = available_cores() if cores is None else list(cores)
+    values = config.get('cpu', {}).get(str(len(cores)))
+    if values is None:
+        return default_profile(cores)
+    return CPUProfile.from_dict(values, cores)
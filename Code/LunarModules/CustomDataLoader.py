@@ -16,7 +16,8 @@ import random
 import cv2
 import copy
 from LunarModules.ImageProcessor import ImageProcessor
-from LunarModules.Plotter import Plotter
+from LunarModules.Augmentation import default_augmentation
+from LunarModules.ImagePyramid import resolve_folder
 import torch, gc
 from torch.utils.data import Dataset, DataLoader
 
@@ -24,7 +25,7 @@ class CustomDataLoader:
     '''
     Object to handle data generator.
     '''
-    def __init__(self, img_folder, mask_folder, batch_size, imsize, num_classes, split, first_n=None, log_file=None, augmentation=False):
+    def __init__(self, img_folder, mask_folder, batch_size, imsize, num_classes, split, first_n=None, log_file=None, augmentation=False, augmenter=None, encoded_masks='auto', pyramid_root=None):
         '''
         Params:
             self: instance of object
@@ -36,6 +37,13 @@ class CustomDataLoader:
             split (str): the dataset split, 'train', 'validation', 'test'
             first_n (int): optional, set to some int to choose only first n data points
             log_file (str): default is None to not have logging, otherwise, specify logging path ../filepath/log.log
+            augmentation (bool): augment each sample as it is loaded. Leave False when augmenting whole batches with
+                                 LunarModules.Augmentation.AugmentationCollate instead
+            augmenter (Augmentation): optional, augmentation to run, default is default_augmentation()
+            encoded_masks (bool or 'auto'): read the class index masks written by TrainTestSplit.encode_masks instead
+                                 of encoding the RGB masks. 'auto' uses them if they exist next to mask_folder
+            pyramid_root (str): optional, root of the ImagePyramid store (ie: Data/pyramid). If it has a level for imsize
+                                the pre-resized images and masks are read from there
         '''
         self.img_folder = img_folder
         self.mask_folder = mask_folder
@@ -45,6 +53,7 @@ class CustomDataLoader:
         self.num_classes = num_classes
         self.split = split
         self.augmentation = augmentation
+        self.augmenter = augmenter if augmenter is not None else default_augmentation()
         self.first_n = first_n
         self.log_file = log_file
 
@@ -60,6 +69,31 @@ class CustomDataLoader:
             self.images_list = sorted(self.images_list)[:self.first_n]
             self.masks_list= sorted(self.masks_list)[:self.first_n]
 
+        # read pre-resized files from the image pyramid if it has this imsize, file names are the same
+        img_level = resolve_folder(self.img_folder, self.imsize, pyramid_root)
+        mask_level = resolve_folder(self.mask_folder, self.imsize, pyramid_root)
+        if img_level != self.img_folder and mask_level != self.mask_folder:
+            self.img_read_folder, self.mask_read_folder = img_level, mask_level
+        else:
+            self.img_read_folder, self.mask_read_folder = self.img_folder, self.mask_folder
+            if pyramid_root is not None:
+                print(f'no {self.imsize} pyramid level for {self.img_folder}, resizing from the source images')
+
+        # class index masks from TrainTestSplit.encode_masks: a <mask_folder>_index folder or a packed array
+        mask_root = self.mask_read_folder.rstrip('/')
+        if encoded_masks == 'auto':
+            encoded_masks = os.path.exists(mask_root + '_index') or os.path.exists(mask_root + '_index.npy')
+        self.encoded_masks = encoded_masks
+        self.index_folder = mask_root + '_index'
+        self.packed_path = mask_root + '_index.npy' if os.path.exists(mask_root + '_index.npy') else None
+        self.packed_masks = None
+        if self.encoded_masks and self.packed_path is not None:
+            with open(mask_root + '_index.txt') as f:
+                self.packed_rows = {name: row for row, name in enumerate(f.read().splitlines())}
+        # class index -> one hot, unmatched pixels (255) get all zeros like ImageProcessor.encode_mask
+        self.one_hot_lut = np.zeros((256, self.num_classes), dtype=np.uint8)
+        self.one_hot_lut[np.arange(self.num_classes), np.arange(self.num_classes)] = 1
+
     def __len__(self):
         '''
         Params:
@@ -86,12 +120,18 @@ class CustomDataLoader:
         # Read an image from folder and resize
         # plt.imread() loads as (imsize, imsize, channels)
         # Original image and mask seems to be 480x720x3
-        img_loaded = plt.imread(self.img_folder+'/'+images)
-        img_loaded =  cv2.resize(img_loaded, (self.imsize, self.imsize))
+        img_loaded = plt.imread(self.img_read_folder+'/'+images)
+        if img_loaded.shape[:2] != (self.imsize, self.imsize):
+            img_loaded =  cv2.resize(img_loaded, (self.imsize, self.imsize))
 
         # Read corresponding mask from folder and resize
-        mask_loaded = plt.imread(self.mask_folder+'/'+masks)
-        mask_loaded = cv2.resize(mask_loaded, (self.imsize, self.imsize))
+        if self.encoded_masks:
+            mask_index = self.load_mask_index(masks)
+        else:
+            # nearest neighbour so the class colours aren't blended at the edges
+            mask_loaded = plt.imread(self.mask_read_folder+'/'+masks)
+            if mask_loaded.shape[:2] != (self.imsize, self.imsize):
+                mask_loaded = cv2.resize(mask_loaded, (self.imsize, self.imsize), interpolation=cv2.INTER_NEAREST)
 
         # plt.imread() Loads as value between 0 and 1, cv2.imread() loads values between 0-255
         # test= cv2.imread(self.img_folder+'/'+images)
@@ -103,17 +143,15 @@ class CustomDataLoader:
         # print(test.shape, test_mask.shape)
 
         img_mask_processor = ImageProcessor()
-        check_plotter = Plotter()
-
-        #Data Augmentation steps
-        if self.augmentation:
-            img_loaded, mask_loaded = img_mask_processor.data_augmentation(img_loaded, mask_loaded)
 
         #check_plotter.peek_images(sample_images=img_loaded,sample_masks=mask_loaded,file_name=f'current_test_2.png')
 
         #Pre-processing steps
         img_loaded = img_mask_processor.preprocessor_images(img_loaded)
-        mask_loaded = img_mask_processor.preprocessor_masks(mask_loaded)
+        if self.encoded_masks:
+            mask_loaded = np.take(self.one_hot_lut, mask_index, axis=0)
+        else:
+            mask_loaded = img_mask_processor.preprocessor_masks(mask_loaded)
 
         # Check and save images as plots
         # sample_mask = img_mask_processor.rescale(mask_loaded)
@@ -130,6 +168,32 @@ class CustomDataLoader:
         img_tensor = img_tensor.permute(2, 0, 1)
         mask_tensor = mask_tensor.permute(2, 0, 1)
 
+        #Data Augmentation steps, on the tensors so there is no PIL/uint8 round trip
+        if self.augmentation:
+            img_tensor, mask_tensor = self.augmenter(img_tensor, mask_tensor)
+
         plt.close('all')
         # returns as a tuple of tensors
         return img_tensor, mask_tensor
+
+    def load_mask_index(self, mask_name):
+        '''
+		Params:
+			self: instance of object
+			mask_name (str): file name of the RGB mask
+		Returns:
+			class index mask resized to imsize, nearest neighbour so classes don't get blended
+		'''
+        if self.packed_path is not None:
+            # opened lazily so each DataLoader worker memory maps the file itself
+            if self.packed_masks is None:
+                self.packed_masks = np.load(self.packed_path, mmap_mode='r')
+            mask_index = np.asarray(self.packed_masks[self.packed_rows[mask_name]])
+        elif os.path.exists(os.path.join(self.index_folder, mask_name)):
+            mask_index = cv2.imread(os.path.join(self.index_folder, mask_name), cv2.IMREAD_UNCHANGED)
+        else:
+            mask_index = np.load(os.path.join(self.index_folder, mask_name[:-4] + '.npy'))
+
+        if mask_index.shape[:2] != (self.imsize, self.imsize):
+            mask_index = cv2.resize(mask_index, (self.imsize, self.imsize), interpolation=cv2.INTER_NEAREST)
+        return mask_index
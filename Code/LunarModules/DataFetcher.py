@@ -0,0 +1,359 @@
+"""
+DataFetcher.py
+Resumable, checksum verified download of the dataset archives and parallel extraction into the Data/ layout.
+
+A source is either the Google Drive folder of the project (downloaded with gdown), an http(s) base URL, a file:// URL
+or a local directory holding the archives (ie: a mirror or a local file server for tests). Downloads are written to
+<name>.part and resumed from there (http Range requests), verified against the sha256/size of the manifest, and only
+then moved into place. Files that are already present and verified are not downloaded again. An archive with a
+sha256 in data_files.json (written with --pin from a known good copy) is checked against it, the first download too.
+An archive without one is trusted on first use: the checksum of its first download is recorded in fetch_state.json
+next to the archives and checked on every later run, the first download itself is not verified (zipfile still CRC
+checks every member). Data.zip is not pinned yet, so its first download is unverified until data_files.json is filled.
+
+Archives are extracted in parallel (one ZipFile handle per thread) straight into their final location, members that
+already exist with the right size are skipped, and every member is CRC checked by zipfile while it is read.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen, url2pathname
+
+DEFAULT_SOURCE = "https://drive.google.com/drive/folders/1UrBuQcoW8i6hzPzpzVWnRyfqVtR2VfoD?usp=sharing"
+# pinned manifest of the dataset archives, {'files': [{'name', 'sha256', 'size', 'root'}]}. root is the top folder of the
+# archive, its content is extracted into the data folder (which doesn't have to be named Data)
+PINNED_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_files.json')
+# gdown saves the Drive folder under its name
+DOWNLOAD_FOLDER = 'lunar_surfce_image_data'
+STATE_FILE = 'fetch_state.json'
+CHUNK_SIZE = 1 << 20
+
+
+def load_data_files(path = PINNED_FILES):
+    '''
+    :param path: pinned manifest
+    :return: list of {'name', 'sha256', 'size', 'root'}
+    '''
+    with open(path) as f:
+        return json.load(f)['files']
+
+
+def sha256sum(path, chunk_size = CHUNK_SIZE):
+    '''
+    :param path: file path
+    :return: hex sha256 of the file
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify(path, sha256 = None, size = None):
+    '''
+    check a file against its expected size and sha256 (size first, it is free)
+    :param path: file path
+    :param sha256: expected hex sha256, None to not check
+    :param size: expected size in bytes, None to not check
+    :return: True if the file exists and matches
+    '''
+    if not os.path.isfile(path):
+        return False
+    if size is not None and os.path.getsize(path) != size:
+        return False
+    if sha256 is not None and sha256sum(path) != sha256:
+        return False
+    return True
+
+
+def pin_files(archives, path = PINNED_FILES):
+    '''
+    pin the sha256/size of known good copies of the archives in the manifest, commit it so every download is checked
+    against them
+    :param archives: archive paths, matched to the manifest entries by file name (new names are added)
+    :param path: pinned manifest
+    :return: manifest entries
+    '''
+    files = load_data_files(path) if os.path.exists(path) else []
+    for archive in archives:
+        name = os.path.basename(archive)
+        entry = next((entry for entry in files if entry['name'] == name), None)
+        if entry is None:
+            entry = {'name': name}
+            files.append(entry)
+        entry.update({'sha256': sha256sum(archive), 'size': os.path.getsize(archive)})
+        print(f'pinned {name}: sha256={entry["sha256"]}, size={entry["size"]}')
+    with open(path, 'w') as f:
+        json.dump({'files': files}, f, indent = 2)
+        f.write('\n')
+    return files
+
+
+DATA_FILES = load_data_files()
+
+
+def is_gdrive_folder(source):
+    return source.startswith('http') and 'drive.google.com' in source
+
+
+def local_path(source):
+    '''
+    :param source: file:// URL or local directory
+    :return: local path, None if the source is remote
+    '''
+    parsed = urlparse(source)
+    if parsed.scheme == 'file':
+        return url2pathname(parsed.path)
+    if parsed.scheme in ('http', 'https'):
+        return None
+    return source
+
+
+def resolve(source, name):
+    '''
+    location of a file in a source
+    :param source: http(s) base URL, file:// URL or local directory
+    :param name: file name in the source
+    :return: URL or local path
+    '''
+    path = local_path(source)
+    if path is not None:
+        return os.path.join(path, name)
+    return source.rstrip('/') + '/' + name
+
+
+def _download(src, part, chunk_size = CHUNK_SIZE, timeout = 60):
+    '''
+    append src to part, starting at the size part already has
+    :param src: URL or local path
+    :param part: partial file to append to
+    :return: none
+    '''
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+
+    path = local_path(src)
+    if path is not None:
+        with open(path, 'rb') as f_src, open(part, 'ab') as f_dst:
+            f_src.seek(offset)
+            shutil.copyfileobj(f_src, f_dst, chunk_size)
+        return
+
+    headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+    try:
+        response = urlopen(Request(src, headers = headers), timeout = timeout)
+    except HTTPError as e:
+        if e.code == 416:
+            # the range starts at the end of the file, part is already complete
+            return
+        raise
+    with response:
+        # a server that ignores Range sends the whole file again
+        mode = 'ab' if offset > 0 and response.status == 206 else 'wb'
+        if offset > 0 and mode == 'wb':
+            print(f'{src} does not support resuming, downloading from the start')
+        with open(part, mode) as f_dst:
+            shutil.copyfileobj(response, f_dst, chunk_size)
+
+
+def fetch_file(src, dst, sha256 = None, size = None, retries = 3, timeout = 60):
+    '''
+    download a file unless it is already there and verified, resuming an interrupted download
+    :param src: URL or local path
+    :param dst: destination path
+    :param sha256: expected hex sha256, None to not check
+    :param size: expected size in bytes, None to not check
+    :param retries: attempts, each one resumes where the last one stopped
+    :param timeout: socket timeout in seconds
+    :return: True if the file was downloaded, False if it was already present
+    '''
+    if verify(dst, sha256, size):
+        return False
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok = True)
+    part = dst + '.part'
+
+    for attempt in range(1, retries + 1):
+        try:
+            _download(src, part, timeout = timeout)
+            break
+        except (URLError, OSError) as e:
+            print(f'download of {src} failed (attempt {attempt}/{retries}): {e}')
+            if attempt == retries:
+                raise
+
+    if not verify(part, sha256, size):
+        os.remove(part)
+        raise ValueError(f'{src} failed verification (expected sha256={sha256}, size={size}), the partial file was removed')
+    os.replace(part, dst)
+    return True
+
+
+def _safe_target(dest, member):
+    '''
+    extraction path of a zip member, refusing members that would land outside dest
+    '''
+    target = os.path.realpath(os.path.join(dest, member))
+    if os.path.commonpath([target, os.path.realpath(dest)]) != os.path.realpath(dest):
+        raise ValueError(f'unsafe path in archive: {member}')
+    return target
+
+
+def _member_path(name, root = None):
+    '''
+    :param name: member path in the archive
+    :param root: top folder of the archive to strip, None to keep the path
+    :return: path of the member relative to the extraction folder, None if it is outside root
+    '''
+    if root is None:
+        return name
+    prefix = root.strip('/') + '/'
+    return name[len(prefix):] if name.startswith(prefix) else None
+
+
+def _extract_members(zip_path, members, dest, chunk_size = CHUNK_SIZE):
+    '''
+    extract some members with a ZipFile handle of this thread, each member is written to .part and moved into place
+    so an interrupted extraction never leaves a truncated file
+    :param members: list of (ZipInfo, path relative to dest)
+    :return: number of members extracted
+    '''
+    with zipfile.ZipFile(zip_path) as archive:
+        for info, name in members:
+            target = _safe_target(dest, name)
+            os.makedirs(os.path.dirname(target), exist_ok = True)
+            with archive.open(info) as f_src, open(target + '.part', 'wb') as f_dst:
+                shutil.copyfileobj(f_src, f_dst, chunk_size)
+            os.replace(target + '.part', target)
+    return len(members)
+
+
+def extract_zip(zip_path, dest, workers = 8, overwrite = False, root = None):
+    '''
+    extract a zip in parallel, skipping members that already exist with the right size
+    :param zip_path: archive
+    :param dest: folder the archive's paths are relative to, ie: the repo root for Data.zip (Data/images/...), or the
+                 folder to extract root into
+    :param workers: extraction threads (zlib releases the GIL)
+    :param overwrite: extract every member even if it exists
+    :param root: top folder of the archive to extract into dest, ie: 'Data' to extract Data/images/... to
+                 dest/images/..., members outside it are skipped. None to extract the archive's paths as they are
+    :return: number of members extracted, number skipped
+    '''
+    with zipfile.ZipFile(zip_path) as archive:
+        members = [(info, _member_path(info.filename, root)) for info in archive.infolist() if not info.is_dir()]
+    members = [(info, name) for info, name in members if name]
+
+    todo = []
+    for info, name in members:
+        target = _safe_target(dest, name)
+        if overwrite or not os.path.isfile(target) or os.path.getsize(target) != info.file_size:
+            todo.append((info, name))
+
+    # big members first, then round robin so every thread gets a similar amount of bytes
+    todo.sort(key = lambda member: member[0].file_size, reverse = True)
+    n_workers = max(1, min(workers, len(todo)))
+    batches = [todo[i::n_workers] for i in range(n_workers)]
+    with ThreadPoolExecutor(max_workers = n_workers) as pool:
+        extracted = sum(pool.map(lambda batch: _extract_members(zip_path, batch, dest), batches))
+    return extracted, len(members) - len(todo)
+
+
+def load_state(download_dir):
+    path = os.path.join(download_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(download_dir, state):
+    with open(os.path.join(download_dir, STATE_FILE), 'w') as f:
+        json.dump(state, f, indent = 2)
+
+
+def download_gdrive_folder(source, download_dir):
+    '''
+    download the Drive folder into download_dir (gdown can not resume folders, files that are kept are only replaced
+    if they fail verification)
+    '''
+    import gdown
+    gdown.download_folder(source, output = download_dir, quiet = True, use_cookies = False)
+
+
+def fetch_dataset(BASE_PATH, source = DEFAULT_SOURCE, files = DATA_FILES, workers = 8, keep_archives = True, DATA_PATH = None):
+    '''
+    main function, makes sure every archive of the dataset is downloaded, verified and extracted
+    :param BASE_PATH: repo root, the archives are downloaded to BASE_PATH/lunar_surfce_image_data
+    :param source: Google Drive folder URL, http(s) base URL, file:// URL or local directory holding the archives
+    :param files: manifest, list of {'name', 'sha256', 'size', 'root'}, archives with a root are extracted into
+                  DATA_PATH, the others into BASE_PATH
+    :param DATA_PATH: data folder, None for BASE_PATH/Data
+    :param workers: extraction threads
+    :param keep_archives: keep the archives after extraction (so later runs can verify and skip them)
+    :return: none
+    '''
+    DATA_PATH = os.path.join(BASE_PATH, 'Data') if DATA_PATH is None else DATA_PATH
+    download_dir = os.path.join(BASE_PATH, DOWNLOAD_FOLDER)
+    os.makedirs(download_dir, exist_ok = True)
+    state = load_state(download_dir)
+
+    for entry in files:
+        name = entry['name']
+        path = os.path.join(download_dir, name)
+        pinned = entry.get('sha256') is not None
+        if pinned:
+            sha256, size = entry['sha256'], entry.get('size')
+        else:
+            # trust on first use: the checksum of the first download is recorded and checked from then on
+            if name in [item['name'] for item in DATA_FILES]:
+                print(f'WARNING: {name} has no pinned checksum in {PINNED_FILES}, its first download is not verified. Pin it with --pin <path to a known good {name}>')
+            known = state.get(name, {})
+            sha256 = known.get('sha256')
+            size = entry.get('size') or known.get('size')
+
+        if verify(path, sha256, size):
+            # without a known checksum an existing archive is trusted, zipfile still CRC checks every member
+            print(f'{name} already downloaded' + (' and verified' if sha256 is not None or size is not None else ''))
+        elif is_gdrive_folder(source):
+            print(f'Downloading {name} from Google Drive...')
+            download_gdrive_folder(source, download_dir)
+            if not verify(path, sha256, size):
+                raise ValueError(f'{name} from {source} failed verification (expected sha256={sha256}, size={size})')
+        else:
+            print(f'Downloading {name} from {source}...')
+            fetch_file(resolve(source, name), path, sha256, size)
+
+        if not pinned and name not in state:
+            state[name] = {'sha256': sha256sum(path), 'size': os.path.getsize(path)}
+            save_state(download_dir, state)
+
+        if name.endswith('.zip'):
+            print(f'Extracting {name}...')
+            root = entry.get('root')
+            extracted, skipped = extract_zip(path, BASE_PATH if root is None else DATA_PATH, workers = workers, root = root)
+            print(f'{extracted} files extracted, {skipped} already present')
+            if not keep_archives:
+                os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base_path', default = '..', type = str, required = False)
+    parser.add_argument('--data_path', default = None, type = str, required = False, help = 'default <base_path>/Data')
+    parser.add_argument('--source', default = DEFAULT_SOURCE, type = str, required = False)
+    parser.add_argument('--workers', default = 8, type = int, required = False)
+    parser.add_argument('--pin', nargs = '+', default = None, required = False, help = 'pin the checksums of these known good archives in data_files.json instead of fetching')
+    args = parser.parse_args()
+    if args.pin is not None:
+        pin_files(args.pin)
+        raise SystemExit
+    fetch_dataset(args.base_path, source = args.source, workers = args.workers, DATA_PATH = args.data_path)
@@ -0,0 +1,176 @@
+"""
+Distributed.py
+Helpers for multi-process DistributedDataParallel training on CPU nodes (gloo backend).
+
+Launch with torchrun, which sets RANK/WORLD_SIZE/MASTER_ADDR/MASTER_PORT for every process, ie:
+    torchrun --nproc_per_node 4 main.py --method train --distributed
+or across machines:
+    torchrun --nnodes 2 --node_rank 0 --nproc_per_node 8 --master_addr 10.0.0.1 --master_port 29500 main.py ...
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import os
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
+
+
+def setup_distributed(backend = 'gloo'):
+    '''
+    Initialize the default process group from the torchrun environment variables
+    :param backend: torch.distributed backend, gloo works on CPU
+    :return: (rank, world_size)
+    '''
+    if not dist.is_available():
+        print('torch.distributed is not available, running single process...')
+        return 0, 1
+    if 'RANK' not in os.environ or 'WORLD_SIZE' not in os.environ:
+        print('RANK/WORLD_SIZE not set, launch with torchrun to run distributed. Running single process...')
+        return 0, 1
+    if not dist.is_initialized():
+        dist.init_process_group(backend = backend)
+    rank, world_size = dist.get_rank(), dist.get_world_size()
+    print(f'Process group initialized: rank {rank} of {world_size} ({backend})')
+    return rank, world_size
+
+
+def cleanup_distributed():
+    '''
+    Tear down the default process group if there is one
+    :return:
+    '''
+    if is_distributed():
+        dist.barrier()
+        dist.destroy_process_group()
+
+
+def is_distributed():
+    '''
+    :return: True if running inside an initialized process group
+    '''
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    '''
+    :return: rank of this process, 0 when not distributed
+    '''
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    '''
+    :return: number of processes, 1 when not distributed
+    '''
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    '''
+    :return: True on rank 0 (or when not distributed), use to guard saving/printing/plotting
+    '''
+    return get_rank() == 0
+
+
+def barrier():
+    '''
+    Wait for every process, no-op when not distributed
+    :return:
+    '''
+    if is_distributed():
+        dist.barrier()
+
+
+def all_reduce_mean(value):
+    '''
+    Average a metric across processes. Returns the value unchanged when not distributed.
+    :param value: python number or tensor
+    :return: averaged value of the same type
+    '''
+    if not is_distributed():
+        return value
+    is_tensor = torch.is_tensor(value)
+    t = value.detach().clone().double() if is_tensor else torch.tensor(float(value), dtype = torch.float64)
+    dist.all_reduce(t, op = dist.ReduceOp.SUM)
+    t /= dist.get_world_size()
+    return t.to(value.dtype) if is_tensor else t.item()
+
+
+def all_reduce_sum(tensor):
+    '''
+    Sum a tensor across processes, ie: counts that are only meaningful in total. Returns it unchanged when not distributed.
+    :param tensor: tensor, on cpu for gloo
+    :return: summed tensor
+    '''
+    if not is_distributed():
+        return tensor
+    t = tensor.detach().clone()
+    dist.all_reduce(t, op = dist.ReduceOp.SUM)
+    return t
+
+
+def any_rank(flag):
+    '''
+    True if the flag is set on any process, so decisions like stopping early are taken by every rank together
+    :param flag: bool for this process
+    :return: bool agreed on by every process
+    '''
+    if not is_distributed():
+        return flag
+    t = torch.tensor(int(bool(flag)))
+    dist.all_reduce(t, op = dist.ReduceOp.MAX)
+    return bool(t.item())
+
+
+def wrap_model(model):
+    '''
+    Wrap a model in DistributedDataParallel when running distributed, gradients are all-reduced on backward
+    :param model: model already on its device
+    :return: DDP wrapped model or the model itself
+    '''
+    if not is_distributed() or isinstance(model, DistributedDataParallel):
+        return model
+    return DistributedDataParallel(model)
+
+
+def unwrap_model(model):
+    '''
+    :param model: model, possibly wrapped in DistributedDataParallel
+    :return: underlying model, use for state_dict so saved keys don't get a 'module.' prefix
+    '''
+    return model.module if isinstance(model, DistributedDataParallel) else model
+
+
+def make_data_loader(dataset, batch_size, shuffle, sampler = None, **kwargs):
+    '''
+    Build a DataLoader, sharding the dataset over processes with a DistributedSampler when running distributed
+    :param dataset: dataset, ie: CustomDataLoader
+    :param batch_size: per-process batch size
+    :param shuffle: shuffle the data
+    :param sampler: optional sampler that shards its samples over processes itself, ie: Sampling.BalancedSampler,
+                    replaces shuffle and the DistributedSampler
+    :param kwargs: extra DataLoader arguments
+    :return: DataLoader
+    '''
+    if sampler is not None:
+        return DataLoader(dataset, batch_size = batch_size, sampler = sampler, **kwargs)
+    if is_distributed():
+        sampler = DistributedSampler(dataset, num_replicas = get_world_size(), rank = get_rank(), shuffle = shuffle)
+        return DataLoader(dataset, batch_size = batch_size, sampler = sampler, **kwargs)
+    return DataLoader(dataset, batch_size = batch_size, shuffle = shuffle, **kwargs)
+
+
+def set_sampler_epoch(data_loader, epoch):
+    '''
+    Reseed the DistributedSampler (or any sampler with a set_epoch, ie: Sampling.BalancedSampler) so every epoch gets
+    a different shuffle, no-op otherwise
+    :param data_loader: DataLoader
+    :param epoch: current epoch
+    :return:
+    '''
+    sampler = getattr(data_loader, 'sampler', None)
+    if hasattr(sampler, 'set_epoch'):
+        sampler.set_epoch(epoch)
@@ -7,17 +7,56 @@ created: 11/12/2022
 """
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-import random
-import cv2
 import copy
-import torchvision.transforms as T
-import torchvision.transforms.functional as TF
-import torch
-from PIL import Image
-from matplotlib import cm
+
+# mask colour of each class, the row order is the channel order of one hot encoded masks
+CLASS_MAP = pd.DataFrame({'name':['Sky', 'Big Rocks', 'Small Rocks', 'Unlabeled'],
+                          'r':[255,0,0,0],
+                          'g':[0,0,255,0],
+                          'b':[0,255,0,0]})
+
+# label of pixels that match no class in class index masks
+IGNORE_INDEX = 255
+
+_mask_luts = {}
+
+
+def _mask_luts_for(class_map):
+    """
+    Lookup tables from a packed per-pixel byte to the class index / one hot vector, see ImageProcessor.encode_mask.
+    The byte holds an 'on' bit (channel == 1 after max pixel normalization) and a 'non zero' bit per RGB channel, a
+    pixel belongs to a class when every non zero channel is on and the on bits spell the class colour.
+
+    Parameters:
+        class_map: class dataframe with r, g, b columns of 0 or 255
+
+    Return:
+        (index_lut, one_hot_lut) or None if the class colours can't be encoded as on/off bits
+    """
+    key = tuple(map(tuple, class_map[['r', 'g', 'b']].values.tolist()))
+    if key in _mask_luts:
+        return _mask_luts[key]
+
+    colour_bits = {}
+    for class_index, colour in enumerate(key):
+        if any(c not in (0, 255) for c in colour):
+            return None
+        bits = (colour[0] == 255) * 4 + (colour[1] == 255) * 2 + (colour[2] == 255)
+        if bits in colour_bits:
+            return None
+        colour_bits[bits] = class_index
+
+    index_lut = np.full(256, IGNORE_INDEX, dtype=np.uint8)
+    for byte in range(256):
+        on_bits, nonzero_bits = (byte >> 5) & 7, (byte >> 2) & 7
+        if on_bits == nonzero_bits and on_bits in colour_bits:
+            index_lut[byte] = colour_bits[on_bits]
+    one_hot_lut = np.zeros((256, len(key)), dtype=np.uint8)
+    matched = index_lut != IGNORE_INDEX
+    one_hot_lut[np.where(matched)[0], index_lut[matched]] = 1
+
+    _mask_luts[key] = (index_lut, one_hot_lut)
+    return _mask_luts[key]
 
 
 class ImageProcessor:
@@ -137,10 +176,7 @@ class ImageProcessor:
         """
 
         if class_map is None:
-            class_map = pd.DataFrame({'name':['Sky', 'Big Rocks', 'Small Rocks', 'Unlabeled'], 
-                                    'r':[255,0,0,0], 
-                                    'g':[0,0,255,0],
-                                    'b':[0,255,0,0]})
+            class_map = CLASS_MAP
 
         img_copy = copy.deepcopy(img)
         frame = np.zeros((img.shape[0], img.shape[1], len(class_map))).astype('int')
@@ -168,6 +204,49 @@ class ImageProcessor:
 
         return frame
 
+    def encode_mask(self, mask, threshold=0.8, class_map=None, output='one_hot'):
+        """
+        Function to normalize and encode a mask in one go, same result as mask_max_pixel_normalize followed by
+        one_hot_encode (what preprocessor_masks did) without copying the mask per channel or per class.
+
+        Per channel, a pixel is 'on' if it is above threshold * channel max (normalized to 1) and 'off' if it is 0.
+        The on/non zero bits of the 3 channels are packed into one byte per pixel (on bits 7-5, non zero bits 4-2) and
+        mapped to the class by a lookup table. Pixels with a channel that is neither on nor off (ie: blended edges
+        after resizing) match no class.
+
+        Parameters:
+            mask: mask image in numpy (x,y,3) or (x,y,4), values 0-1 as loaded by plt.imread
+            threshold: threshold multiplier of mask_max_pixel_normalize
+            class_map: class_df, default CLASS_MAP
+            output: 'one_hot' for (x,y,n_classes) uint8 with all zeros where no class matches, or 'index' for (x,y)
+                    uint8 class indexes with IGNORE_INDEX where no class matches
+
+        Return:
+            encoded mask
+        """
+        if class_map is None:
+            class_map = CLASS_MAP
+        luts = _mask_luts_for(class_map)
+
+        if luts is None:
+            # class colours aren't pure 0/255 channels, use the per class comparison
+            frame = self.one_hot_encode(self.mask_max_pixel_normalize(mask, threshold), class_map)
+            if output == 'index':
+                return np.where(frame.any(axis=2), frame.argmax(axis=2), IGNORE_INDEX).astype(np.uint8)
+            return frame.astype(np.uint8)
+
+        # per channel 2D passes over the strided mask, building the byte in place
+        packed = np.zeros(mask.shape[:2], dtype=np.uint8)
+        for c in range(3):
+            channel = mask[::,::,c]
+            packed |= (channel > channel.max() * threshold).view(np.uint8) << (7 - c)
+            packed |= (channel != 0).view(np.uint8) << (4 - c)
+
+        index_lut, one_hot_lut = luts
+        if output == 'index':
+            return np.take(index_lut, packed)
+        return np.take(one_hot_lut, packed, axis=0)
+
     def reverse_one_hot_encode(self, img, class_map=None):
         """
         Function to reverse one hot encode 4 class channel to 3 channel RGB mask
@@ -237,37 +316,28 @@ class ImageProcessor:
             mask: ground truth mask in numpy (x,y,3)
         
         Returns:
-            
+            img, msk: augmented image and mask in numpy (x,y,3)
 
         Image Only:
             - Color jitters: hue/contrast/brightness
 
         Both Image and Mask:
             - Random horizontal and vertical flips
+
+        Runs the tensor augmentation in LunarModules.Augmentation on a single sample, CustomDataLoader applies it
+        to tensors directly (or to whole batches via AugmentationCollate)
         '''
-        pil_image = Image.fromarray((image * 255).astype(np.uint8))
-        pil_mask = Image.fromarray((mask * 255).astype(np.uint8))
-
-        # 1. Image and Mask:
-        # 1A. VerticalFlip
-        if random.random() > 0.2:
-            pil_image = TF.vflip(pil_image)
-            pil_mask  = TF.vflip(pil_mask)
-        
-        # 1B. Horitonal Flifp
-        if random.random() > 0.2:
-            pil_image = TF.hflip(pil_image)
-            pil_mask  = TF.hflip(pil_mask)
+        # torch is only imported here, so the mask/image functions don't pay its import time
+        import torch
+        from LunarModules.Augmentation import default_augmentation
 
-        # 2. Image Only
-        transform_img = RandomChoice([
-                    T.ColorJitter(brightness=0.5, contrast=0.5, saturation=0.5, hue=0.5)
-                ])
+        image_tensor = torch.from_numpy(np.ascontiguousarray(image, dtype=np.float32)).permute(2, 0, 1)
+        mask_tensor = torch.from_numpy(np.ascontiguousarray(mask, dtype=np.float32)).permute(2, 0, 1)
 
-        pil_image, = transform_img([pil_image,])
+        image_tensor, mask_tensor = default_augmentation()(image_tensor, mask_tensor)
 
-        img = np.asarray(pil_image)/255
-        msk = np.asarray(pil_mask)/255
+        img = image_tensor.permute(1, 2, 0).numpy()
+        msk = mask_tensor.permute(1, 2, 0).numpy()
 
         return img, msk
 
@@ -302,17 +372,6 @@ class ImageProcessor:
         final_img: final image to return from preprocessor after going through 
                 all processing steps.
         """
-        image = self.mask_max_pixel_normalize(image)
-        image = self.one_hot_encode(image, class_map)
-        final_img = self.rescale(image)
+        final_img = self.encode_mask(image, class_map=class_map)
 
         return final_img
-
-class RandomChoice(torch.nn.Module):
-    def __init__(self, transforms):
-       super().__init__()
-       self.transforms = transforms
-
-    def __call__(self, imgs):
-        t = random.choice(self.transforms)
-        return [t(img) for img in imgs]
\ No newline at end of file
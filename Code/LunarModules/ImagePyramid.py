@@ -0,0 +1,139 @@
+"""
+ImagePyramid.py
+Resize-once store of the split images and masks at several resolutions, so data loaders and plots at a given imsize
+read pre-resized files instead of decoding and resizing the native 480x720 images every time.
+
+Layout: Data/pyramid/<size>/<split>/<kind>/<same file names>, ie: Data/pyramid/256/train/render/render0001.png.
+'native' is the source folder itself. Renders are resized bilinearly (like the data loader did), masks and class index
+masks with nearest neighbour so classes aren't blended.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+PYRAMID_SIZES = [128, 256, 512]
+# folders under Data/images to resize, and whether they hold masks
+PYRAMID_FOLDERS = [
+    ('train/render', False), ('train/mask', True), ('train/mask_index', True),
+    ('val/render', False), ('val/mask', True), ('val/mask_index', True),
+    ('test/render', False), ('test/mask', True), ('test/mask_index', True),
+    ('real/real_img', False), ('real/real_mask', True), ('real/real_mask_index', True),
+]
+
+
+def level_folder(pyramid_root, folder, size):
+    '''
+    folder of a pyramid level that mirrors a source folder
+    :param pyramid_root: root of the pyramid, ie: Data/pyramid
+    :param folder: source folder, ie: Data/images/train/render
+    :param size: image size of the level
+    :return: path, ie: Data/pyramid/256/train/render
+    '''
+    split, kind = folder.rstrip('/').split('/')[-2:]
+    return os.path.join(pyramid_root, str(size), split, kind)
+
+
+def resolve_folder(folder, size, pyramid_root = None):
+    '''
+    the pyramid level of a folder at a size if it was built, otherwise the folder itself
+    :param folder: source folder (a trailing / is kept)
+    :param size: image size wanted, None for native
+    :param pyramid_root: root of the pyramid, None to not use one
+    :return: folder to read from
+    '''
+    if pyramid_root is None or size is None or size == 'native':
+        return folder
+    level = level_folder(pyramid_root, folder, size)
+    if not os.path.exists(level):
+        return folder
+    return level + '/' if folder.endswith('/') else level
+
+
+def resize_file(src, dst, size, is_mask):
+    '''
+    resize one image/mask file to size x size and write it
+    :return: none
+    '''
+    img = cv2.imread(src, cv2.IMREAD_UNCHANGED)
+    interpolation = cv2.INTER_NEAREST if is_mask else cv2.INTER_LINEAR
+    cv2.imwrite(dst, cv2.resize(img, (size, size), interpolation = interpolation))
+
+
+def build_level(images_root, pyramid_root, size, overwrite = False, workers = 8):
+    '''
+    write one pyramid level for every folder in PYRAMID_FOLDERS that exists
+    :param images_root: Data/images
+    :param pyramid_root: Data/pyramid
+    :param size: image size of the level
+    :param overwrite: rewrite files that already exist
+    :param workers: resize threads (cv2 releases the GIL)
+    :return: number of files written
+    '''
+    jobs = []
+    for rel, is_mask in PYRAMID_FOLDERS:
+        src_folder = os.path.join(images_root, rel)
+        dst_folder = level_folder(pyramid_root, src_folder, size)
+
+        packed = src_folder + '.npy'
+        if is_mask and os.path.exists(packed):
+            # packed class index masks from TrainTestSplit.encode_masks
+            if overwrite or not os.path.exists(dst_folder + '.npy'):
+                os.makedirs(os.path.dirname(dst_folder), exist_ok = True)
+                masks = np.load(packed, mmap_mode = 'r')
+                np.save(dst_folder + '.npy', np.stack([cv2.resize(np.asarray(m), (size, size), interpolation = cv2.INTER_NEAREST) for m in masks]))
+                with open(src_folder + '.txt') as f_src, open(dst_folder + '.txt', 'w') as f_dst:
+                    f_dst.write(f_src.read())
+
+        if not os.path.isdir(src_folder):
+            continue
+        os.makedirs(dst_folder, exist_ok = True)
+        for file in os.listdir(src_folder):
+            if not file.endswith('.png'):
+                continue
+            dst = os.path.join(dst_folder, file)
+            if overwrite or not os.path.exists(dst):
+                jobs.append((os.path.join(src_folder, file), dst, size, is_mask))
+
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        list(pool.map(lambda job: resize_file(*job), jobs))
+    return len(jobs)
+
+
+def build_pyramid(DATA_PATH, sizes = PYRAMID_SIZES, overwrite = False, workers = 8, PYRAMID_PATH = None):
+    '''
+    main function, builds Data/pyramid/<size>/... for every size from the split folders in Data/images
+    :param DATA_PATH: location of data
+    :param sizes: image sizes, 'native' entries are skipped (the source folders are the native level)
+    :param overwrite: rewrite files that already exist
+    :param workers: resize threads
+    :param PYRAMID_PATH: pyramid root, None for DATA_PATH/pyramid (ProjectPaths.pyramid)
+    :return: pyramid root
+    '''
+    images_root = os.path.join(DATA_PATH, 'images')
+    pyramid_root = os.path.join(DATA_PATH, 'pyramid') if PYRAMID_PATH is None else PYRAMID_PATH
+    for size in sizes:
+        if size == 'native':
+            continue
+        n = build_level(images_root, pyramid_root, int(size), overwrite = overwrite, workers = workers)
+        print(f'pyramid level {size}: {n} files written')
+    return pyramid_root
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base_path', default = None, type = str, required = False, help = 'project root, default the root of this repo')
+    parser.add_argument('--data_path', default = None, type = str, required = False, help = 'data folder, default <base_path>/Data')
+    parser.add_argument('--sizes', default = ','.join(str(s) for s in PYRAMID_SIZES), type = str, required = False)
+    parser.add_argument('--overwrite', action = 'store_true', required = False)
+    parser.add_argument('--workers', default = 8, type = int, required = False)
+    args = parser.parse_args()
+    from LunarModules.Paths import ProjectPaths
+    paths = ProjectPaths(args.base_path, data = args.data_path)
+    print(f'BUILDING IMAGE PYRAMID sizes={args.sizes} in {paths.pyramid}')
+    build_pyramid(paths.data, sizes = [s if s == 'native' else int(s) for s in args.sizes.split(',')], overwrite = args.overwrite, workers = args.workers, PYRAMID_PATH = paths.pyramid)
@@ -0,0 +1,191 @@
+"""
+Inference.py
+Loading a trained model by name and predicting class masks of new images, outside of the training wrappers (Model /
+Pretrained_Model need loaders, a loss and an optimizer, prediction only needs the network).
+
+Model names are the ones the modeling loop saves, <architecture>_<data source>, ie: RESNET18_ground. Checkpoints come
+from the model cache of a ProjectPaths and are downloaded from the model source if they aren't cached (ModelStore).
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import os
+
+import cv2
+import numpy as np
+import torch
+
+from LunarModules.ImageProcessor import ImageProcessor, CLASS_MAP
+from LunarModules.ModelStore import ModelStore, DEFAULT_MODEL_SOURCE
+from LunarModules.Paths import ProjectPaths
+
+# architecture of a model name -> smp encoder, None for UNet_scratch
+ARCHITECTURES = {
+    'Unet_scratch': None,
+    'VGG11_BN': 'vgg11_bn',
+    'RESNET18': 'resnet18',
+    'mobilenetv3_large_100': 'timm-mobilenetv3_large_100',
+}
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def architecture(name):
+    '''
+    :param name: model name, ie: RESNET18_ground
+    :return: architecture key of ARCHITECTURES, ie: RESNET18
+    '''
+    for key in ARCHITECTURES:
+        if name == key or name.startswith(key + '_'):
+            return key
+    raise ValueError(f'unknown model {name}, expected one of {list(ARCHITECTURES.keys())} followed by _<data source>')
+
+
+def build_network(name, imsize = 256):
+    '''
+    network of a model name without weights
+    :param name: model name
+    :param imsize: input size (UNet_scratch interpolates its output to it)
+    :return: torch module
+    '''
+    encoder = ARCHITECTURES[architecture(name)]
+    if encoder is None:
+        from LunarModules.Model import UNet_scratch
+        return UNet_scratch(verbose = False, out_sz = (imsize, imsize))
+    import segmentation_models_pytorch as smp
+    return smp.Unet(encoder_name = encoder, encoder_weights = None, classes = 4, activation = None)
+
+
+def load_network(name, paths = None, device = None, imsize = 256, model_source = DEFAULT_MODEL_SOURCE):
+    '''
+    network of a model with the weights of its latest checkpoint, in eval mode
+    :param name: model name, ie: RESNET18_ground
+    :param paths: ProjectPaths of the model cache, None for the project this file is in
+    :param device: pytorch device, None for cuda if available
+    :param imsize: input size
+    :param model_source: where to download the checkpoint from if it isn't cached, None to only use the cache
+    :return: network, epoch of the checkpoint
+    '''
+    paths = ProjectPaths() if paths is None else paths
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu") if device is None else device
+    model_file, epoch = ModelStore(paths.model_cache, source = model_source).fetch(name)
+    if model_file is None:
+        raise FileNotFoundError(f'no checkpoint of {name} in {paths.model_cache} or the model source')
+    network = build_network(name, imsize)
+    network.load_state_dict(torch.load(model_file, map_location = device))
+    return network.to(device).eval(), epoch
+
+
+def read_image(path):
+    '''
+    read an image like plt.imread reads the dataset's 8 bit PNGs, with cv2 (which releases the GIL while decoding)
+    :param path: image path
+    :return: RGB image (h, w, 3) float32 between 0 and 1
+    '''
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f'could not read {path}')
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB).astype(np.float32) / 255
+
+
+def preprocess(img, imsize = 256):
+    '''
+    image as the data loader feeds it to the models
+    :param img: image in numpy (x,y,3) or (x,y,4) as loaded by plt.imread
+    :param imsize: input size
+    :return: (3, imsize, imsize) float32 array
+    '''
+    img = img[:, :, :3]
+    if img.shape[:2] != (imsize, imsize):
+        img = cv2.resize(img, (imsize, imsize))
+    img = ImageProcessor().preprocessor_images(img)
+    return np.ascontiguousarray(img.transpose(2, 0, 1), dtype = np.float32)
+
+
+def predict_batch(network, batch, device = None):
+    '''
+    :param network: network from load_network
+    :param batch: (n, 3, h, w) float32 array or tensor
+    :param device: pytorch device, None for the device of the network
+    :return: (n, h, w) uint8 class index masks, indices in the order of CLASS_MAP
+    '''
+    device = next(network.parameters()).device if device is None else device
+    with torch.no_grad():
+        logits = network(torch.as_tensor(batch).to(device))
+    return logits.argmax(dim = 1).to(torch.uint8).cpu().numpy()
+
+
+def colour_mask(index_mask):
+    '''
+    :param index_mask: (h, w) class index mask
+    :return: (h, w, 3) uint8 RGB mask in the class colours of the dataset
+    '''
+    colours = CLASS_MAP[['r', 'g', 'b']].to_numpy(dtype = np.uint8)
+    return colours[index_mask]
+
+
+def write_mask(path, mask, size = None, fmt = 'rgb'):
+    '''
+    :param path: png path
+    :param mask: (h, w) class index mask
+    :param size: (height, width) to resize the mask to (nearest neighbour), None to keep its size
+    :param fmt: 'rgb' for the mask in the class colours, 'index' for a single channel png of class indices
+    :return: none
+    '''
+    if size is not None and mask.shape[:2] != tuple(size):
+        mask = cv2.resize(mask, (size[1], size[0]), interpolation = cv2.INTER_NEAREST)
+    if fmt == 'rgb':
+        mask = cv2.cvtColor(colour_mask(mask), cv2.COLOR_RGB2BGR)
+    cv2.imwrite(path, mask)
+
+
+def list_images(input_path):
+    '''
+    :param input_path: image file or folder of images
+    :return: sorted image paths
+    '''
+    if os.path.isdir(input_path):
+        return sorted(os.path.join(input_path, x) for x in os.listdir(input_path) if x.lower().endswith(IMAGE_EXTENSIONS))
+    return [input_path]
+
+
+def mask_path(output_path, file):
+    return os.path.join(output_path, os.path.splitext(os.path.basename(file))[0] + '.png')
+
+
+def predict_folder(name, input_path, output_path, paths = None, imsize = 256, batch_size = 8, device = None, model_source = DEFAULT_MODEL_SOURCE):
+    '''
+    predict the mask of every image in a folder (or of one image) and write it as an RGB mask png, resized back to the
+    size of the image
+    :param name: model name, ie: RESNET18_ground
+    :param input_path: image file or folder of images
+    :param output_path: folder the masks are written to, with the file names of the images
+    :param paths: ProjectPaths of the model cache
+    :param imsize: input size of the model
+    :param batch_size: images per forward pass
+    :return: list of mask paths written
+    '''
+    network, epoch = load_network(name, paths, device, imsize, model_source)
+    print(f'predicting with {name} (epoch {epoch})')
+    written = predict_files(network, list_images(input_path), output_path, imsize, batch_size)
+    print(f'{len(written)} masks written to {output_path}')
+    return written
+
+
+def predict_files(network, files, output_path, imsize = 256, batch_size = 8, fmt = 'rgb'):
+    '''
+    read, predict and write batch after batch (one step at a time, see StreamingInference.py for the overlapped version)
+    :param network: network from load_network
+    :param files: image paths
+    :param output_path: folder the masks are written to
+    :param fmt: 'rgb' or 'index', see write_mask
+    :return: list of mask paths written
+    '''
+    os.makedirs(output_path, exist_ok = True)
+    written = []
+    for start in range(0, len(files), batch_size):
+        images = [read_image(file) for file in files[start:start + batch_size]]
+        masks = predict_batch(network, np.stack([preprocess(img, imsize) for img in images]))
+        for file, img, mask in zip(files[start:start + batch_size], images, masks):
+            write_mask(mask_path(output_path, file), mask, img.shape[:2], fmt)
+            written.append(mask_path(output_path, file))
+    return written
@@ -0,0 +1,138 @@
+"""
+Metrics.py
+Segmentation metrics of a whole epoch from one confusion matrix, for both model wrappers.
+
+Averaging the metrics of every batch (torchmetrics per batch in Model, smp's meters in Pretrained_Model) weighs a batch
+with a few pixels of a class as much as one full of it, and smp's IoU(threshold = 0.5) thresholds the raw logits of every
+channel instead of taking the predicted class. Here the (true class, predicted class) counts of every pixel are added
+to a num_classes x num_classes matrix with one bincount per batch, on the device of the predictions, and the metrics are
+derived from the matrix of the epoch (summed over processes when distributed):
+    IOU_<class>, Dice_<class>    per class, nan for a class that is neither in the targets nor predicted
+    IOU, Dice                    mean over the classes that are defined
+    pixel_accuracy               correct pixels / pixels
+    fwIOU                        IoU of every class weighted by its share of the target pixels
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import numpy as np
+import pandas as pd
+import torch
+
+from LunarModules.ImageProcessor import CLASS_MAP
+from LunarModules.Distributed import all_reduce_sum
+
+# class names as used in the metric names, ie: IOU_Big_Rocks
+CLASS_NAMES = [name.replace(' ', '_') for name in CLASS_MAP.name]
+# metrics recorded by the model wrappers by default
+METRICS = ['IOU', 'Dice', 'pixel_accuracy', 'fwIOU']
+
+
+def class_indices(x):
+    '''
+    :param x: (n, c, h, w) logits/probabilities/one hot masks or (n, h, w) class indices
+    :return: (n, h, w) class indices, (n, h, w) bool of the pixels to count (one hot pixels of no class are skipped)
+    '''
+    if x.dim() == 4:
+        return x.argmax(dim = 1), x.amax(dim = 1) > 0
+    return x.long(), torch.ones_like(x, dtype = torch.bool)
+
+
+def confusion_matrix(pred, target, num_classes = 4):
+    '''
+    :param pred: predictions, see class_indices
+    :param target: targets, see class_indices
+    :return: (num_classes, num_classes) int64 tensor on the device of pred, rows are true classes, columns predicted
+    '''
+    pred, _ = class_indices(pred.detach())
+    target, valid = class_indices(target.detach())
+    valid = valid & (target < num_classes)
+    bins = target[valid] * num_classes + pred[valid]
+    return torch.bincount(bins, minlength = num_classes**2).reshape(num_classes, num_classes)
+
+
+class ConfusionMatrix:
+    '''
+    Confusion matrix accumulated over an epoch
+    ie: cm = ConfusionMatrix(); for x, y in loader: cm.update(model(x), y); scores = cm.all_reduce().compute()
+    '''
+    def __init__(self, num_classes = 4, class_names = CLASS_NAMES):
+        self.num_classes = num_classes
+        self.class_names = class_names
+        self.matrix = None
+
+    def reset(self):
+        self.matrix = None
+        return self
+
+    def update(self, pred, target):
+        '''
+        add the pixels of a batch, the matrix stays on the device of the predictions
+        :param pred: predictions, see class_indices
+        :param target: targets, see class_indices
+        :return: self
+        '''
+        matrix = confusion_matrix(pred, target.to(pred.device), self.num_classes)
+        self.matrix = matrix if self.matrix is None else self.matrix + matrix.to(self.matrix.device)
+        return self
+
+    def all_reduce(self):
+        '''
+        sum the matrices of every process, no-op when not distributed
+        :return: self
+        '''
+        if self.matrix is None:
+            self.matrix = torch.zeros(self.num_classes, self.num_classes, dtype = torch.int64)
+        self.matrix = all_reduce_sum(self.matrix.cpu())
+        return self
+
+    def counts(self):
+        '''
+        :return: (num_classes, num_classes) float64 numpy array
+        '''
+        if self.matrix is None:
+            return np.zeros((self.num_classes, self.num_classes))
+        return self.matrix.cpu().numpy().astype(np.float64)
+
+    def compute(self, names = None):
+        '''
+        :param names: metrics to return, None for all of them
+        :return: dict of metric name -> float
+        '''
+        matrix = self.counts()
+        tp = np.diag(matrix)
+        fp = matrix.sum(axis = 0) - tp
+        fn = matrix.sum(axis = 1) - tp
+        total = matrix.sum()
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            iou = np.where(tp + fp + fn > 0, tp / (tp + fp + fn), np.nan)
+            dice = np.where(tp + fp + fn > 0, 2 * tp / (2 * tp + fp + fn), np.nan)
+        frequency = matrix.sum(axis = 1) / total if total > 0 else np.zeros(self.num_classes)
+
+        defined = ~np.isnan(iou)
+        scores = {
+            'IOU': float(iou[defined].mean()) if defined.any() else float('nan'),
+            'Dice': float(dice[defined].mean()) if defined.any() else float('nan'),
+            'pixel_accuracy': float(tp.sum() / total) if total > 0 else float('nan'),
+            'fwIOU': float((frequency[defined] * iou[defined]).sum()) if total > 0 else float('nan'),
+        }
+        for i, name in enumerate(self.class_names):
+            scores[f'IOU_{name}'] = float(iou[i])
+            scores[f'Dice_{name}'] = float(dice[i])
+        if names is None:
+            return scores
+        return {name: scores[name] for name in names}
+
+    def per_class(self):
+        '''
+        :return: dataframe of IoU, Dice, pixels and share of the target pixels of every class
+        '''
+        scores = self.compute()
+        matrix = self.counts()
+        return pd.DataFrame({
+            'class': self.class_names,
+            'IOU': [scores[f'IOU_{name}'] for name in self.class_names],
+            'Dice': [scores[f'Dice_{name}'] for name in self.class_names],
+            'pixels': matrix.sum(axis = 1).astype(np.int64),
+            'frequency': matrix.sum(axis = 1) / max(matrix.sum(), 1),
+        })
@@ -16,22 +16,59 @@ import seaborn as sns
 import os
 import torch
 import torch.nn as nn
-import torchvision
-import time
-import datetime as dt
 from transformers import get_scheduler
-from tqdm.auto import tqdm
 import segmentation_models_pytorch as smp
-import segmentation_models_pytorch.utils as smp_utils
-from torch.optim import SGD
+from torch.optim import SGD, Adam
+from torch.utils.checkpoint import checkpoint
+from LunarModules.Distributed import is_main_process
+from LunarModules.ModelStore import DEFAULT_MODEL_SOURCE
+from LunarModules.Metrics import METRICS
+from LunarModules.Trainer import Trainer, BestCheckpoint
+
+def maybe_checkpoint(module, fn, *args):
+    '''
+    Runs fn(*args). When the module has checkpointing turned on and is training, the activations inside fn are not
+    stored but recomputed during the backward pass, trading compute for memory.
+    :param module: module that owns fn, its checkpointing and training flags decide whether to checkpoint
+    :param fn: function to run
+    :param args: inputs to fn
+    :return: output of fn
+    '''
+    if getattr(module, 'checkpointing', False) and module.training and torch.is_grad_enabled():
+        return checkpoint(fn, *args, use_reentrant = False)
+    return fn(*args)
+
+def enable_encoder_checkpointing(encoder):
+    '''
+    Turns on activation checkpointing for every stage of a segmentation-models-pytorch encoder.
+    smp encoders run their forward loop over get_stages(), so each returned stage is wrapped.
+    :param encoder: smp encoder, ie: smp.Unet(...).encoder
+    :return: True if the encoder supports stage checkpointing
+    '''
+    if not hasattr(encoder, 'get_stages'):
+        print(f'{type(encoder).__name__} has no stages, skipping checkpointing...')
+        return False
+
+    get_stages = encoder.get_stages
+
+    def checkpointed_stage(stage):
+        def forward(x):
+            if stage.training and torch.is_grad_enabled():
+                return checkpoint(stage, x, use_reentrant = False)
+            return stage(x)
+        return forward
+
+    encoder.get_stages = lambda: [checkpointed_stage(stage) for stage in get_stages()]
+    return True
 
 class Down(nn.Module):
     '''
     ENCODER of Custom UNet
     '''
-    def __init__(self, verbose = False):
+    def __init__(self, verbose = False, checkpointing = False):
         super().__init__()
         self.verbose = verbose
+        self.checkpointing = checkpointing
         self.conv1 = nn.Conv2d(in_channels = 3, out_channels = 16, kernel_size = 3, padding = "same")
         self.convnorm1 = nn.BatchNorm2d(16)
         self.conv2 = nn.Conv2d(in_channels = 16, out_channels = 16, kernel_size = 3, padding = "same")
@@ -59,7 +96,7 @@ class Down(nn.Module):
         ft_maps = []
 
         # First Block
-        x = self.relu(self.conv2(self.relu(self.convnorm1(self.conv1(x)))))
+        x = maybe_checkpoint(self, self.conv_block, x, self.conv1, self.convnorm1, self.conv2)
         ft_maps.append(x)
         if self.verbose:
             print('size of first FTMP: ', x.shape)
@@ -69,7 +106,7 @@ class Down(nn.Module):
         x = self.dropout(x)
 
         # Second Block
-        x = self.relu(self.conv4(self.relu(self.convnorm2(self.conv3(x)))))
+        x = maybe_checkpoint(self, self.conv_block, x, self.conv3, self.convnorm2, self.conv4)
         ft_maps.append(x)
         if self.verbose:
             print('size of second FTMP: ', x.shape)
@@ -79,7 +116,7 @@ class Down(nn.Module):
         x = self.dropout(x)
 
         # Third Block
-        x = self.relu(self.conv6(self.relu(self.convnorm3(self.conv5(x)))))
+        x = maybe_checkpoint(self, self.conv_block, x, self.conv5, self.convnorm3, self.conv6)
         ft_maps.append(x)
         if self.verbose:
             print('size of third FTMP: ', x.shape)
@@ -90,14 +127,21 @@ class Down(nn.Module):
 
         return ft_maps
 
+    def conv_block(self, x, conv_a, norm, conv_b):
+        '''
+        conv -> batchnorm -> relu -> conv -> relu
+        '''
+        return self.relu(conv_b(self.relu(norm(conv_a(x)))))
+
 
 class Up(nn.Module):
     '''
     DECODER block of U-Net
     '''
-    def __init__(self, verbose = False):
+    def __init__(self, verbose = False, checkpointing = False):
         super().__init__()
         self.verbose = verbose
+        self.checkpointing = checkpointing
 
         self.conv_trans1 = nn.ConvTranspose2d(in_channels = 64, out_channels = 32, kernel_size = 2, stride = 2)
         self.conv_trans2 = nn.ConvTranspose2d(in_channels = 32, out_channels = 16, kernel_size = 2, stride = 2)
@@ -126,26 +170,26 @@ class Up(nn.Module):
         '''
 
         # first block
-        x = self.conv_trans1(x)
-        ft = self.crop(encoder_features[0], x)
-        x = torch.cat([x, ft], dim = 1)
-        if self.verbose:
-            print('size after first concat: ', x.shape)
-        x = self.dropout(x)
-        x = self.relu(self.conv2(self.relu(self.convnorm1(self.conv1(x))))) # decoder block 1
+        x = maybe_checkpoint(self, self.up_block, x, encoder_features[0], self.conv_trans1, self.conv1, self.convnorm1, self.conv2) # decoder block 1
 
         # second block
-        x = self.conv_trans2(x)
-        ft = self.crop(encoder_features[1], x)
-        x = torch.cat([x, ft], dim = 1)
-        if self.verbose:
-            print('size after second concat: ', x.shape)
-        x = self.dropout(x)
-        x = self.relu(self.conv4(self.relu(self.convnorm2(self.conv3(x))))) # decoder block 2
+        x = maybe_checkpoint(self, self.up_block, x, encoder_features[1], self.conv_trans2, self.conv3, self.convnorm2, self.conv4) # decoder block 2
         if self.verbose:
             print('final decoder size: ', x.shape)
         return x
 
+    def up_block(self, x, enc_ftrs, conv_trans, conv_a, norm, conv_b):
+        '''
+        Upsample, concat with the cropped encoder features and run the conv block
+        '''
+        x = conv_trans(x)
+        ft = self.crop(enc_ftrs, x)
+        x = torch.cat([x, ft], dim = 1)
+        if self.verbose:
+            print('size after concat: ', x.shape)
+        x = self.dropout(x)
+        return self.relu(conv_b(self.relu(norm(conv_a(x)))))
+
     def crop(self, enc_ftrs, x):
         '''
         Crop the features to match the proper size of the inputs to the decoder blocks
@@ -155,18 +199,27 @@ class Up(nn.Module):
         '''
         if self.verbose:
             print(f'crop enc_ftrs shape: {enc_ftrs.shape}')
+        # center crop by slicing (same offsets as torchvision's CenterCrop), a view instead of a new transform each call
         _, _, H, W = x.shape
-        enc_ftrs = torchvision.transforms.CenterCrop([H, W])(enc_ftrs)
-        return enc_ftrs
+        top, left = int(round((enc_ftrs.shape[2] - H) / 2.0)), int(round((enc_ftrs.shape[3] - W) / 2.0))
+        return enc_ftrs[:, :, top:top + H, left:left + W]
 
 class UNet_scratch(nn.Module):
     '''
     COMBINED U-NET MODEL
     '''
-    def __init__(self, num_class = 4, retain_dim = True, out_sz = (256, 256), verbose = False):
+    def __init__(self, num_class = 4, retain_dim = True, out_sz = (256, 256), verbose = False, checkpointing = False):
+        '''
+        :param num_class: number of output classes
+        :param retain_dim: if True the output is interpolated to out_sz
+        :param out_sz: output size
+        :param verbose: print feature map sizes
+        :param checkpointing: if True the encoder/decoder blocks recompute their activations in the backward pass
+                              instead of storing them, lowering training memory at the cost of an extra forward
+        '''
         super().__init__()
-        self.encoder = Down(verbose = verbose)
-        self.decoder = Up(verbose = verbose)
+        self.encoder = Down(verbose = verbose, checkpointing = checkpointing)
+        self.decoder = Up(verbose = verbose, checkpointing = checkpointing)
 
         self.head = nn.Conv2d(in_channels = 16, out_channels = num_class, kernel_size = 1)
         self.retain_dim = retain_dim
@@ -193,14 +246,15 @@ class Model:
     '''
 
     ## NEED TO ADD THIS
-    def __init__(self, model, loss, opt, scheduler, metrics, random_seed, train_data_loader, val_data_loader, test_data_loader, real_test_data_loader, device, base_loc = None, name = None, log_file=None):
+    def __init__(self, model, loss, opt, scheduler, metrics, random_seed, train_data_loader, val_data_loader, test_data_loader, real_test_data_loader, device, base_loc = None, name = None, log_file=None, batch_transform = None, model_source = DEFAULT_MODEL_SOURCE, amp = False, compile = False):
         '''
-        Scratch Model Wrapper
+        Scratch Model Wrapper, the loops are run by a Trainer (LunarModules/Trainer.py)
         :param model: model to train
         :param loss: loss function to use
         :param opt: optimizer
-        :param scheduler: LR scheduler
-        :param metrics: dictionary of metrics to calculate
+        :param scheduler: LR scheduler, unused, run_training schedules the LR linearly over its epochs
+        :param metrics: names of the metrics to record, computed from the confusion matrix of each epoch (see
+                        LunarModules/Metrics.py), ie: ['IOU', 'Dice', 'IOU_Big_Rocks']
         :param random_seed: random seed to set
         :param train_data_loader: dataloader for train data
         :param val_data_loader: dataloader for validation data
@@ -210,9 +264,17 @@ class Model:
         :param base_loc: base location to save to
         :param name: model name, used for saving and plottng
         :param log_file: logfile to output to
+        :param batch_transform: optional callable (images, masks) -> (images, masks) run on every train batch after it
+                                is moved to device, ie: Augmentation.BatchAugmentation. set_epoch(e) is called on it
+                                each epoch if it has one
+        :param model_source: where load() downloads the checkpoint from if it is not cached (see ModelStore), None
+                             to only load local checkpoints
+        :param amp: train and evaluate with mixed precision
+        :param compile: train, evaluate and predict with the torch.compile'd network, compiled graphs are cached in
+                        Models/compile_cache so later runs don't compile them again
         '''
         self.log_file = log_file
-        self.model = model.to(device)
+        self.batch_transform = batch_transform
         self.random_seed = random_seed
         self.train_data_loader = train_data_loader
         self.val_data_loader = val_data_loader
@@ -222,19 +284,20 @@ class Model:
         self.loss = loss
         self.opt = opt
         self.scheduler = scheduler
-        self.history = {
-            "train_loss":[],
-            "val_loss":[],
-            "test_loss":[]
-        }
-        for metric in metrics.keys():
-            self.history[f'train_{metric}'] = []
-            self.history[f'val_{metric}'] = []
-            self.history[f'test_{metric}'] = []
-
-        self.metrics = metrics
+        self.metrics = list(metrics)
         self.base_loc = base_loc
         self.device = device
+        self.model_source = model_source
+        self.trainer = Trainer(model, loss, opt, device, name, base_loc = base_loc, metrics = self.metrics, batch_transform = batch_transform, amp = amp, compile = compile, model_source = model_source)
+        self.model = self.trainer.model
+
+    @property
+    def history(self):
+        return self.trainer.history
+
+    @property
+    def checkpoint_sha256(self):
+        return self.trainer.checkpoint_sha256
 
     def load(self):
         '''
@@ -244,161 +307,41 @@ class Model:
         last_e = self.load_latest_model(self.device)
         return last_e
 
-    def run_training(self, n_epochs, save_on = 'val_IOU', load = False):
+    def run_training(self, n_epochs, save_on = 'val_IOU', load = False, micro_batch_size = None, patience = None, val_every = 1, val_batches = None, time_budget = None, profile = False, trace_path = None):
         '''
         Runs the training loop for scratch model
         :param n_epochs: number of epochs to train
         :param save_on: what metric to keep track of to save on
         :param load: whether to load a saved model version. If True it will load and begin from last saved epoch, if False it will start from scratch
+        :param micro_batch_size: if set, each batch is run in chunks of this size with gradient accumulation. The
+                                 optimizer still steps once per batch so the effective batch size and LR schedule are unchanged
+        :param patience: stop after this many validations without improvement of save_on, None to always run n_epochs
+        :param val_every: validate every k epochs (and always on the last epoch)
+        :param val_batches: validate on at most this many batches of the (shuffled) validation loader, None for all
+        :param time_budget: stop before an epoch that would not finish within this many seconds, None for no limit
+        :param profile: time data wait/h2d/forward/backward/optimizer/metrics per step and print a summary each epoch,
+                        the summaries are saved to Results/<name>_step_timing.csv
+        :param trace_path: optional path, also export a torch.profiler Chrome trace of the first steps there
         :return:
         '''
-
-
-        ### SET UP
-        print(f'Training: {self.name}')
-        num_training_steps = n_epochs * len(self.train_data_loader)
-        progress_bar = tqdm(range(num_training_steps))
-        lr_scheduler = get_scheduler(name = "linear", optimizer = self.opt, num_warmup_steps = 0, num_training_steps = num_training_steps)
-
-        if load:
-            last_e = self.load_latest_model(self.device)
-        else:
-            last_e = 0
-
-        if save_on not in self.history.keys():
+        if save_on not in [f'val_{metric}' for metric in self.metrics]:
             print('that save metric doesnt exist, make sure the metric is passed into the function')
             return
 
+        if is_main_process():
+            print(f'Training: {self.name}')
+        last_e = self.load_latest_model(self.device) if load else 0
 
-        best_met = 0
-        for e in range(last_e, n_epochs):
-            ## Start epoch
-            # reset metrics each epoch
-            running_metrics = {
-                'running_train_loss': 0,
-                'running_val_loss': 0
-            }
-            for metric in self.metrics.keys():
-                running_metrics[f'running_train_{metric}'] = 0
-                running_metrics[f'running_val_{metric}'] = 0
-
-            t0 = time.time()
-            self.model.train()
-
-            for step, batch in enumerate(self.train_data_loader):
-                x_train, y_train = batch[0].to(self.device), batch[1].to(self.device)
-
-                x_train.requires_grad = True
-
-                self.model.zero_grad()
-                self.opt.zero_grad()
-
-                pred = self.model.forward(x_train.float())
-                loss = self.loss(pred, y_train.float())
-                loss.backward()
-                self.opt.step()
-                lr_scheduler.step()
-
-                pred_argmax = torch.argmax(pred, dim = 1)
-
-                # saving loss and metrics
-                running_metrics['running_train_loss'] += loss.item()
-                for metric in self.metrics.keys():
-                    m = self.metrics[metric]
-                    running_metrics[f'running_train_{metric}'] += m(pred_argmax.cpu(), torch.argmax(y_train.float(), dim = 1).cpu())
-
-                progress_bar.update(1)
-
-            # calculating average loss and metrics
-            self.history["train_loss"].append((e, (running_metrics['running_train_loss']/len(self.train_data_loader))))
-            for metric in self.metrics.keys():
-                self.history[f'train_{metric}'].append((e, (running_metrics[f'running_train_{metric}'] / len(self.train_data_loader)).numpy()+0))
-
-            ## VALIDATION LOOP
-            self.model.eval()
-            with torch.no_grad():
-                for step, batch in enumerate(self.val_data_loader):
-                    x_val, y_val = batch[0].to(self.device), batch[1].to(self.device)
-
-
-                    y_val_pred = self.model(x_val.float())
-                    loss = self.loss(y_val_pred, y_val.float())
-
-
-                    running_metrics['running_val_loss'] += loss.item()
-                    for metric in self.metrics.keys():
-                        m = self.metrics[metric]
-                        running_metrics[f'running_val_{metric}'] += m(torch.argmax(y_val_pred.float(), dim = 1).cpu(), torch.argmax(y_val.float(), dim = 1).cpu())
-
-            # Updating validation metrics
-            self.history["val_loss"].append((e, (running_metrics['running_val_loss']/len(self.val_data_loader))))
-            for metric in self.metrics.keys():
-                self.history[f'val_{metric}'].append((e, (running_metrics[f'running_val_{metric}'] / len(self.val_data_loader)).numpy()+0))
-
-            s = f"EPOCH: {e} -- "
-            for metric in self.history.keys():
-                if len(self.history[metric])>0:
-                    s += f"{metric} {self.history[metric][-1][1]} "
-
-            print(s)
-
-            if self.history[save_on][-1][1] > best_met:
-                self.save_model(e)
-                best_met = self.history[save_on][-1][1]
-
-            # Measure how long this epoch took.
-            print("")
-            training_time = str(dt.timedelta(seconds = int(round((time.time() - t0)))))
-            print(f"Training epoch took: {training_time}")
-
+        self.trainer.micro_batch_size = micro_batch_size
+        self.trainer.scheduler = get_scheduler(name = "linear", optimizer = self.opt, num_warmup_steps = 0, num_training_steps = n_epochs * len(self.train_data_loader))
+        self.trainer.fit(self.train_data_loader, self.val_data_loader, n_epochs, start_epoch = last_e, val_every = val_every, val_batches = val_batches, callbacks = [BestCheckpoint(save_on, patience, time_budget)], profile = profile, trace_path = trace_path)
 
     def run_test(self):
         '''
         Run model on testing data
         :return:
         '''
-        running_metrics = {
-            'running_test_loss':0
-        }
-
-        for metric in self.metrics.keys():
-            running_metrics[f'running_test_{metric}'] = 0
-            #running_metrics[f'running_test_{metric}_real'] = 0
-
-        num_training_steps = len(self.test_data_loader)
-        #num_training_steps2 = len(self.real_test_data_loader)
-
-        progress_bar = tqdm(range(num_training_steps), desc = 'TESTING: ')
-        #progress_bar2 = tqdm(range(num_training_steps2), desc = 'TESTING REAL: ')
-
-
-        self.model.eval()
-        with torch.no_grad():
-            for step, batch in enumerate(self.test_data_loader):
-
-                x_test, y_test = batch[0].to(self.device), batch[1].to(self.device)
-
-
-                y_test_pred = self.model(x_test.float())
-
-                loss = self.loss(y_test_pred, y_test.float())
-
-                running_metrics['running_test_loss'] += loss.item()
-                for metric in self.metrics.keys():
-                    m = self.metrics[metric]
-                    running_metrics[f'running_test_{metric}'] += m(torch.argmax(y_test_pred.float(), dim = 1).cpu(), torch.argmax(y_test.float(), dim = 1).cpu())
-                progress_bar.update(1)
-
-        s = f"TESTING: "
-        for metric in self.metrics.keys():
-            s += f"{metric} {running_metrics[f'running_test_{metric}']/len(self.test_data_loader)} "
-
-        self.history[f'test_loss'].append((-1, (running_metrics[f'running_test_loss'] / len(self.test_data_loader))))
-
-        for metric in self.metrics.keys():
-            self.history[f'test_{metric}'].append((-1, (running_metrics[f'running_test_{metric}'] / len(self.test_data_loader)).numpy()+0))
-        print(s)
-
+        self.trainer.test(self.test_data_loader)
 
     def predict(self, img):
         '''
@@ -406,9 +349,7 @@ class Model:
         :param img: img to predict
         :return:
         '''
-        x_test = img.to(self.device)
-        y_pred = self.model(x_test.float())
-        return torch.argmax(y_pred.float(), dim = 1).cpu()
+        return self.trainer.predict(img)
 
 
     def plot_train(self, save_loc):
@@ -417,9 +358,8 @@ class Model:
         :param save_loc:
         :return:
         '''
-        metrics = self.metrics.keys()
-        metrics = np.unique([m[m.find('_')+1:] for m in metrics])
-        fig, axes = plt.subplots(nrows = 1, ncols = len(metrics), figsize = (8,8))
+        metrics = list(self.metrics)
+        fig, axes = plt.subplots(nrows = 1, ncols = len(metrics) + 1, figsize = (8,8))
 
         axes[0].plot([x[1] for x in self.history['train_loss']], color = "slategrey", label = "Training Loss")
         axes[0].plot([x[1] for x in self.history['val_loss']], color = "seagreen", label = "Training Loss")
@@ -440,12 +380,7 @@ class Model:
         :param epoch: what epoch it's saving on
         :return:
         '''
-        save_loc = os.path.join(self.base_loc, 'Models', 'lunar_surface_segmentation_models')
-        if not os.path.exists(save_loc):
-            print('Making Model Dir')
-            os.mkdir(save_loc)
-        torch.save(self.model.state_dict(), os.path.join(save_loc, f"model_{self.name}_EP{epoch}.pt"))
-        print('saving model ...')
+        self.trainer.save_checkpoint(epoch)
 
     def load_latest_model(self, device):
         '''
@@ -453,35 +388,20 @@ class Model:
         :param device: pytorch device
         :return: the latest epoch the model was trained
         '''
-        model_loc = os.path.join(self.base_loc, 'Models', 'lunar_surface_segmentation_models')
-        if not os.path.exists(model_loc):
-            print('Model folder doesnt exist, skipping loading...')
-            return 0
-        models = [x for x in os.listdir(model_loc) if '.pt' in x and self.name+'_EP' in x]
-        if len(models) == 0:
-            print('No models saved to load')
-            return 0
-        else:
-            saved_iterations = sorted([int(x[x.find('EP')+2:x.find('.pt')]) for x in models])
-            latest_model = f'model_{self.name}_EP{saved_iterations[-1]}.pt'
-            print(f"Latest Model Saved: {latest_model}")
-            model_file = os.path.join(model_loc, latest_model)
-            self.model.load_state_dict(torch.load(model_file, map_location = device))
-            print("Model Loaded!")
-            return saved_iterations[-1]
+        return self.trainer.load_checkpoint(device)
 
 class Pretrained_Model:
     '''
     Model wrapper for U-Net with pretrained model backbone from segmentation-models-pytorch
     '''
 
-    def __init__(self, backbone, encoder_weights, activation, metrics, LR, loss, device, train_data_loader, val_data_loader, test_data_loader, real_test_data_loader, base_loc, name = None):
+    def __init__(self, backbone, encoder_weights, activation, metrics, LR, loss, device, train_data_loader, val_data_loader, test_data_loader, real_test_data_loader, base_loc, name = None, checkpointing = False, optimizer = 'sgd', batch_transform = None, model_source = DEFAULT_MODEL_SOURCE, confusion_metrics = METRICS, amp = False, compile = False):
         '''
-        init for pretrained model wrapper
+        init for pretrained model wrapper, the loops are run by a Trainer (LunarModules/Trainer.py)
         :param backbone: backbone to use ex: 'resnet18'
         :param encoder_weights: weights to use ex: 'imagenet'
         :param activation: activation function to use, None for lienar
-        :param metrics: list of metrics to calculate
+        :param metrics: list of smp metrics to average over the batches, can be empty
         :param LR: Learning rate
         :param loss: loss function
         :param device: pytorch device
@@ -491,6 +411,16 @@ class Pretrained_Model:
         :param real_test_data_loader: dataloader for real testing images
         :param base_loc: base location of code
         :param name: model name for saving
+        :param checkpointing: if True the encoder stages recompute their activations in the backward pass instead of storing them
+        :param optimizer: 'sgd' (momentum 0.9) or 'adam'
+        :param batch_transform: optional callable (images, masks) -> (images, masks) run on every train batch on device
+        :param model_source: where load() downloads the checkpoint from if it is not cached (see ModelStore), None
+                             to only load local checkpoints
+        :param confusion_metrics: metrics computed from the confusion matrix of each epoch (see LunarModules/Metrics.py),
+                                  val_IOU is the one the best model is saved on
+        :param amp: train and evaluate with mixed precision
+        :param compile: train, evaluate and predict with the torch.compile'd network, compiled graphs are cached in
+                        Models/compile_cache so later runs don't compile them again
         '''
         self.backbone = backbone
         self.encoder_weights = encoder_weights
@@ -506,6 +436,7 @@ class Pretrained_Model:
         self.device = device
         self.name = name
         self.base_loc = base_loc
+        self.model_source = model_source
 
         self.model = smp.Unet(
                     encoder_name=self.backbone,
@@ -513,41 +444,46 @@ class Pretrained_Model:
                     classes=4,
                     activation=self.activation,
                 )
+        if checkpointing:
+            enable_encoder_checkpointing(self.model.encoder)
 
-        self.optimizer = SGD(params=self.model.parameters(), lr=self.LR, momentum = 0.9)
+        if optimizer == 'adam':
+            self.optimizer = Adam(params=self.model.parameters(), lr=self.LR)
+        else:
+            self.optimizer = SGD(params=self.model.parameters(), lr=self.LR, momentum = 0.9)
 
         self.preprocessing_fn = smp.encoders.get_preprocessing_fn(self.backbone, self.encoder_weights)
 
         self.metrics = metrics
-        self.history = {}
-
-        self.train_epoch = smp_utils.train.TrainEpoch(
-            self.model,
-            loss = self.loss,
-            metrics = self.metrics,
-            optimizer = self.optimizer,
-            device = self.device,
-            verbose = True,
-        )
-
-        self.valid_epoch = smp_utils.train.ValidEpoch(
-            self.model,
-            loss = self.loss,
-            metrics = self.metrics,
-            device = self.device,
-            verbose = True,
-        )
-
-    def run_training(self, n_epochs, load = False):
+        self.confusion_metrics = confusion_metrics
+        self.trainer = Trainer(self.model, self.loss, self.optimizer, self.device, self.name, base_loc = self.base_loc, metrics = confusion_metrics, batch_metrics = metrics, batch_transform = batch_transform, amp = amp, compile = compile, model_source = model_source)
+
+    @property
+    def history(self):
+        return self.trainer.history
+
+    @property
+    def checkpoint_sha256(self):
+        return self.trainer.checkpoint_sha256
+
+    def run_training(self, n_epochs, load = False, micro_batch_size = None, patience = None, val_every = 1, val_batches = None, time_budget = None, profile = False, trace_path = None):
         '''
         Training loop
         :param n_epochs: number of epochs to train for
         :param load: whether to load a previous model state
+        :param micro_batch_size: if set, each batch is run in chunks of this size with gradient accumulation. The
+                                 optimizer still steps once per batch so the effective batch size and LR schedule are unchanged
+        :param patience: stop after this many validations without improvement of val_IOU, None to always run n_epochs
+        :param val_every: validate every k epochs (and always on the last epoch)
+        :param val_batches: validate on at most this many batches of the (shuffled) validation loader, None for all
+        :param time_budget: stop before an epoch that would not finish within this many seconds, None for no limit
+        :param profile: time data wait/h2d/forward/backward/optimizer/metrics per step and print a summary each epoch,
+                        the summaries are saved to Results/<name>_step_timing.csv
+        :param trace_path: optional path, also export a torch.profiler Chrome trace of the first steps there
         :return:
         '''
-        print(f"Training: {self.name}")
-        best_val_iou = 0.0
-        train_logs_list, valid_logs_list = [], []
+        if is_main_process():
+            print(f"Training: {self.name}")
 
         if load:
             last_e = self.load_latest_model(self.device)
@@ -555,27 +491,8 @@ class Pretrained_Model:
         else:
             last_e = 0
 
-        for i in range(last_e, n_epochs):
-            # Perform training & validation
-            print('\nEpoch: {}'.format(i))
-            train_logs = self.train_epoch.run(self.train_data_loader)
-            print(train_logs)
-            val_logs = self.valid_epoch.run(self.val_data_loader)
-            print(val_logs)
-            for key in train_logs.keys():
-                if f'train_{key}' in self.history.keys():
-                    self.history[f'train_{key}'].append((i, train_logs[key]))
-                else:
-                    self.history[f'train_{key}'] = [(i, train_logs[key])]
-            for key in val_logs.keys():
-                if f'val_{key}' in self.history.keys():
-                    self.history[f'val_{key}'].append((i, val_logs[key]))
-                else:
-                    self.history[f'val_{key}'] = [(i, val_logs[key])]
-
-            if self.history[f'val_iou_score'][-1][1] > best_val_iou:
-                best_val_iou = self.history[f'val_iou_score'][-1][1]
-                self.save_model(i)
+        self.trainer.micro_batch_size = micro_batch_size
+        self.trainer.fit(self.train_data_loader, self.val_data_loader, n_epochs, start_epoch = last_e, val_every = val_every, val_batches = val_batches, callbacks = [BestCheckpoint('val_IOU', patience, time_budget)], profile = profile, trace_path = trace_path)
 
     def save_model(self, epoch):
         '''
@@ -583,36 +500,22 @@ class Pretrained_Model:
         :param epoch: epoch number of best model
         :return:
         '''
-        save_loc = os.path.join(self.base_loc, 'Models', 'lunar_surface_segmentation_models')
-        if not os.path.exists(save_loc):
-            print('Making Model Dir')
-            os.mkdir(save_loc)
-        torch.save(self.model.state_dict(), os.path.join(save_loc, f"model_{self.name}_EP{epoch}.pt"))
-        print('saving model ...')
+        self.trainer.save_checkpoint(epoch)
+
+    def predict(self, img):
+        '''
+        Predicting function
+        :param img: img to predict
+        :return: predicted class indices
+        '''
+        return self.trainer.predict(img)
 
     def run_testing(self):
         '''
         test model on test dataset
         :return:
         '''
-        test_epoch = smp.utils.train.ValidEpoch(
-            model = self.model,
-            loss = self.loss,
-            metrics = self.metrics,
-            device = self.device,
-        )
-        logs = test_epoch.run(self.test_data_loader)
-        s = f"TESTING: "
-        for key in logs.keys():
-            if key in self.history.keys():
-                self.history[f'test_{key}'].append((-1, logs[key]))
-            else:
-                self.history[f'test_{key}'] = [(-1, logs[key])]
-            s += f' {key}: {self.history[f"test_{key}"][-1][1]}'
-
-        print(s)
-
-
+        self.trainer.test(self.test_data_loader)
 
     def load(self):
         '''
@@ -628,19 +531,4 @@ class Pretrained_Model:
         :param device: pytorch device
         :return: last epoch of training
         '''
-        model_loc = os.path.join(self.base_loc, 'Models', 'lunar_surface_segmentation_models')
-        if not os.path.exists(model_loc):
-            print('Model folder doesnt exist, skipping loading...')
-            return 0
-        models = [x for x in os.listdir(model_loc) if '.pt' in x and self.name+'_EP' in x]
-        if len(models) == 0:
-            print('No models saved to load')
-            return 0
-        else:
-            saved_iterations = sorted([int(x[x.find('EP')+2:x.find('.pt')]) for x in models])
-            latest_model = f'model_{self.name}_EP{saved_iterations[-1]}.pt'
-            print(f"Latest Model Saved: {latest_model}")
-            model_file = os.path.join(model_loc, latest_model)
-            self.model.load_state_dict(torch.load(model_file, map_location = device))
-            print("Model Loaded!")
-            return saved_iterations[-1]
\ No newline at end of file
+        return self.trainer.load_checkpoint(device)
@@ -0,0 +1,242 @@
+"""
+ModelStore.py
+Local cache of trained model checkpoints with a manifest, fetching a checkpoint from the model source only when a
+model is loaded and it is not cached yet.
+
+The cache is Models/lunar_surface_segmentation_models/. Its manifest.json has one entry per model name:
+    {"models": {"RESNET18_ground": {"file": "model_RESNET18_ground_EP12.pt", "epoch": 12, "sha256": "...", "size": 1}}}
+Trainer.save_checkpoint records every checkpoint it writes, and Model.load / Pretrained_Model.load go through fetch(), which
+returns the cached checkpoint if it passes its size/sha256 check, and otherwise downloads only that checkpoint.
+
+A source is an http(s) base URL, file:// URL or local directory mirroring the cache (with its own manifest.json), or
+the Google Drive folder of the project. Models listed in DRIVE_MODELS with a 'gdrive_id' are downloaded one file at a
+time from Drive. The others can only be fetched by downloading the whole Drive folder (every model), which a store only
+does with folder_fallback (trained_model_dl.py), so a job that needs one model doesn't download all of them. DRIVE_MODELS
+is empty until the file ids of the published checkpoints are filled in, until then run trained_model_dl.py once to
+fill the cache from Drive. Checkpoints in the cache that aren't in the manifest (older downloads) are picked up and
+recorded on first use.
+
+Under DDP only rank 0 writes to the cache: the other ranks use a read_only store (see Trainer.load_checkpoint).
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import json
+import os
+
+from LunarModules.DataFetcher import fetch_file, resolve, verify, sha256sum, is_gdrive_folder
+
+DEFAULT_MODEL_SOURCE = "https://drive.google.com/drive/folders/1x8qjoZVuTyvvi7FqkTLpNOimdBWLgapF?usp=sharing"
+MODEL_FOLDER = 'lunar_surface_segmentation_models'
+MANIFEST = 'manifest.json'
+# copy of the source's manifest in the cache
+SOURCE_MANIFEST = 'source_manifest.json'
+# manifest of the Google Drive source (a Drive folder can't serve manifest.json by name), model name -> entry with the
+# 'gdrive_id' of its checkpoint and its 'file', 'epoch', 'sha256', 'size'. Models missing here can only be fetched with
+# the whole folder (folder_fallback)
+DRIVE_MODELS = {}
+
+
+def checkpoint_epoch(file_name):
+    '''
+    :param file_name: ie: model_RESNET18_ground_EP12.pt
+    :return: epoch, ie: 12
+    '''
+    return int(file_name[file_name.rfind('_EP') + 3:file_name.rfind('.pt')])
+
+
+def build_manifest(folder):
+    '''
+    manifest of the latest checkpoint of every model in a folder, ie: to publish a mirror
+    :param folder: folder of model_<name>_EP<epoch>.pt files
+    :return: manifest dict
+    '''
+    models = {}
+    for file in sorted(os.listdir(folder)):
+        if not (file.startswith('model_') and file.endswith('.pt') and '_EP' in file):
+            continue
+        name, epoch = file[len('model_'):file.rfind('_EP')], checkpoint_epoch(file)
+        if name in models and models[name]['epoch'] >= epoch:
+            continue
+        path = os.path.join(folder, file)
+        models[name] = {'file': file, 'epoch': epoch, 'sha256': sha256sum(path), 'size': os.path.getsize(path)}
+    return {'models': models}
+
+
+class ModelStore:
+    '''
+    Checkpoint cache with a manifest and lazy fetching from a model source
+    ie: path, epoch = ModelStore(os.path.join(BASE_PATH, 'Models', MODEL_FOLDER)).fetch('RESNET18_ground')
+    '''
+    def __init__(self, cache_dir, source = DEFAULT_MODEL_SOURCE, verify_sha = True, folder_fallback = False, read_only = False):
+        '''
+        :param cache_dir: local checkpoint folder
+        :param source: model source (http(s) base URL, file:// URL, local directory or Google Drive folder URL), None
+                       to only use the cache
+        :param verify_sha: check the sha256 of cached checkpoints on every fetch, not only their size
+        :param folder_fallback: download the whole Google Drive folder for a model without a single file download
+        :param read_only: never write to the cache (no downloads, manifest updates or removals), ie: DDP ranks > 0
+        '''
+        self.cache_dir = cache_dir
+        self.source = source
+        self.verify_sha = verify_sha
+        self.folder_fallback = folder_fallback
+        self.read_only = read_only
+        self.source_models = None
+
+    def manifest_path(self):
+        return os.path.join(self.cache_dir, MANIFEST)
+
+    def read_manifest(self):
+        '''
+        :return: manifest of the cache, {'models': {}} if there is none
+        '''
+        if not os.path.exists(self.manifest_path()):
+            return {'models': {}}
+        with open(self.manifest_path()) as f:
+            return json.load(f)
+
+    def write_manifest(self, manifest):
+        os.makedirs(self.cache_dir, exist_ok = True)
+        with open(self.manifest_path() + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent = 2)
+        os.replace(self.manifest_path() + '.tmp', self.manifest_path())
+
+    def register(self, name, epoch, path, metrics = None):
+        '''
+        record a checkpoint in the manifest, replaces the entry of the model
+        :param name: model name
+        :param epoch: epoch of the checkpoint
+        :param path: checkpoint path in the cache
+        :param metrics: optional validation metrics of the checkpoint, ie: {'val_IOU': 0.61}, so a resumed training
+                        knows the score to beat
+        :return: manifest entry
+        '''
+        manifest = self.read_manifest()
+        entry = {'file': os.path.basename(path), 'epoch': epoch, 'sha256': sha256sum(path), 'size': os.path.getsize(path)}
+        if metrics is not None:
+            entry['metrics'] = metrics
+        manifest['models'][name] = entry
+        self.write_manifest(manifest)
+        return entry
+
+    def cached(self, name):
+        '''
+        cached checkpoint of a model that passes verification
+        :param name: model name
+        :return: (path, epoch), (None, 0) if there is none
+        '''
+        entry = self.read_manifest()['models'].get(name)
+        if entry is not None:
+            path = os.path.join(self.cache_dir, entry['file'])
+            if verify(path, entry['sha256'] if self.verify_sha else None, entry['size']):
+                return path, entry['epoch']
+            if os.path.exists(path) and not self.read_only:
+                print(f'{entry["file"]} failed verification, fetching it again')
+                os.remove(path)
+            return None, 0
+
+        # checkpoint from before the manifest, record it
+        if os.path.isdir(self.cache_dir):
+            files = [x for x in os.listdir(self.cache_dir) if x.startswith(f'model_{name}_EP') and x.endswith('.pt')]
+            if len(files) > 0:
+                latest = max(files, key = checkpoint_epoch)
+                if self.read_only:
+                    return os.path.join(self.cache_dir, latest), checkpoint_epoch(latest)
+                entry = self.register(name, checkpoint_epoch(latest), os.path.join(self.cache_dir, latest))
+                return os.path.join(self.cache_dir, latest), entry['epoch']
+        return None, 0
+
+    def source_manifest(self):
+        '''
+        manifest of the source, downloaded once per store
+        :return: dict of model entries, empty for a Drive source without manifest
+        '''
+        if self.source_models is not None:
+            return self.source_models
+        self.source_models = {}
+        if is_gdrive_folder(self.source):
+            self.source_models = dict(DRIVE_MODELS)
+            return self.source_models
+        path = os.path.join(self.cache_dir, SOURCE_MANIFEST)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            fetch_file(resolve(self.source, MANIFEST), path)
+            with open(path) as f:
+                self.source_models = json.load(f)['models']
+        except (OSError, ValueError, KeyError) as e:
+            print(f'could not read the model manifest of {self.source}: {e}')
+        return self.source_models
+
+    def download(self, name):
+        '''
+        download the checkpoint of one model from the source into the cache
+        :param name: model name
+        :return: (path, epoch), (None, 0) if the source doesn't have the model
+        '''
+        entry = self.source_manifest().get(name)
+        if is_gdrive_folder(self.source) and (entry is None or entry.get('gdrive_id') is None):
+            if not self.folder_fallback:
+                print(f'WARNING: {name} has no single file download (no gdrive_id in ModelStore.DRIVE_MODELS) and is not '
+                      f'in {self.cache_dir}. Not downloading the whole model folder for one model, run '
+                      f'trained_model_dl.py to download every model from Google Drive into the cache')
+                return None, 0
+            print(f'WARNING: {name} has no single file download, downloading the WHOLE model folder (every model) from Google Drive...')
+            self.download_folder()
+            return self.cached(name)
+        if entry is None:
+            print(f'{name} is not in the model source')
+            return None, 0
+
+        path = os.path.join(self.cache_dir, entry['file'])
+        print(f'Downloading {entry["file"]}...')
+        if entry.get('gdrive_id') is not None:
+            import gdown
+            gdown.download(id = entry['gdrive_id'], output = path + '.part', quiet = True, resume = True)
+            if not verify(path + '.part', entry['sha256'], entry['size']):
+                os.remove(path + '.part')
+                raise ValueError(f'{entry["file"]} failed verification')
+            os.replace(path + '.part', path)
+        else:
+            fetch_file(resolve(self.source, entry['file']), path, entry['sha256'], entry['size'])
+
+        manifest = self.read_manifest()
+        manifest['models'][name] = {key: entry[key] for key in ['file', 'epoch', 'sha256', 'size', 'metrics'] if key in entry}
+        self.write_manifest(manifest)
+        return path, entry['epoch']
+
+    def download_folder(self):
+        '''
+        download the whole Google Drive folder of the source into the cache and record its checkpoints
+        :return: manifest of the cache
+        '''
+        import gdown
+        os.makedirs(self.cache_dir, exist_ok = True)
+        gdown.download_folder(self.source, output = self.cache_dir, quiet = True, use_cookies = False)
+        manifest = build_manifest(self.cache_dir)
+        self.write_manifest(manifest)
+        return manifest
+
+    def fetch(self, name):
+        '''
+        checkpoint of a model, downloaded on first use
+        :param name: model name
+        :return: (path, epoch), (None, 0) if neither the cache nor the source has the model
+        '''
+        path, epoch = self.cached(name)
+        if path is not None or self.source is None or self.read_only:
+            return path, epoch
+        os.makedirs(self.cache_dir, exist_ok = True)
+        return self.download(name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--folder', default = f'../Models/{MODEL_FOLDER}', type = str, required = False)
+    args = parser.parse_args()
+    # write the manifest of a checkpoint folder, ie: before publishing it as a model source
+    manifest = build_manifest(args.folder)
+    ModelStore(args.folder, source = None).write_manifest(manifest)
+    print(f'manifest of {len(manifest["models"])} models written to {os.path.join(args.folder, MANIFEST)}')
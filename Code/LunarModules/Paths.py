@@ -0,0 +1,94 @@
+"""
+Paths.py
+Locations of the data, models and results of a project, passed explicitly to every step of the pipeline instead of
+each step finding them with os.chdir('..') and os.getcwd().
+
+The default project root is the folder above Code/, found from the location of this file rather than from the working
+directory, so a step gives the same paths whichever directory it is started from and nothing changes the working
+directory of the process. Pipelines on different roots can run in threads or worker pools of one process, ie:
+    paths = ProjectPaths('/scratch/run1')
+    run_datasplit(SOURCE = 'ground', paths = paths)
+    RUN_MODEL_LOOP(TRAIN = True, paths = paths)
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import os
+
+from LunarModules.ModelStore import MODEL_FOLDER
+
+# Code/ and the project root above it
+CODE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_PATH = os.path.dirname(CODE_PATH)
+
+
+class ProjectPaths:
+    '''
+    Folders of one project root:
+        <base>/Data                                          dataset (images/render, images/train/render, ...)
+        <base>/Models/lunar_surface_segmentation_models     checkpoints (LunarModules/ModelStore.py)
+        <base>/Models/prediction_cache                       predicted masks (LunarModules/PredictionCache.py)
+        <base>/Results                                       results csv files, training curves, timings
+    and the code folder holding experiment_config.json
+    '''
+    def __init__(self, base = None, data = None, code = None):
+        '''
+        :param base: project root, None for the folder above Code/
+        :param data: data folder, None for <base>/Data
+        :param code: code folder, None for the Code/ folder of this checkout
+        '''
+        self.base = BASE_PATH if base is None else os.path.abspath(base)
+        self.data = os.path.join(self.base, 'Data') if data is None else os.path.abspath(data)
+        self.code = CODE_PATH if code is None else os.path.abspath(code)
+        self.models = os.path.join(self.base, 'Models')
+        self.results = os.path.join(self.base, 'Results')
+
+    def __repr__(self):
+        return f'ProjectPaths(base={self.base!r}, data={self.data!r}, code={self.code!r})'
+
+    @property
+    def model_cache(self):
+        return os.path.join(self.models, MODEL_FOLDER)
+
+    @property
+    def prediction_cache(self):
+        return os.path.join(self.models, 'prediction_cache')
+
+    @property
+    def render(self):
+        '''
+        folder of the downloaded (or generated) renders, empty or missing until the data is there
+        '''
+        return os.path.join(self.data, 'images', 'render')
+
+    @property
+    def pyramid(self):
+        return os.path.join(self.data, 'pyramid')
+
+    @property
+    def experiment_config(self):
+        return os.path.join(self.code, 'experiment_config.json')
+
+    def split(self, split):
+        '''
+        :param split: 'train', 'val', 'test' or 'real'
+        :return: image folder, mask folder of the split
+        '''
+        if split == 'real':
+            return os.path.join(self.data, 'images', 'real', 'real_img'), os.path.join(self.data, 'images', 'real', 'real_mask')
+        return os.path.join(self.data, 'images', split, 'render'), os.path.join(self.data, 'images', split, 'mask')
+
+    def has_data(self):
+        return os.path.exists(self.render) and len(os.listdir(self.render)) > 0
+
+    def is_split(self):
+        return os.path.exists(os.path.join(self.data, 'images', 'train'))
+
+    def make_dirs(self):
+        '''
+        create the folders the steps write to
+        :return: self
+        '''
+        for folder in [self.data, self.models, self.results]:
+            os.makedirs(folder, exist_ok = True)
+        return self
@@ -9,6 +9,8 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from LunarModules.ImageProcessor import ImageProcessor
+from LunarModules.ImagePyramid import resolve_folder
+from LunarModules.PredictionCache import predict_masks
 import seaborn as sns
 import os
 import random
@@ -22,13 +24,33 @@ class Plotter:
     '''
     Object to handle plotting of images.
     '''
-    def __init__(self, log_file=None):
+    def __init__(self, log_file=None, prediction_cache=None):
         '''
         Params:
             self: instance of object
             log_file (str): default is None to not have logging, otherwise, specify logging path ../filepath/log.log
+            prediction_cache (PredictionCache): default is None to always predict, otherwise predicted masks are read from/saved to it
 
         '''
+        self.prediction_cache = prediction_cache
+
+    def predict_one_hot(self, model, sample_images):
+        """
+        Function to predict the mask of the first image, through the prediction cache
+
+        Parameters:
+            model: instance of model object (Model or Pretrained_Model)
+            sample_images: images in np array (n, x, y, 3)
+
+        Return:
+            one hot encoded predicted mask (x, y, 4)
+        """
+        img_tensor = torch.from_numpy(sample_images[:1]).float()
+
+        # Change ordering, channels first then img size
+        img_tensor = img_tensor.permute(0, 3, 1, 2)
+        predicted_mask = predict_masks(model, img_tensor, self.prediction_cache)[0]
+        return np.eye(4, dtype=np.float32)[predicted_mask]
     
     #Sanity check, view few mages
     def peek_images(self, sample_images, sample_masks=None, encode=None, color_scale=None, file_name=None, mask_name=None, predict=None, model=None, sample_images2=None, model_alt=None, test_type=None):
@@ -101,20 +123,8 @@ class Plotter:
 
             img_processor = ImageProcessor()
 
-            img_tensor = torch.from_numpy(sample_images).float()
-
-            # Change ordering, channels first then img size
-            img_tensor = img_tensor.permute(0, 3, 1, 2)
-            device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-            img_tensor = img_tensor.to(device)
-            
             # Predict image
-            predicted_image = model.model(img_tensor.float())
-            predicted_image = torch.softmax(predicted_image.float(), dim = 1)
-            predicted_image = predicted_image.permute(0, 2, 3, 1)
-            predicted_image = predicted_image.cpu().detach().numpy()
-            predicted_image = predicted_image[0,::,::,::]
-            predicted_image = img_processor.mask_argmax(predicted_image)
+            predicted_image = self.predict_one_hot(model, sample_images)
 
             # Argmax & Reverse one hot encode predicted mask
             predicted_image_decoded = img_processor.reverse_one_hot_encode(predicted_image)
@@ -208,21 +218,8 @@ class Plotter:
 
         img_processor = ImageProcessor()
 
-        img_tensor = torch.from_numpy(sample_images).float()
-
-        # Change ordering, channels first then img size
-        img_tensor = img_tensor.permute(0, 3, 1, 2)
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-        img_tensor = img_tensor.to(device)
-        
-        # Predict image
-        predicted_image = model.model(img_tensor.float())
-        predicted_image = torch.softmax(predicted_image.float(), dim = 1)
-        predicted_image = predicted_image.permute(0, 2, 3, 1)
-        predicted_image = predicted_image.cpu().detach().numpy()
-        predicted_image = predicted_image[0,::,::,::]
-        predicted_image = img_processor.rescale(predicted_image)
-        predicted_image = img_processor.mask_argmax(predicted_image)
+        # Predict image, the same one as peek_images so it comes from the prediction cache
+        predicted_image = self.predict_one_hot(model, sample_images)
 
         # Argmax & Reverse one hot encode predicted mask
         predicted_image_decoded = img_processor.reverse_one_hot_encode(predicted_image)
@@ -340,7 +337,7 @@ class Plotter:
 
         # plt.show()
 
-    def sanity_check(self, sample_images, sample_masks=None, encode=None, color_scale=None, predict=None, model=None, model_alt=None, predicted_breakdown=None, imsize=None, imsize_alt=None, test_type=None):
+    def sanity_check(self, sample_images, sample_masks=None, encode=None, color_scale=None, predict=None, model=None, model_alt=None, predicted_breakdown=None, imsize=None, imsize_alt=None, test_type=None, pyramid_root=None):
         """
         Function to get a training set (or validation set if given validation filepaths) and calls plotting functions
         
@@ -353,10 +350,17 @@ class Plotter:
             mask_name: filename to display in mask plot tile
             predict: Boolean, set to True if want to show prediction plots
             model: instance of model object to use .predict() on
+            pyramid_root: optional root of the ImagePyramid store, pre-resized images at imsize are read from it
 
         Return:
             None
         """
+        if sample_masks is not None and resolve_folder(sample_masks, imsize, pyramid_root) != sample_masks:
+            sample_images = resolve_folder(sample_images, imsize, pyramid_root)
+            sample_masks = resolve_folder(sample_masks, imsize, pyramid_root)
+        elif sample_masks is None:
+            sample_images = resolve_folder(sample_images, imsize, pyramid_root)
+
         image_number = random.randint(0, len(os.listdir(sample_images))-1)
 
         file_name = sorted(os.listdir(sample_images))[image_number]
@@ -368,11 +372,11 @@ class Plotter:
             mask_file = sorted(os.listdir(sample_masks))[image_number]
             mask = np.array(plt.imread(sample_masks + mask_file))
 
-        if imsize is not None and sample_masks is not None:
-            image =  cv2.resize(image, (imsize, imsize))
-            mask =  cv2.resize(mask, (imsize, imsize))
-        elif imsize is not None and sample_masks is None:
+        # masks are resized with nearest neighbour so the class colours aren't blended
+        if imsize is not None and image.shape[:2] != (imsize, imsize):
             image =  cv2.resize(image, (imsize, imsize))
+        if imsize is not None and sample_masks is not None and mask.shape[:2] != (imsize, imsize):
+            mask =  cv2.resize(mask, (imsize, imsize), interpolation=cv2.INTER_NEAREST)
 
         image1 = copy.deepcopy(image)
 
@@ -380,7 +384,7 @@ class Plotter:
             image2 = copy.deepcopy(image)
             if imsize_alt is not None and sample_masks is not None:
                 image2 =  cv2.resize(image, (imsize_alt, imsize_alt))
-                mask =  cv2.resize(mask, (imsize_alt, imsize_alt))
+                mask =  cv2.resize(mask, (imsize_alt, imsize_alt), interpolation=cv2.INTER_NEAREST)
             elif imsize_alt is not None and sample_masks is None:
                 image2 =  cv2.resize(image, (imsize_alt, imsize_alt))
         else:
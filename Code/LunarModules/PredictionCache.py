@@ -0,0 +1,197 @@
+"""
+PredictionCache.py
+Cache of predicted class masks, so the plots and stats that predict the same images with the same checkpoint again
+(Plotter.sanity_check, utils.plot_prediction, utils.get_real_stats) only run the network for images they haven't seen.
+
+An entry is keyed by
+    (hash of the network input, sha256 of the checkpoint, imsize)
+the input is the preprocessed (3, imsize, imsize) float32 image, so the same file read and resized the same way gives
+the same key in every caller, and the checkpoint sha256 is the one of the ModelStore manifest, so a retrained or
+re-downloaded model never gets the masks of the previous one. A model whose weights don't come from a checkpoint (not
+loaded yet, or being trained) is never cached.
+
+Masks are stored as single channel PNGs of class indices (a few kB at 256x256, instead of 1 MB for the float32 one hot
+prediction), in memory or in a folder so they are kept between runs, ie: Models/prediction_cache. When the entries go
+over max_bytes the least recently used ones are evicted.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import torch
+
+from LunarModules.Inference import predict_batch
+
+# caches of this process by folder, see shared_cache
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def image_hash(image):
+    '''
+    :param image: network input (3, h, w), numpy or tensor
+    :return: hex digest of its shape and float32 values
+    '''
+    if torch.is_tensor(image):
+        image = image.detach().cpu().numpy()
+    image = np.ascontiguousarray(image, dtype = np.float32)
+    digest = hashlib.blake2b(str(image.shape).encode(), digest_size = 16)
+    digest.update(image.data)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    '''
+    LRU cache of class index masks, in memory (cache_dir None) or in a folder
+    ie: cache = PredictionCache('../Models/prediction_cache'); masks = predict_masks(model, images, cache)
+    '''
+    def __init__(self, cache_dir = None, max_bytes = 64 * 2**20):
+        '''
+        :param cache_dir: folder of the cached masks, None to keep them in memory for the life of the object
+        :param max_bytes: most bytes of encoded masks to keep
+        '''
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # key -> encoded mask (in memory) or its size (in a folder), least recently used first
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok = True)
+            files = [os.path.join(cache_dir, x) for x in os.listdir(cache_dir) if x.endswith('.png')]
+            for file in sorted(files, key = os.path.getmtime):
+                self.entries[os.path.basename(file)[:-len('.png')]] = os.path.getsize(file)
+                self.bytes += os.path.getsize(file)
+            with self.lock:
+                self.evict()
+
+    @staticmethod
+    def key(image, checkpoint, imsize):
+        '''
+        :param image: network input (3, imsize, imsize)
+        :param checkpoint: sha256 of the checkpoint of the model
+        :param imsize: input size of the model
+        :return: cache key
+        '''
+        return f'{image_hash(image)}_{checkpoint[:16]}_{imsize}'
+
+    def size(self, entry):
+        return entry if self.cache_dir is not None else len(entry)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.png')
+
+    def get(self, key):
+        '''
+        :param key: cache key
+        :return: (h, w) uint8 class index mask, None if it isn't cached
+        '''
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            if self.cache_dir is None:
+                encoded = self.entries[key]
+            else:
+                try:
+                    with open(self.path(key), 'rb') as f:
+                        encoded = f.read()
+                    # the file times are the LRU order of the next run
+                    os.utime(self.path(key))
+                except FileNotFoundError:
+                    self.bytes -= self.entries.pop(key)
+                    self.misses += 1
+                    return None
+            self.hits += 1
+        return cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_UNCHANGED)
+
+    def put(self, key, mask):
+        '''
+        :param key: cache key
+        :param mask: (h, w) class index mask
+        :return: none
+        '''
+        encoded = cv2.imencode('.png', np.ascontiguousarray(mask, dtype = np.uint8))[1].tobytes()
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.size(self.entries.pop(key))
+            if self.cache_dir is None:
+                self.entries[key] = encoded
+            else:
+                with open(self.path(key) + '.tmp', 'wb') as f:
+                    f.write(encoded)
+                os.replace(self.path(key) + '.tmp', self.path(key))
+                self.entries[key] = len(encoded)
+            self.bytes += len(encoded)
+            self.evict()
+
+    def evict(self):
+        '''
+        drop the least recently used entries until the cache fits in max_bytes, call with the lock held
+        '''
+        while self.bytes > self.max_bytes and len(self.entries) > 0:
+            key, entry = self.entries.popitem(last = False)
+            self.bytes -= self.size(entry)
+            if self.cache_dir is not None and os.path.exists(self.path(key)):
+                os.remove(self.path(key))
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            if self.cache_dir is not None:
+                for key in self.entries:
+                    if os.path.exists(self.path(key)):
+                        os.remove(self.path(key))
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+def shared_cache(cache_dir, max_bytes = 64 * 2**20):
+    '''
+    one PredictionCache per folder in this process, so every caller counts against the same LRU
+    :param cache_dir: folder of the cache, ie: ProjectPaths().prediction_cache
+    :return: PredictionCache
+    '''
+    cache_dir = os.path.abspath(cache_dir)
+    with _CACHES_LOCK:
+        if cache_dir not in _CACHES:
+            _CACHES[cache_dir] = PredictionCache(cache_dir, max_bytes)
+        return _CACHES[cache_dir]
+
+
+def predict_masks(model, images, cache = None, device = None):
+    '''
+    class index masks of a batch, only the images that aren't cached go through the network
+    :param model: Model or Pretrained_Model, cached only if it was loaded from a checkpoint (model.checkpoint_sha256)
+    :param images: (n, 3, imsize, imsize) network inputs, numpy or tensor
+    :param cache: PredictionCache, None to always predict
+    :param device: pytorch device, None for the device of the network
+    :return: (n, imsize, imsize) uint8 class index masks, indices in the order of CLASS_MAP
+    '''
+    checkpoint = getattr(model, 'checkpoint_sha256', None)
+    if cache is None or checkpoint is None:
+        return predict_batch(model.model, images, device)
+
+    keys = [cache.key(image, checkpoint, images.shape[-1]) for image in images]
+    masks = [cache.get(key) for key in keys]
+    missing = [i for i, mask in enumerate(masks) if mask is None]
+    if len(missing) > 0:
+        predicted = predict_batch(model.model, images[missing], device)
+        for i, mask in zip(missing, predicted):
+            cache.put(keys[i], mask)
+            masks[i] = mask
+    return np.stack(masks)
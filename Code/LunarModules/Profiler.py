@@ -0,0 +1,245 @@
+"""
+Profiler.py
+Per-stage step timing for the training loops, to tell whether a run is input-bound or compute-bound.
+
+Every train step is split into data_wait (waiting on the DataLoader), h2d (host to device copy), augment (batch
+transform on device), forward, backward, optimizer and metrics. Totals are kept per epoch and printed as a summary
+table. Optionally the first steps are also recorded with torch.profiler and exported as a Chrome trace
+(open in chrome://tracing or https://ui.perfetto.dev).
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import torch
+
+STAGES = ['data_wait', 'h2d', 'augment', 'forward', 'backward', 'optimizer', 'metrics']
+
+
+class StepTimer:
+    '''
+    Accumulates wall time per training stage, ie:
+        timer = StepTimer(device)
+        timer.start_epoch(e)
+        for x, y in timer.iterate(loader, device):   # data_wait + h2d
+            with timer.stage('forward'):
+                ...
+        timer.end_epoch()
+    '''
+    def __init__(self, device = None, enabled = True, trace_path = None, trace_steps = 5, input_bound_threshold = 0.3, verbose = True):
+        '''
+        :param device: training device, CUDA is synchronized at stage boundaries so async kernels are timed correctly
+        :param enabled: if False every call is a no-op
+        :param trace_path: optional .json path, the first epoch's steps are recorded with torch.profiler and exported as
+                           a Chrome trace there
+        :param trace_steps: number of steps to record in the trace (after 1 wait and 1 warmup step)
+        :param input_bound_threshold: share of the step time spent waiting on data above which an epoch is input-bound
+        :param verbose: print the summary table at the end of every epoch
+        '''
+        self.device = torch.device(device) if device is not None else None
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.trace_steps = trace_steps
+        self.input_bound_threshold = input_bound_threshold
+        self.verbose = verbose
+
+        self.summaries = []
+        self.totals = {}
+        self.steps = 0
+        self.epoch = None
+        self.epoch_t0 = None
+        self.open_stage = None
+        self.profiler = None
+        self.record = None
+
+    def sync(self):
+        if self.device is not None and self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+
+    def begin(self, name):
+        '''
+        start timing a stage, closes the stage that is still open
+        :param name: stage name, one of STAGES
+        :return:
+        '''
+        if not self.enabled:
+            return
+        self.end()
+        self.sync()
+        self.record = torch.profiler.record_function(name) if self.profiler is not None else None
+        if self.record is not None:
+            self.record.__enter__()
+        self.open_stage = (name, time.perf_counter())
+
+    def end(self):
+        '''
+        stop timing the open stage, if any
+        :return:
+        '''
+        if not self.enabled or self.open_stage is None:
+            return
+        self.sync()
+        name, t0 = self.open_stage
+        self.totals[name] = self.totals.get(name, 0) + time.perf_counter() - t0
+        if self.record is not None:
+            self.record.__exit__(None, None, None)
+            self.record = None
+        self.open_stage = None
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        time the body of a with block as a stage
+        :param name: stage name, one of STAGES
+        '''
+        if not self.enabled:
+            yield
+            return
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def iterate(self, data_loader, device = None):
+        '''
+        wrap a DataLoader so fetching a batch is timed as data_wait and, if device is given, moving it there as h2d
+        :param data_loader: DataLoader
+        :param device: optional device to move (x, y) batches to
+        :return: iterable with the DataLoader's length
+        '''
+        return TimedLoader(self, data_loader, device)
+
+    def end_step(self):
+        '''
+        count a finished step, advances the trace schedule
+        :return:
+        '''
+        if not self.enabled:
+            return
+        self.end()
+        self.steps += 1
+        if self.profiler is not None:
+            self.profiler.step()
+
+    def start_epoch(self, epoch):
+        '''
+        reset the per epoch totals, the trace is recorded during the first profiled epoch
+        :param epoch: epoch number
+        :return:
+        '''
+        if not self.enabled:
+            return
+        self.epoch = epoch
+        self.totals = {}
+        self.steps = 0
+        if self.trace_path is not None and len(self.summaries) == 0:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.device is not None and self.device.type == 'cuda':
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            os.makedirs(os.path.dirname(os.path.abspath(self.trace_path)), exist_ok = True)
+            self.profiler = torch.profiler.profile(
+                activities = activities,
+                schedule = torch.profiler.schedule(wait = 1, warmup = 1, active = self.trace_steps, repeat = 1),
+                on_trace_ready = lambda prof: prof.export_chrome_trace(self.trace_path),
+            )
+            self.profiler.start()
+        self.sync()
+        self.epoch_t0 = time.perf_counter()
+
+    def end_epoch(self):
+        '''
+        close the epoch: store its summary row, stop the trace and print the table
+        :return: summary row of the epoch
+        '''
+        if not self.enabled:
+            return None
+        self.end()
+        self.sync()
+        wall = time.perf_counter() - self.epoch_t0
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+            print(f'chrome trace saved to {self.trace_path}')
+
+        row = {'epoch': self.epoch, 'steps': self.steps, 'wall_s': round(wall, 3)}
+        for name in STAGES:
+            row[f'{name}_s'] = round(self.totals.get(name, 0), 3)
+        row['other_s'] = round(max(wall - sum(self.totals.values()), 0), 3)
+        for name in STAGES:
+            row[f'{name}_ms_per_step'] = round(1000 * self.totals.get(name, 0) / max(self.steps, 1), 2)
+        row['data_wait_pct'] = round(100 * self.totals.get('data_wait', 0) / max(wall, 1e-9), 1)
+        row['verdict'] = 'input-bound' if row['data_wait_pct'] >= 100 * self.input_bound_threshold else 'compute-bound'
+        self.summaries.append(row)
+
+        if self.verbose:
+            self.print_epoch(row)
+        return row
+
+    def print_epoch(self, row):
+        '''
+        print the stage breakdown of one epoch
+        :param row: summary row from end_epoch
+        :return:
+        '''
+        table = pd.DataFrame([{
+            'stage': name,
+            'total_s': row[f'{name}_s'],
+            'ms/step': row.get(f'{name}_ms_per_step', round(1000 * row[f'{name}_s'] / max(row['steps'], 1), 2)),
+            'share_%': round(100 * row[f'{name}_s'] / max(row['wall_s'], 1e-9), 1),
+        } for name in STAGES + ['other']])
+        print(f"\nStep timing, epoch {row['epoch']} ({row['steps']} steps, {row['wall_s']}s):")
+        print(table.to_string(index = False))
+        print(f"-> {row['verdict']} ({row['data_wait_pct']}% of the epoch waiting on data)")
+
+    def summary_table(self):
+        '''
+        :return: dataframe with one row per profiled epoch
+        '''
+        return pd.DataFrame(self.summaries)
+
+    def save(self, path):
+        '''
+        save the per epoch summary to csv
+        :param path: csv path
+        :return:
+        '''
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+        self.summary_table().to_csv(path, index = False)
+        print(f'step timing saved to {path}')
+
+
+class TimedLoader:
+    '''
+    DataLoader wrapper used by StepTimer.iterate, keeps len() so progress bars still know the total
+    '''
+    def __init__(self, timer, data_loader, device = None):
+        self.timer = timer
+        self.data_loader = data_loader
+        self.device = device
+
+    def __len__(self):
+        return len(self.data_loader)
+
+    def __iter__(self):
+        batches = iter(self.data_loader)
+        while True:
+            self.timer.begin('data_wait')
+            try:
+                batch = next(batches)
+            except StopIteration:
+                self.timer.end()
+                return
+            if self.device is not None:
+                self.timer.begin('h2d')
+                batch = [b.to(self.device) for b in batch]
+            self.timer.end()
+            yield batch
+            self.timer.end_step()
+
+
+NULL_TIMER = StepTimer(enabled = False)
@@ -0,0 +1,202 @@
+"""
+Sampling.py
+Per image class pixel counts, and what they are used for: oversampling the images with rare classes during training
+and stratifying the train/val/test split.
+
+Sky and unlabeled ground cover most of every render while big rocks are a few percent of the pixels in a few images, so
+with uniform shuffling most batches hold almost no big rock pixels. BalancedSampler draws images with replacement,
+weighted by
+    weight_i = sum over classes c of share_ic * (1 / share_c) ** power
+where share_ic is the share of image i's pixels of class c and share_c the share of all pixels of class c: with
+power = 1 every class is expected to get the same number of pixels per epoch, power = 0 is uniform sampling.
+
+The counts are read from Data/images_summary.csv (written by EDA.py from the clean masks) or counted from the masks of a
+folder and cached in <mask_folder>_class_counts.csv.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import Sampler
+
+from LunarModules.Distributed import get_rank, get_world_size
+from LunarModules.ImageProcessor import CLASS_MAP
+from LunarModules.TrainTestSplit import file_id
+
+# class names in the order of CLASS_MAP, the columns of the count tables
+CLASSES = list(CLASS_MAP.name)
+# images_summary.csv column of every class, the colours of the classes in the clean masks
+SUMMARY_COLUMNS = {'reds': 'Sky', 'blues': 'Big Rocks', 'greens': 'Small Rocks', 'blacks': 'Unlabeled'}
+
+
+def read_class_counts(DATA_PATH):
+    '''
+    class pixel counts of every image from the EDA summary
+    :param DATA_PATH: data folder holding images_summary.csv
+    :return: dataframe indexed by image id with a column per class, None if EDA hasn't been run
+    '''
+    summary_path = os.path.join(DATA_PATH, 'images_summary.csv')
+    if not os.path.exists(summary_path):
+        return None
+    summary = pd.read_csv(summary_path, index_col = 0)
+    counts = summary.rename(columns = SUMMARY_COLUMNS)[CLASSES]
+    counts.index = pd.Index(summary.image.apply(file_id), name = 'id')
+    return counts
+
+
+def mask_class_counts(mask_folder, cache = True):
+    '''
+    class pixel counts of every mask of a folder
+    :param mask_folder: folder of RGB masks, ie: Data/images/train/mask
+    :param cache: read/write the counts from/to <mask_folder>_class_counts.csv
+    :return: dataframe indexed by image id with a column per class
+    '''
+    import matplotlib.pyplot as plt
+    from LunarModules.ImageProcessor import ImageProcessor
+
+    cache_path = mask_folder.rstrip('/') + '_class_counts.csv'
+    if cache and os.path.exists(cache_path):
+        return pd.read_csv(cache_path, index_col = 0)
+
+    img_processor = ImageProcessor()
+    masks = sorted([item for item in os.listdir(mask_folder) if item.endswith('.png')])
+    rows = []
+    for msk in masks:
+        index = img_processor.encode_mask(plt.imread(os.path.join(mask_folder, msk)), output = 'index')
+        rows.append(np.bincount(index.ravel(), minlength = 256)[:len(CLASSES)])
+    counts = pd.DataFrame(rows, columns = CLASSES, index = pd.Index([file_id(msk) for msk in masks], name = 'id'))
+    if cache:
+        counts.to_csv(cache_path)
+    return counts
+
+
+def class_counts(DATA_PATH, mask_folder):
+    '''
+    :return: counts of the EDA summary if there is one, otherwise of the masks of mask_folder
+    '''
+    counts = read_class_counts(DATA_PATH)
+    if counts is None:
+        print(f'no images_summary.csv in {DATA_PATH}, counting the classes of {mask_folder} ...')
+        counts = mask_class_counts(mask_folder)
+    return counts
+
+
+def image_weights(counts, power = 0.5, max_weight = 10.0):
+    '''
+    sampling weight of every image, see the top of this file
+    :param counts: class pixel counts, one row per image
+    :param power: 0 for uniform weights, 1 to balance the pixels of every class
+    :param max_weight: cap of a weight relative to the mean weight, so a handful of images isn't drawn over and over
+    :return: numpy array of weights, mean 1
+    '''
+    counts = np.asarray(counts, dtype = np.float64)
+    shares = counts / np.maximum(counts.sum(axis = 1, keepdims = True), 1)
+    class_shares = counts.sum(axis = 0) / max(counts.sum(), 1)
+    class_weights = np.where(class_shares > 0, 1 / np.maximum(class_shares, 1e-12), 0) ** power
+    weights = shares @ class_weights
+    weights = weights / weights.mean()
+    if max_weight is not None:
+        weights = np.minimum(weights, max_weight)
+        weights = weights / weights.mean()
+    return weights
+
+
+def dataset_weights(dataset, counts, power = 0.5, max_weight = 10.0):
+    '''
+    :param dataset: CustomDataLoader, its images are matched to the counts by id
+    :param counts: class pixel counts indexed by image id
+    :return: weight of every image of the dataset, images missing from the counts get the mean weight
+    '''
+    ids = [file_id(img) for img in dataset.images_list]
+    known = [i for i in ids if i in counts.index]
+    weights = pd.Series(image_weights(counts.loc[known], power, max_weight), index = known)
+    if len(known) < len(ids):
+        print(f'{len(ids) - len(known)} images have no class counts, sampling them with the mean weight')
+    return np.array([weights.get(i, 1.0) for i in ids])
+
+
+class BalancedSampler(Sampler):
+    '''
+    Draws num_samples images per epoch with replacement, with probability proportional to their weights. The same
+    draws are made on every process from seed + epoch and each rank takes its share, so it also replaces the
+    DistributedSampler when training distributed. Call set_epoch every epoch (Trainer does, see set_sampler_epoch).
+    ie: DataLoader(data, batch_size = 32, sampler = BalancedSampler(dataset_weights(data, counts)))
+    '''
+    def __init__(self, weights, num_samples = None, seed = 42, rank = None, world_size = None):
+        '''
+        :param weights: weight of every image
+        :param num_samples: images per epoch over all processes, None for one per image
+        :param seed: seed of the draws
+        :param rank: rank of this process, None for the current one
+        :param world_size: number of processes, None for the current one
+        '''
+        self.weights = torch.as_tensor(weights, dtype = torch.float64)
+        self.num_samples = len(self.weights) if num_samples is None else num_samples
+        self.seed = seed
+        self.rank = get_rank() if rank is None else rank
+        self.world_size = get_world_size() if world_size is None else world_size
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return math.ceil(self.num_samples / self.world_size)
+
+    def __iter__(self):
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        # pad so every rank gets the same number of samples
+        indices = torch.multinomial(self.weights, len(self) * self.world_size, replacement = True, generator = generator)
+        return iter(indices[self.rank::self.world_size].tolist())
+
+
+def stratify_labels(counts, classes = ('Big Rocks', 'Small Rocks'), n_bins = 4, min_count = 4):
+    '''
+    stratum of every image for a stratified split: the quantile bin of its share of each of classes. Bins are merged
+    (fewer quantiles, then fewer classes) until every stratum has at least min_count images
+    :param counts: class pixel counts, one row per image
+    :param classes: classes whose shares are binned
+    :param n_bins: quantile bins per class
+    :param min_count: smallest stratum size, train_test_split needs 2 per stratum in each of the two splits
+    :return: series of stratum labels with the index of counts, None if the images can't be stratified
+    '''
+    shares = counts.div(counts.sum(axis = 1).clip(lower = 1), axis = 0)
+    for n_classes in range(len(classes), 0, -1):
+        for bins in range(n_bins, 1, -1):
+            labels = pd.Series('', index = counts.index)
+            for cls in classes[:n_classes]:
+                binned = pd.qcut(shares[cls].rank(method = 'first'), bins, labels = False)
+                labels = labels + cls[0] + binned.astype(int).astype(str)
+            if labels.value_counts().min() >= min_count:
+                return labels
+    print('too few images to stratify the split')
+    return None
+
+
+def split_strata(ids, counts, min_count = 4, **kwargs):
+    '''
+    stratum of every image to split, images without class counts (ie: added after EDA was run) are a stratum of their own
+    :param ids: series of image ids
+    :param counts: class pixel counts indexed by image id
+    :param min_count: smallest stratum size, see stratify_labels
+    :param kwargs: other stratify_labels arguments
+    :return: series of stratum labels with the index of ids, None if the images can't be stratified
+    '''
+    known = ids.isin(counts.index)
+    missing = sorted(ids[~known])
+    if known.sum() == 0:
+        raise ValueError(f'none of the {len(ids)} images have class counts, update the counts (re-run EDA.py or remove the stale class counts csv)')
+    if 0 < len(missing) < min_count:
+        raise ValueError(f'{len(missing)} images have no class counts, too few for a stratum of their own: {missing}. Update the counts (re-run EDA.py or remove the stale class counts csv)')
+
+    labels = stratify_labels(counts.loc[ids[known]].set_axis(ids.index[known]), min_count = min_count, **kwargs)
+    if labels is None:
+        return None
+    if len(missing) > 0:
+        print(f'{len(missing)} images have no class counts, they are split as one stratum: {missing[:10]}' + (' ...' if len(missing) > 10 else ''))
+    return labels.reindex(ids.index).fillna('no counts')
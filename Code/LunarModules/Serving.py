@@ -0,0 +1,376 @@
+"""
+Serving.py
+Local HTTP inference server for the trained models, with dynamic batching of concurrent requests.
+
+Every model gets a DynamicBatcher: requests are queued, and one thread per model takes the first waiting request, then
+keeps adding requests until the batch has max_batch_size images or max_wait_ms passed since the first one, and runs
+the whole batch in one forward pass. Under load the batches fill up (throughput of batched inference), a single
+request only waits max_wait_ms.
+
+Endpoints (stdlib http.server, one thread per connection):
+    POST /predict/<model>          body: PNG/JPEG bytes of an image
+                                   returns the class index mask as a single channel PNG at the size of the image
+                                   (0 sky, 1 big rocks, 2 small rocks, 3 unlabeled, the order of CLASS_MAP), or
+                                   the RGB mask with ?format=rgb (any other format is a 400). Headers X-Latency-ms
+                                   and X-Batch-Size
+    GET  /metrics                  per model: requests, batches, mean batch size, queue depth, latency percentiles
+    GET  /health                   loaded models
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import cv2
+import numpy as np
+
+from LunarModules.Inference import load_network, preprocess, predict_batch, colour_mask
+from LunarModules.ModelStore import DEFAULT_MODEL_SOURCE
+
+# ?format= of the predicted masks, see encode_mask
+MASK_FORMATS = ['index', 'rgb']
+
+
+class ServingMetrics:
+    '''
+    Thread safe counters and latency samples of one model (the last `window` requests/batches)
+    '''
+    def __init__(self, window = 10000):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen = window)
+        self.queue_waits = deque(maxlen = window)
+        self.batch_sizes = deque(maxlen = window)
+        self.batch_times = deque(maxlen = window)
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+
+    def record_submit(self, queue_depth):
+        with self.lock:
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def record_batch(self, queue_waits, latencies, batch_time):
+        '''
+        :param queue_waits: time each request of the batch waited in the queue, in s
+        :param latencies: time from submit to result of each request, in s
+        :param batch_time: time of the forward pass, in s
+        '''
+        with self.lock:
+            self.queue_waits.extend(queue_waits)
+            self.latencies.extend(latencies)
+            self.batch_sizes.append(len(latencies))
+            self.batch_times.append(batch_time)
+            self.requests += len(latencies)
+            self.batches += 1
+
+    def record_error(self, rejected = False):
+        with self.lock:
+            if rejected:
+                self.rejected += 1
+            else:
+                self.errors += 1
+
+    def snapshot(self, queue_depth = 0):
+        '''
+        :param queue_depth: current number of queued requests
+        :return: dict of counters and latency percentiles in ms
+        '''
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            waits = np.array(self.queue_waits) * 1000
+            snapshot = {
+                'requests': self.requests,
+                'batches': self.batches,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'queue_depth': queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'mean_batch_size': float(np.mean(self.batch_sizes)) if len(self.batch_sizes) > 0 else 0.0,
+                'mean_batch_ms': float(np.mean(self.batch_times) * 1000) if len(self.batch_times) > 0 else 0.0,
+            }
+        for name, values in [('latency', latencies), ('queue_wait', waits)]:
+            for q in [50, 90, 99]:
+                snapshot[f'{name}_p{q}_ms'] = float(np.percentile(values, q)) if len(values) > 0 else 0.0
+        return snapshot
+
+
+class DynamicBatcher:
+    '''
+    Queue of requests for one network, run in batches of up to max_batch_size by a worker thread
+    ie: batcher = DynamicBatcher('RESNET18_ground', network).start(); mask = batcher.submit(image).result()[0]
+    '''
+    def __init__(self, name, network, imsize = 256, max_batch_size = 8, max_wait_ms = 10, max_queue = 256):
+        '''
+        :param name: model name
+        :param network: network in eval mode, ie: from Inference.load_network
+        :param imsize: input size of the network
+        :param max_batch_size: most requests per forward pass
+        :param max_wait_ms: longest time the first request of a batch waits for more requests
+        :param max_queue: queued requests above which submit() rejects new ones (queue.Full)
+        '''
+        self.name = name
+        self.network = network
+        self.imsize = imsize
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue(maxsize = max_queue)
+        self.metrics = ServingMetrics()
+        self.thread = threading.Thread(target = self.run, name = f'batcher-{name}', daemon = True)
+        self.stopping = False
+        # held by submit() from the stopping check to the put and by stop() while it sets stopping, so no request is
+        # queued after stop() started
+        self.submit_lock = threading.Lock()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def queue_depth(self):
+        return self.requests.qsize()
+
+    def submit(self, image):
+        '''
+        queue a preprocessed image
+        :param image: (3, imsize, imsize) float32 array, see Inference.preprocess
+        :return: Future of (class index mask (imsize, imsize) uint8, size of the batch it ran in)
+        '''
+        future = Future()
+        with self.submit_lock:
+            if self.stopping:
+                raise RuntimeError(f'{self.name} is stopping')
+            try:
+                self.requests.put_nowait((image, future, time.perf_counter()))
+            except queue.Full:
+                self.metrics.record_error(rejected = True)
+                raise
+        self.metrics.record_submit(self.requests.qsize())
+        return future
+
+    def next_batch(self):
+        '''
+        block until a request arrives, then collect more until the batch is full or max_wait passed
+        :return: list of (image, future, submit time), empty when stopping
+        '''
+        first = self.requests.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self.requests.get(timeout = timeout) if timeout > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.stopping = True
+                break
+            batch.append(item)
+        return batch
+
+    def run(self):
+        while not self.stopping:
+            batch = self.next_batch()
+            if len(batch) == 0:
+                break
+            t0 = time.perf_counter()
+            try:
+                masks = predict_batch(self.network, np.stack([image for image, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                    self.metrics.record_error()
+                continue
+            t1 = time.perf_counter()
+            for (_, future, submitted), mask in zip(batch, masks):
+                future.set_result((mask, len(batch)))
+            self.metrics.record_batch([t0 - submitted for _, _, submitted in batch], [t1 - submitted for _, _, submitted in batch], t1 - t0)
+
+    def stop(self):
+        '''
+        stop the batcher thread after its current batch, the requests still queued fail
+        '''
+        with self.submit_lock:
+            self.stopping = True
+        if self.thread.is_alive():
+            # wakes the thread up if it waits on an empty queue. With a full queue it doesn't wait, and it sees
+            # stopping after the batch it is running, so this never blocks
+            try:
+                self.requests.put_nowait(None)
+            except queue.Full:
+                pass
+            self.thread.join()
+        while True:
+            try:
+                item = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError(f'{self.name} stopped'))
+                self.metrics.record_error()
+
+
+def load_batchers(names, paths = None, imsize = 256, max_batch_size = 8, max_wait_ms = 10, max_queue = 256, device = None, model_source = DEFAULT_MODEL_SOURCE):
+    '''
+    load the checkpoint of every model and start its batcher
+    :param names: model names, ie: ['RESNET18_ground', 'Unet_scratch_ground']
+    :param paths: ProjectPaths of the model cache
+    :return: dict model name -> DynamicBatcher
+    '''
+    batchers = {}
+    for name in names:
+        network, epoch = load_network(name, paths, device, imsize, model_source)
+        print(f'loaded {name} (epoch {epoch})')
+        batchers[name] = DynamicBatcher(name, network, imsize, max_batch_size, max_wait_ms, max_queue).start()
+    return batchers
+
+
+def decode_image(data):
+    '''
+    :param data: PNG/JPEG bytes
+    :return: RGB image (h, w, 3) float32 between 0 and 1 like plt.imread, None if it can't be decoded
+    '''
+    img = cv2.imdecode(np.frombuffer(data, dtype = np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB).astype(np.float32) / 255
+
+
+def encode_mask(mask, fmt = 'index'):
+    '''
+    :param mask: (h, w) class index mask
+    :param fmt: 'index' for a single channel PNG of class indices, 'rgb' for the mask in the class colours
+    :return: PNG bytes
+    '''
+    if fmt not in MASK_FORMATS:
+        raise ValueError(f'unknown mask format {fmt}, one of {MASK_FORMATS}')
+    if fmt == 'rgb':
+        mask = cv2.cvtColor(colour_mask(mask), cv2.COLOR_RGB2BGR)
+    return cv2.imencode('.png', mask)[1].tobytes()
+
+
+class InferenceServer:
+    '''
+    HTTP server in front of the batchers
+    ie: server = InferenceServer(load_batchers(['RESNET18_ground']), port = 8080); server.serve_forever()
+    '''
+    def __init__(self, batchers, host = '127.0.0.1', port = 8080, timeout = 30):
+        '''
+        :param batchers: dict model name -> DynamicBatcher
+        :param host: interface to listen on
+        :param port: port, 0 for any free port
+        :param timeout: seconds a request waits for its result before a 504
+        '''
+        self.batchers = batchers
+        self.timeout = timeout
+        self.httpd = ThreadingHTTPServer((host, port), self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def metrics(self):
+        return {name: batcher.metrics.snapshot(batcher.queue_depth()) for name, batcher in self.batchers.items()}
+
+    def predict(self, name, data, fmt = 'index'):
+        '''
+        :param name: model name
+        :param data: image bytes
+        :return: http status, body, extra headers
+        '''
+        if name not in self.batchers:
+            return 404, json.dumps({'error': f'unknown model {name}', 'models': list(self.batchers.keys())}).encode(), {}
+        if fmt not in MASK_FORMATS:
+            return 400, json.dumps({'error': f'unknown format {fmt}', 'formats': MASK_FORMATS}).encode(), {}
+        img = decode_image(data)
+        if img is None:
+            return 400, json.dumps({'error': 'the body is not a PNG/JPEG image'}).encode(), {}
+
+        t0 = time.perf_counter()
+        batcher = self.batchers[name]
+        try:
+            future = batcher.submit(preprocess(img, batcher.imsize))
+        except queue.Full:
+            return 503, json.dumps({'error': f'{name} queue is full'}).encode(), {}
+        except RuntimeError as e:
+            return 503, json.dumps({'error': str(e)}).encode(), {}
+        try:
+            mask, batch_size = future.result(timeout = self.timeout)
+        except FutureTimeoutError:
+            return 504, json.dumps({'error': 'timed out'}).encode(), {}
+        except Exception as e:
+            return 500, json.dumps({'error': str(e)}).encode(), {}
+        mask = cv2.resize(mask, (img.shape[1], img.shape[0]), interpolation = cv2.INTER_NEAREST)
+        headers = {'X-Latency-ms': f'{(time.perf_counter() - t0) * 1000:.2f}', 'X-Batch-Size': str(batch_size)}
+        return 200, encode_mask(mask, fmt), headers
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def send(self, status, body, content_type = 'application/json', headers = None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == '/metrics':
+                    self.send(200, json.dumps(server.metrics(), indent = 2).encode())
+                elif path == '/health':
+                    self.send(200, json.dumps({'status': 'ok', 'models': list(server.batchers.keys())}).encode())
+                else:
+                    self.send(404, json.dumps({'error': f'unknown path {path}'}).encode())
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not url.path.startswith('/predict/'):
+                    self.send(404, json.dumps({'error': f'unknown path {url.path}'}).encode())
+                    return
+                fmt = parse_qs(url.query).get('format', ['index'])[0]
+                status, body, headers = server.predict(url.path[len('/predict/'):], data, fmt)
+                self.send(status, body, 'image/png' if status == 200 else 'application/json', headers)
+
+            def log_message(self, format, *args):
+                # no line per request, the metrics endpoint has the totals
+                pass
+
+        return Handler
+
+    def start(self):
+        '''
+        serve in a background thread (ie: load tests in the same process)
+        :return: self
+        '''
+        self.thread = threading.Thread(target = self.httpd.serve_forever, name = 'inference-server', daemon = True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        if self.thread is not None:
+            self.httpd.shutdown()
+        self.httpd.server_close()
+        for batcher in self.batchers.values():
+            batcher.stop()
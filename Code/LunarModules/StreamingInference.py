@@ -0,0 +1,260 @@
+"""
+StreamingInference.py
+Asyncio pipeline for large offline prediction jobs, where decoding, inference and writing of the results overlap
+instead of running one after the other for every batch (Inference.predict_files, utils.get_real_stats).
+
+    files -> [decode + preprocess] -> queue -> [inference] -> queue -> [resize + encode + write] -> masks
+             decode_workers threads            1 consumer              write_workers threads
+
+Decoding and encoding run in a thread pool (cv2 releases the GIL while it decodes/encodes PNGs and resizes), the single
+inference consumer takes what is waiting in its input queue, up to batch_size images, and runs it in its own thread
+(torch releases the GIL too) so the event loop keeps feeding the other stages. The queues are bounded, a stage that is
+ahead blocks on put() until the next one catches up (backpressure), so memory stays at about queue_size images
+whatever the number of files.
+
+Every stage reports its utilization (busy time / wall time per worker) and the time it was blocked waiting for input
+(starved) or for room in the next queue (backpressure). The bottleneck is the stage with the highest utilization,
+the stages before it show backpressure and the ones after it are starved.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from LunarModules.Inference import load_network, read_image, preprocess, predict_batch, write_mask, list_images, mask_path
+from LunarModules.ModelStore import DEFAULT_MODEL_SOURCE
+
+# marks the end of a queue
+DONE = None
+
+
+class StageStats:
+    '''
+    Time a pipeline stage spent working and waiting
+    '''
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+
+    async def get(self, q):
+        t0 = time.perf_counter()
+        item = await q.get()
+        self.starved += time.perf_counter() - t0
+        return item
+
+    async def put(self, q, item):
+        t0 = time.perf_counter()
+        await q.put(item)
+        self.blocked += time.perf_counter() - t0
+
+    async def work(self, loop, pool, fn, *args):
+        '''
+        run fn(*args) in a thread pool and time it
+        '''
+        t0 = time.perf_counter()
+        result = await loop.run_in_executor(pool, fn, *args)
+        self.busy += time.perf_counter() - t0
+        return result
+
+    def row(self, wall):
+        return {
+            'stage': self.name,
+            'workers': self.workers,
+            'items': self.items,
+            'busy_s': round(self.busy, 3),
+            'utilization': round(self.busy / (wall * self.workers), 3) if wall > 0 else 0.0,
+            'starved_s': round(self.starved, 3),
+            'backpressure_s': round(self.blocked, 3),
+        }
+
+
+class StreamingPredictor:
+    '''
+    Overlapped decode -> inference -> write pipeline for one network
+    ie: StreamingPredictor(network, imsize = 256).run(files, '../Results/predictions'); predictor.print_report()
+    '''
+    def __init__(self, network, imsize = 256, batch_size = 8, decode_workers = 4, write_workers = 2, queue_size = 32, fmt = 'rgb'):
+        '''
+        :param network: network in eval mode, ie: from Inference.load_network
+        :param imsize: input size of the network
+        :param batch_size: most images per forward pass
+        :param decode_workers: threads reading and preprocessing images
+        :param write_workers: threads resizing, encoding and writing masks
+        :param queue_size: capacity of each queue between stages, in images
+        :param fmt: 'rgb' or 'index', see Inference.write_mask
+        '''
+        self.network = network
+        self.imsize = imsize
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.write_workers = write_workers
+        self.queue_size = queue_size
+        self.fmt = fmt
+        self.stats = []
+        self.queue_depths = {}
+        self.wall = 0.0
+
+    def decode(self, file):
+        img = read_image(file)
+        return file, img.shape[:2], preprocess(img, self.imsize)
+
+    def write(self, output_path, file, size, mask):
+        path = mask_path(output_path, file)
+        write_mask(path, mask, size, self.fmt)
+        return path
+
+    async def produce(self, files, q_files):
+        for file in files:
+            await q_files.put(file)
+        for _ in range(self.decode_workers):
+            await q_files.put(DONE)
+
+    async def decoder(self, loop, pool, stats, q_files, q_decoded):
+        while True:
+            file = await stats.get(q_files)
+            if file is DONE:
+                await q_decoded.put(DONE)
+                return
+            item = await stats.work(loop, pool, self.decode, file)
+            stats.items += 1
+            await stats.put(q_decoded, item)
+
+    async def inferer(self, loop, pool, stats, q_decoded, q_predicted):
+        remaining = self.decode_workers
+        while remaining > 0:
+            item = await stats.get(q_decoded)
+            batch = []
+            # batch what is already waiting, without waiting for more
+            while True:
+                if item is DONE:
+                    remaining -= 1
+                else:
+                    batch.append(item)
+                if len(batch) == self.batch_size or q_decoded.empty() or remaining == 0:
+                    break
+                item = q_decoded.get_nowait()
+            if len(batch) == 0:
+                continue
+            masks = await stats.work(loop, pool, predict_batch, self.network, np.stack([image for _, _, image in batch]))
+            stats.items += len(batch)
+            for (file, size, _), mask in zip(batch, masks):
+                await stats.put(q_predicted, (file, size, mask))
+        for _ in range(self.write_workers):
+            await q_predicted.put(DONE)
+
+    async def writer(self, loop, pool, stats, q_predicted, output_path, written):
+        while True:
+            item = await stats.get(q_predicted)
+            if item is DONE:
+                return
+            written.append(await stats.work(loop, pool, self.write, output_path, *item))
+            stats.items += 1
+
+    async def monitor(self, queues, interval = 0.05):
+        '''
+        sample the depth of every queue until cancelled
+        '''
+        samples = {name: [] for name in queues}
+        self.queue_depths = samples
+        while True:
+            for name, q in queues.items():
+                samples[name].append(q.qsize())
+            await asyncio.sleep(interval)
+
+    async def run_async(self, files, output_path):
+        '''
+        :param files: image paths
+        :param output_path: folder the masks are written to
+        :return: list of mask paths written
+        '''
+        os.makedirs(output_path, exist_ok = True)
+        loop = asyncio.get_running_loop()
+        q_files = asyncio.Queue(maxsize = self.queue_size)
+        q_decoded = asyncio.Queue(maxsize = self.queue_size)
+        q_predicted = asyncio.Queue(maxsize = self.queue_size)
+        decode_stats = StageStats('decode', self.decode_workers)
+        infer_stats = StageStats('inference', 1)
+        write_stats = StageStats('write', self.write_workers)
+        self.stats = [decode_stats, infer_stats, write_stats]
+        written = []
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = self.decode_workers, thread_name_prefix = 'decode') as decode_pool, \
+                ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'inference') as infer_pool, \
+                ThreadPoolExecutor(max_workers = self.write_workers, thread_name_prefix = 'write') as write_pool:
+            monitor = asyncio.ensure_future(self.monitor({'decoded': q_decoded, 'predicted': q_predicted}))
+            try:
+                await asyncio.gather(
+                    self.produce(files, q_files),
+                    *[self.decoder(loop, decode_pool, decode_stats, q_files, q_decoded) for _ in range(self.decode_workers)],
+                    self.inferer(loop, infer_pool, infer_stats, q_decoded, q_predicted),
+                    *[self.writer(loop, write_pool, write_stats, q_predicted, output_path, written) for _ in range(self.write_workers)],
+                )
+            finally:
+                monitor.cancel()
+        self.wall = time.perf_counter() - t0
+        return written
+
+    def run(self, files, output_path):
+        return asyncio.run(self.run_async(files, output_path))
+
+    def report(self):
+        '''
+        :return: dataframe of the stages of the last run, with the mean depth of the queue after each stage
+        '''
+        report = pd.DataFrame([stats.row(self.wall) for stats in self.stats])
+        depths = [self.queue_depths.get('decoded', []), self.queue_depths.get('predicted', []), []]
+        report['mean_queue_out'] = [round(float(np.mean(d)), 1) if len(d) > 0 else None for d in depths]
+        return report
+
+    def print_report(self):
+        report = self.report()
+        n_images = self.stats[-1].items if len(self.stats) > 0 else 0
+        print(f'{n_images} images in {self.wall:.2f}s ({n_images / self.wall if self.wall > 0 else 0:.2f} images/s)')
+        print(report.to_string(index = False))
+        print(f"bottleneck: {report.loc[report.utilization.idxmax(), 'stage']}")
+
+
+def stream_predict_folder(name, input_path, output_path, paths = None, imsize = 256, batch_size = 8, decode_workers = 4, write_workers = 2, queue_size = 32, fmt = 'rgb', device = None, model_source = DEFAULT_MODEL_SOURCE):
+    '''
+    main function, predict every image of a folder with the streaming pipeline and print the stage report
+    :param name: model name, ie: RESNET18_ground
+    :param input_path: image file or folder of images
+    :param output_path: folder the masks are written to
+    :param paths: ProjectPaths of the model cache
+    :return: StreamingPredictor of the run (report() for the stage statistics)
+    '''
+    network, epoch = load_network(name, paths, device, imsize, model_source)
+    print(f'predicting with {name} (epoch {epoch})')
+    predictor = StreamingPredictor(network, imsize, batch_size, decode_workers, write_workers, queue_size, fmt)
+    predictor.run(list_images(input_path), output_path)
+    predictor.print_report()
+    return predictor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default = 'RESNET18_ground', type = str, required = False)
+    parser.add_argument('--input', type = str, required = True)
+    parser.add_argument('--output', type = str, required = True)
+    parser.add_argument('--base_path', default = None, type = str, required = False)
+    parser.add_argument('--imsize', default = 256, type = int, required = False)
+    parser.add_argument('--batch_size', default = 8, type = int, required = False)
+    parser.add_argument('--decode_workers', default = 4, type = int, required = False)
+    parser.add_argument('--write_workers', default = 2, type = int, required = False)
+    parser.add_argument('--queue_size', default = 32, type = int, required = False)
+    parser.add_argument('--format', default = 'rgb', type = str, required = False, choices = ['rgb', 'index'])
+    args = parser.parse_args()
+    from LunarModules.Paths import ProjectPaths
+    stream_predict_folder(args.model, args.input, args.output, paths = ProjectPaths(args.base_path), imsize = args.imsize, batch_size = args.batch_size, decode_workers = args.decode_workers, write_workers = args.write_workers, queue_size = args.queue_size, fmt = args.format)
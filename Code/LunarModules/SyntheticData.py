@@ -0,0 +1,155 @@
+"""
+SyntheticData.py
+Generator of synthetic lunar render/mask pairs in the layout of the downloaded dataset, so the split, EDA, training
+and benchmarks can run offline and be load-tested at any dataset size.
+
+Layout written to DATA_PATH (same as Data.zip from google_drive_data_download.py):
+    images/render/render0001.png    480x720 RGB render
+    images/ground/ground0001.png    RGB class mask (sky red, big rocks blue, small rocks green, unlabeled black)
+    images/clean/clean0001.png      cleaned class mask, EDA reads these
+    real_moon_images/PCAM1.png      'real' image, and g_PCAM1.png its mask
+Ids are zero padded to 4 digits like the dataset (TrainTestSplit matches renders and masks on the number in the file
+name) and grow past 4 digits above 9999 images. Every image is drawn from its own seed, so a dataset is the same
+whatever the number of workers.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+# RGB colour of each class in the order of ImageProcessor.CLASS_MAP
+CLASS_COLOURS = np.array([[255, 0, 0], [0, 0, 255], [0, 255, 0], [0, 0, 0]], dtype = np.uint8)
+SKY, BIG_ROCKS, SMALL_ROCKS, UNLABELED = range(4)
+HEIGHT, WIDTH = 480, 720
+
+
+def lunar_pair(rng, height = HEIGHT, width = WIDTH):
+    '''
+    one synthetic render and its class mask: sky above a noisy horizon, ground shaded lighter towards the camera, and
+    big/small rocks as ellipses on the ground that get smaller towards the horizon
+    :param rng: np.random.Generator
+    :param height: image height
+    :param width: image width
+    :return: render (h, w, 3) uint8 RGB, mask (h, w, 3) uint8 RGB
+    '''
+    classes = np.full((height, width), UNLABELED, dtype = np.uint8)
+    horizon = (height * rng.uniform(0.2, 0.45) + np.cumsum(rng.normal(0, 1.5, width))).astype(int).clip(0, height - 1)
+    rows = np.arange(height)[:, None]
+    classes[rows < horizon[None, :]] = SKY
+
+    render = np.zeros((height, width), dtype = np.float32)
+    ground = rows >= horizon[None, :]
+    render += ground * np.linspace(60, 170, height, dtype = np.float32)[:, None]
+    render += ground * rng.normal(0, 12, (height, width)).astype(np.float32)
+
+    for n_rocks, cls, radius in [(rng.integers(2, 8), BIG_ROCKS, (40, 110)), (rng.integers(30, 90), SMALL_ROCKS, (4, 20))]:
+        for _ in range(n_rocks):
+            x = int(rng.integers(0, width))
+            y = int(rng.integers(horizon[x], height))
+            scale = 0.3 + 0.7 * (y - horizon[x]) / max(height - horizon[x], 1)
+            axes = (max(int(rng.uniform(*radius) * scale), 1), max(int(rng.uniform(*radius) * scale * 0.6), 1))
+            cv2.ellipse(classes, (x, y), axes, 0, 0, 360, int(cls), -1)
+            cv2.ellipse(render, (x, y), axes, 0, 0, 360, float(rng.uniform(120, 230)), -1)
+
+    render = cv2.GaussianBlur(render, (3, 3), 0).clip(0, 255).astype(np.uint8)
+    return np.repeat(render[:, :, None], 3, axis = 2), CLASS_COLOURS[classes]
+
+
+def write_rgb(path, img):
+    '''
+    write an RGB image as PNG (cv2 expects BGR)
+    '''
+    cv2.imwrite(path, cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+
+
+def write_renders(DATA_PATH, ids, seed = 42, height = HEIGHT, width = WIDTH, overwrite = False):
+    '''
+    write render/ground/clean files of some ids
+    :param DATA_PATH: location of data
+    :param ids: image ids to write
+    :param seed: dataset seed, image i is drawn from the seed (seed, i)
+    :return: number of pairs written
+    '''
+    n = 0
+    for i in ids:
+        render_path = os.path.join(DATA_PATH, 'images', 'render', f'render{i:04d}.png')
+        if not overwrite and os.path.exists(render_path):
+            continue
+        render, mask = lunar_pair(np.random.default_rng([seed, i]), height, width)
+        write_rgb(render_path, render)
+        write_rgb(os.path.join(DATA_PATH, 'images', 'ground', f'ground{i:04d}.png'), mask)
+        write_rgb(os.path.join(DATA_PATH, 'images', 'clean', f'clean{i:04d}.png'), mask)
+        n += 1
+    return n
+
+
+def write_real(DATA_PATH, ids, seed = 42, height = HEIGHT, width = WIDTH, overwrite = False):
+    '''
+    write real_moon_images/PCAM<i>.png and its mask g_PCAM<i>.png for some ids
+    :return: number of pairs written
+    '''
+    n = 0
+    for i in ids:
+        img_path = os.path.join(DATA_PATH, 'real_moon_images', f'PCAM{i}.png')
+        if not overwrite and os.path.exists(img_path):
+            continue
+        # (seed, 1, i) keeps the real images' random streams apart from the renders'
+        render, mask = lunar_pair(np.random.default_rng([seed, 1, i]), height, width)
+        write_rgb(img_path, render)
+        write_rgb(os.path.join(DATA_PATH, 'real_moon_images', f'g_PCAM{i}.png'), mask)
+        n += 1
+    return n
+
+
+def generate_dataset(DATA_PATH, n_images, n_real = 36, seed = 42, height = HEIGHT, width = WIDTH, workers = None, chunk_size = 256, overwrite = False):
+    '''
+    main function, writes a synthetic dataset to DATA_PATH in the layout of the downloaded one
+    :param DATA_PATH: location of data, ie: ../Data
+    :param n_images: number of render/mask pairs (the downloaded dataset has 9766)
+    :param n_real: number of real_moon_images pairs (the downloaded dataset has 36)
+    :param seed: dataset seed
+    :param height: image height
+    :param width: image width
+    :param workers: processes writing images, None for the number of CPUs
+    :param chunk_size: ids per task
+    :param overwrite: rewrite files that already exist, otherwise only missing ids are written
+    :return: number of pairs written
+    '''
+    for folder in [os.path.join('images', 'render'), os.path.join('images', 'ground'), os.path.join('images', 'clean'), 'real_moon_images']:
+        os.makedirs(os.path.join(DATA_PATH, folder), exist_ok = True)
+
+    chunks = [range(start, min(start + chunk_size, n_images + 1)) for start in range(1, n_images + 1, chunk_size)]
+    real_chunks = [range(start, min(start + chunk_size, n_real + 1)) for start in range(1, n_real + 1, chunk_size)]
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        renders = [pool.submit(write_renders, DATA_PATH, ids, seed, height, width, overwrite) for ids in chunks]
+        reals = [pool.submit(write_real, DATA_PATH, ids, seed, height, width, overwrite) for ids in real_chunks]
+        n_written = 0
+        for i, job in enumerate(renders):
+            n_written += job.result()
+            if (i + 1) % 10 == 0:
+                print(f'{min((i + 1) * chunk_size, n_images)}/{n_images} images')
+        n_written += sum(job.result() for job in reals)
+
+    with open(os.path.join(DATA_PATH, 'synthetic.json'), 'w') as f:
+        json.dump({'n_images': n_images, 'n_real': n_real, 'seed': seed, 'height': height, 'width': width}, f, indent = 2)
+    print(f'synthetic dataset in {DATA_PATH}: {n_images} renders, {n_real} real images ({n_written} pairs written)')
+    return n_written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default = '../Data', type = str, required = False)
+    parser.add_argument('--n_images', default = 9766, type = int, required = False)
+    parser.add_argument('--n_real', default = 36, type = int, required = False)
+    parser.add_argument('--seed', default = 42, type = int, required = False)
+    parser.add_argument('--workers', default = None, type = int, required = False)
+    parser.add_argument('--overwrite', action = 'store_true', required = False)
+    args = parser.parse_args()
+    print(f'GENERATING SYNTHETIC DATA n_images={args.n_images} n_real={args.n_real}')
+    generate_dataset(args.data_path, args.n_images, n_real = args.n_real, seed = args.seed, workers = args.workers, overwrite = args.overwrite)
@@ -7,10 +7,21 @@ created: 11/18/2022
 
 import numpy as np
 import os
-from sklearn.model_selection import train_test_split
+import re
 import pandas as pd
 import shutil
 import argparse
+import cv2
+from LunarModules.Paths import ProjectPaths
+
+def file_id(file_name):
+    '''
+    id of an image/mask from its file name, ie: render0001.png -> 1. Same as x[-8:-4] for the 4 digit ids of the
+    dataset, and also reads longer ids (synthetic datasets above 9999 images)
+    :param file_name: file name
+    :return: int id
+    '''
+    return int(re.search(r'(\d+)\.\w+$', file_name).group(1))
 
 def get_data(DATA_PATH, SOURCE):
     '''
@@ -25,8 +36,8 @@ def get_data(DATA_PATH, SOURCE):
     all_imgs = pd.DataFrame(os.listdir(full_img_path), columns = ['img'])
     all_masks = pd.DataFrame(os.listdir(full_mask_path), columns = ['mask'])
 
-    all_imgs['id'] = all_imgs.img.apply(lambda x: int(x[-8:-4]))
-    all_masks['id'] = all_masks['mask'].apply(lambda x: int(x[-8:-4]))
+    all_imgs['id'] = all_imgs.img.apply(file_id)
+    all_masks['id'] = all_masks['mask'].apply(file_id)
 
     data = all_imgs.merge(all_masks, on = 'id')
     return data
@@ -84,17 +95,67 @@ def move_real_test_images(DATA_PATH):
         shutil.copy2(src, dst)
     
 
-def run_datasplit(SOURCE = 'clean', RESPLIT = False):
+def encode_masks(mask_folder, fmt = 'png'):
+    '''
+    Encodes every RGB mask in a folder into a class index mask (uint8, 255 where no class matches) with the same class
+    map as ImageProcessor.one_hot_encode, so the data loader doesn't have to encode them every epoch
+    :param mask_folder: folder of RGB masks, ie: Data/images/train/mask
+    :param fmt: 'png' writes a uint8 png per mask to <mask_folder>_index/ (same file names),
+                'npy' writes a .npy per mask to <mask_folder>_index/,
+                'packed' writes one (n masks, height, width) array to <mask_folder>_index.npy with the mask file names
+                in <mask_folder>_index.txt (falls back to 'png' if the masks aren't all the same size)
+    :return: none
+    '''
+    import matplotlib.pyplot as plt
+    from LunarModules.ImageProcessor import ImageProcessor
+
+    mask_folder = mask_folder.rstrip('/')
+    img_processor = ImageProcessor()
+    masks = sorted([item for item in os.listdir(mask_folder) if item.endswith('.png')])
+    encoded = [img_processor.encode_mask(plt.imread(os.path.join(mask_folder, msk)), output = 'index') for msk in masks]
+
+    if fmt == 'packed':
+        if len(set(enc.shape for enc in encoded)) > 1:
+            print(f'masks in {mask_folder} have different sizes, writing one png per mask instead of a packed array')
+            fmt = 'png'
+        else:
+            np.save(mask_folder + '_index.npy', np.stack(encoded))
+            with open(mask_folder + '_index.txt', 'w') as f:
+                f.write('\n'.join(masks))
+            return
+
+    index_folder = mask_folder + '_index'
+    if not os.path.exists(index_folder):
+        os.makedirs(index_folder)
+    for msk, enc in zip(masks, encoded):
+        if fmt == 'npy':
+            np.save(os.path.join(index_folder, msk[:-4] + '.npy'), enc)
+        else:
+            cv2.imwrite(os.path.join(index_folder, msk), enc)
+
+def has_encoded_masks(mask_folder):
+    '''
+    :param mask_folder: folder of RGB masks
+    :return: True if encode_masks was run on the folder
+    '''
+    mask_folder = mask_folder.rstrip('/')
+    return os.path.exists(mask_folder + '_index') or os.path.exists(mask_folder + '_index.npy')
+
+def run_datasplit(SOURCE = 'clean', RESPLIT = False, ENCODE_MASKS = None, paths = None, STRATIFY = False):
     '''
     main function that splits and copies data into correct folders
     :param SOURCE: source of training data 'clean' or 'ground'
     :param RESPLIT: bool value, if True the existing Train/Val/Test folders will be removed and recreated
                     ** should be used if switching from clean->ground (or vice versa), or random state is changed, etc
+    :param ENCODE_MASKS: None, 'png', 'npy' or 'packed'. If set, the masks of every split (and the real masks) are also
+                         stored as class index masks, see encode_masks. Folders that are already encoded are skipped
+    :param paths: ProjectPaths of the data, None for the project this file is in
+    :param STRATIFY: if True the splits keep the same mix of images with few/many big and small rock pixels, from the
+                     class pixel counts of images_summary.csv (EDA) or of the masks (see LunarModules/Sampling.py)
     :return: none
     '''
-    BASE_PATH = os.getcwd()
-    os.chdir('../Data')
-    DATA_PATH = os.getcwd()
+    paths = ProjectPaths() if paths is None else paths
+    DATA_PATH = paths.data
 
     if RESPLIT:
         files = os.listdir(os.path.join(DATA_PATH, 'images', 'render'))
@@ -122,9 +183,16 @@ def run_datasplit(SOURCE = 'clean', RESPLIT = False):
         print('Data already split ... skipping')
     else:
         print('getting data ...')
+        # sklearn takes about a second to import, only pay it when splitting
+        from sklearn.model_selection import train_test_split
         data = get_data(DATA_PATH, SOURCE)
-        train, test = train_test_split(data, test_size = 0.3, random_state = 42)
-        train, val = train_test_split(train, test_size = 0.3, random_state = 42)
+        strata = None
+        if STRATIFY:
+            from LunarModules.Sampling import class_counts, split_strata
+            counts = class_counts(DATA_PATH, os.path.join(DATA_PATH, 'images', SOURCE))
+            strata = split_strata(data.id, counts)
+        train, test = train_test_split(data, test_size = 0.3, random_state = 42, stratify = strata)
+        train, val = train_test_split(train, test_size = 0.3, random_state = 42, stratify = None if strata is None else strata[train.index])
 
         print('moving train ...')
         move_data(data = train, split = 'train', source = SOURCE, DATA_PATH = DATA_PATH)
@@ -134,15 +202,23 @@ def run_datasplit(SOURCE = 'clean', RESPLIT = False):
         move_data(data = test, split = 'test', source = SOURCE, DATA_PATH = DATA_PATH)
         print('moving real moon images ...')
         move_real_test_images(DATA_PATH)
-    
+
+    if ENCODE_MASKS is not None:
+        for mask_folder in [os.path.join(DATA_PATH, 'images', split, 'mask') for split in ['train', 'val', 'test']] + [os.path.join(DATA_PATH, 'images', 'real', 'real_mask')]:
+            if os.path.exists(mask_folder) and not has_encoded_masks(mask_folder):
+                print(f'encoding masks in {mask_folder} ...')
+                encode_masks(mask_folder, fmt = ENCODE_MASKS)
+
     print('done')
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--source', default = 'clean', type=str, required = False)
     parser.add_argument('--resplit', default = False, type=bool, required = False)
+    parser.add_argument('--encode_masks', default = None, type=str, required = False)
+    parser.add_argument('--stratify', action = 'store_true', required = False)
     args = parser.parse_args()
     SOURCE = args.source
     RESPLIT = args.resplit
-    print(f'SPLITTING DATA WITH source={SOURCE}, resplit={RESPLIT}')
-    run_datasplit(SOURCE=SOURCE, RESPLIT=RESPLIT)
+    print(f'SPLITTING DATA WITH source={SOURCE}, resplit={RESPLIT}, encode_masks={args.encode_masks}, stratify={args.stratify}')
+    run_datasplit(SOURCE=SOURCE, RESPLIT=RESPLIT, ENCODE_MASKS=args.encode_masks, STRATIFY=args.stratify)
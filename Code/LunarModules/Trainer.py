@@ -0,0 +1,552 @@
+"""
+Trainer.py
+One training engine for every architecture. The scratch U-Net (Model) and the smp U-Nets (Pretrained_Model) are
+wrappers that build their network, loss and optimizer and hand them to a Trainer, which owns the loops and everything
+around them, so each feature is written once:
+    gradient accumulation over micro-batches    micro_batch_size
+    mixed precision                             amp, bfloat16 autocast on CPU, float16 autocast + GradScaler on CUDA
+    batch transforms on the device              batch_transform, ie: Augmentation.BatchAugmentation
+    step timing and Chrome traces               profile, trace_path (LunarModules/Profiler.py)
+    metrics                                     confusion matrix of the epoch on the device (LunarModules/Metrics.py)
+    data parallel training                      LunarModules/Distributed.py
+    checkpoints                                 ModelStore manifest, only the latest (best) checkpoint is kept
+    graph compilation                           compile, torch.compile with a persistent cache (see compile_model)
+
+The history has the same schema for every model, <split>_<name> -> [(epoch, value)] with split train/val/test (epoch -1
+for test) and name loss or a metric, ie: val_IOU.
+
+Callbacks are called at every hook with the trainer, which they can read and change, ie: trainer.stop = True ends
+training after the epoch. Saving the best epoch and early stopping are a callback (BestCheckpoint).
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import itertools
+import os
+import time
+from contextlib import nullcontext
+
+import torch
+from tqdm.auto import tqdm
+
+from LunarModules.Distributed import is_main_process, barrier, all_reduce_mean, any_rank, wrap_model, unwrap_model, set_sampler_epoch
+from LunarModules.Metrics import ConfusionMatrix, METRICS
+from LunarModules.ModelStore import ModelStore, DEFAULT_MODEL_SOURCE, MODEL_FOLDER
+from LunarModules.Profiler import StepTimer, NULL_TIMER
+
+
+def accumulate_gradients(model, loss_fn, x, y, micro_batch_size = None, timer = NULL_TIMER, autocast = nullcontext, scaler = None):
+    '''
+    Forward and backward pass over one batch, optionally split into micro-batches so only one micro-batch worth of
+    activations is held in memory at a time. Each micro-batch loss is weighted by its share of the batch, so the
+    accumulated gradients match a single pass over the full batch (up to BatchNorm statistics).
+    The caller is responsible for zeroing gradients before and stepping the optimizer after.
+    For DistributedDataParallel models gradients are only all-reduced on the last micro-batch.
+    :param model: model to run
+    :param loss_fn: loss function (mean reduction)
+    :param x: input batch
+    :param y: target batch
+    :param micro_batch_size: max samples per forward/backward pass, None to run the full batch at once
+    :param timer: Profiler.StepTimer to time the forward and backward stages with
+    :param autocast: context manager factory the forward pass runs in, ie: mixed precision
+    :param scaler: optional torch.cuda.amp.GradScaler the loss is scaled with before backward
+    :return: detached predictions for the full batch, batch loss as a tensor
+    '''
+    backward = lambda loss: (loss if scaler is None else scaler.scale(loss)).backward()
+    if micro_batch_size is None or micro_batch_size >= x.shape[0]:
+        with timer.stage('forward'):
+            with autocast():
+                pred = model.forward(x)
+                loss = loss_fn(pred, y)
+        with timer.stage('backward'):
+            backward(loss)
+        return pred.detach(), loss.detach()
+
+    preds = []
+    total_loss = 0
+    x_micros, y_micros = torch.split(x, micro_batch_size), torch.split(y, micro_batch_size)
+    for i, (x_micro, y_micro) in enumerate(zip(x_micros, y_micros)):
+        sync = i == len(x_micros) - 1 or not hasattr(model, 'no_sync')
+        with (nullcontext() if sync else model.no_sync()):
+            with timer.stage('forward'):
+                with autocast():
+                    pred = model.forward(x_micro)
+                    loss = loss_fn(pred, y_micro) * (x_micro.shape[0] / x.shape[0])
+            with timer.stage('backward'):
+                backward(loss)
+        preds.append(pred.detach())
+        total_loss += loss.detach()
+    return torch.cat(preds), total_loss
+
+
+class EarlyStopping:
+    '''
+    Decides when a training loop should stop: the tracked validation metric (higher is better) hasn't improved for
+    `patience` validations, or the next epoch would not finish inside the time budget.
+    '''
+    def __init__(self, patience = None, time_budget = None, min_delta = 0.0):
+        '''
+        :param patience: number of validations without improvement before stopping, None to never stop on plateau
+        :param time_budget: max training time in seconds, None for no limit
+        :param min_delta: minimum increase of the metric to count as an improvement
+        '''
+        self.patience = patience
+        self.time_budget = time_budget
+        self.min_delta = min_delta
+        self.best = None
+        self.bad_validations = 0
+        self.t0 = time.time()
+        self.longest_epoch = 0
+
+    def improved(self, value):
+        '''
+        Record a validation result
+        :param value: metric value
+        :return: True if it's the best value so far (ie: the model should be saved)
+        '''
+        if self.best is None or value > self.best + self.min_delta:
+            self.best = value
+            self.bad_validations = 0
+            return True
+        self.bad_validations += 1
+        return False
+
+    def should_stop(self, epoch_seconds):
+        '''
+        Call at the end of every epoch
+        :param epoch_seconds: how long the epoch took
+        :return: True if training should stop
+        '''
+        self.longest_epoch = max(self.longest_epoch, epoch_seconds)
+        stop = False
+        if self.patience is not None and self.bad_validations >= self.patience:
+            print(f'No improvement for {self.bad_validations} validations, stopping early (best: {self.best})')
+            stop = True
+        elif self.time_budget is not None and (time.time() - self.t0) + self.longest_epoch > self.time_budget:
+            print(f'Next epoch would exceed the time budget of {self.time_budget}s, stopping')
+            stop = True
+        # every rank has to agree, otherwise the ones still training would wait on the others forever
+        return any_rank(stop)
+
+
+def compile_model(model, cache_dir = None, mode = None):
+    '''
+    torch.compile a network. The graphs inductor generates are cached in cache_dir, so a later run with the same network,
+    input shapes and torch version loads them instead of compiling again.
+    Compiling is lazy, the first call of the returned module for an input shape and train/eval mode compiles its graph.
+    :param model: network
+    :param cache_dir: folder of the compile cache, ie: Models/compile_cache, None for inductor's default (under /tmp)
+    :param mode: torch.compile mode, ie: 'max-autotune', None for the default
+    :return: compiled module, or model itself if torch.compile isn't available (torch < 2.0)
+    '''
+    if not hasattr(torch, 'compile'):
+        print('torch.compile is not available, running eager...')
+        return model
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok = True)
+        # read by inductor when it first writes to its cache, so it has to be set before the first compile
+        os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', os.path.abspath(cache_dir))
+        os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+    return torch.compile(model, mode = mode)
+
+
+def set_transform_epoch(batch_transform, epoch):
+    '''
+    let a batch transform reseed for the epoch, no-op if there is none or it isn't seeded per epoch
+    :param batch_transform: batch transform or None
+    :param epoch: current epoch
+    :return:
+    '''
+    if batch_transform is not None and hasattr(batch_transform, 'set_epoch'):
+        batch_transform.set_epoch(epoch)
+
+
+def limit_batches(data_loader, max_batches = None):
+    '''
+    Iterate over at most max_batches batches of a data loader
+    :param data_loader: data loader, shuffle it to get a different subsample each time
+    :param max_batches: number of batches, None for all
+    :return: iterable of batches
+    '''
+    if max_batches is None or max_batches >= len(data_loader):
+        return data_loader
+    return itertools.islice(data_loader, max_batches)
+
+
+def prune_checkpoints(save_loc, name, keep_epoch):
+    '''
+    Remove the older checkpoints of a model, load_checkpoint only ever loads the latest (best) one
+    :param save_loc: checkpoint folder
+    :param name: model name
+    :param keep_epoch: epoch of the checkpoint to keep
+    :return:
+    '''
+    for file in os.listdir(save_loc):
+        if file.startswith(f'model_{name}_EP') and file.endswith('.pt') and file != f'model_{name}_EP{keep_epoch}.pt':
+            os.remove(os.path.join(save_loc, file))
+
+
+class Callback:
+    '''
+    Hooks of Trainer.fit, override the ones needed
+    '''
+    def on_fit_start(self, trainer):
+        pass
+
+    def on_epoch_start(self, trainer, epoch):
+        pass
+
+    def on_batch_end(self, trainer, step, loss):
+        pass
+
+    def on_epoch_end(self, trainer, epoch, logs):
+        '''
+        :param logs: train_<name> of the epoch, and val_<name> if it was validated
+        '''
+        pass
+
+    def on_fit_end(self, trainer):
+        pass
+
+
+class BestCheckpoint(Callback):
+    '''
+    Save a checkpoint whenever the monitored validation metric (higher is better) improves, and stop on a plateau or
+    before running out of time (see EarlyStopping). When training resumes from a checkpoint, its recorded metric is the
+    one to beat. If it has none (saved before metrics were recorded) the older checkpoints are kept, so the best one
+    isn't pruned by a worse epoch.
+    '''
+    def __init__(self, monitor = 'val_IOU', patience = None, time_budget = None):
+        self.monitor = monitor
+        self.patience = patience
+        self.time_budget = time_budget
+        self.stopper = None
+        self.prune = True
+
+    def on_fit_start(self, trainer):
+        self.stopper = EarlyStopping(patience = self.patience, time_budget = self.time_budget)
+        self.prune = True
+        if trainer.checkpoint_metrics is not None:
+            self.stopper.best = trainer.checkpoint_metrics.get(self.monitor)
+            if self.stopper.best is None:
+                print(f'the loaded checkpoint has no {self.monitor}, keeping the older checkpoints')
+                self.prune = False
+
+    def on_epoch_end(self, trainer, epoch, logs):
+        if self.monitor in logs and self.stopper.improved(logs[self.monitor]):
+            trainer.save_checkpoint(epoch, {self.monitor: logs[self.monitor]}, prune = self.prune)
+        if self.stopper.should_stop(trainer.epoch_seconds):
+            trainer.stop = True
+
+
+class Trainer:
+    '''
+    Training, validation and testing loops of a segmentation network
+    ie: Trainer(network, loss, optimizer, device, 'RESNET18_ground', base_loc).fit(train_loader, val_loader, 20, callbacks = [BestCheckpoint()])
+    '''
+    def __init__(self, model, loss, optimizer, device, name, base_loc = None, scheduler = None, metrics = METRICS, batch_metrics = (), micro_batch_size = None, batch_transform = None, amp = False, compile = False, compile_cache = None, callbacks = (), model_source = DEFAULT_MODEL_SOURCE):
+        '''
+        :param model: network, moved to device
+        :param loss: loss function of (predictions, one hot masks)
+        :param optimizer: optimizer of the network's parameters
+        :param device: pytorch device
+        :param name: model name, used for the checkpoints
+        :param base_loc: project root the checkpoints (Models/) and step timings (Results/) are saved to, None to not save
+        :param scheduler: optional LR scheduler, stepped after every optimizer step
+        :param metrics: names of the confusion matrix metrics to record (see LunarModules/Metrics.py)
+        :param batch_metrics: callables (predictions, masks) -> tensor averaged over the batches, recorded by __name__
+        :param micro_batch_size: if set, each batch is run in chunks of this size with gradient accumulation, the
+                                 optimizer still steps once per batch
+        :param batch_transform: optional callable (images, masks) -> (images, masks) run on every train batch on device
+        :param amp: run the forward passes with mixed precision
+        :param compile: train and evaluate with the torch.compile'd network, falls back to eager if compiling fails
+        :param compile_cache: folder of the compile cache, None for <base_loc>/Models/compile_cache
+        :param callbacks: Callback objects called in every fit
+        :param model_source: where load_checkpoint downloads the checkpoint from if it is not cached (see ModelStore)
+        '''
+        self.device = torch.device(device)
+        self.model = model.to(self.device)
+        self.loss = loss
+        self.optimizer = optimizer
+        self.name = name
+        self.base_loc = base_loc
+        self.scheduler = scheduler
+        self.metrics = list(metrics)
+        self.batch_metrics = list(batch_metrics)
+        self.micro_batch_size = micro_batch_size
+        self.batch_transform = batch_transform
+        self.amp = amp
+        # float16 needs its gradients scaled, bfloat16 has the range of float32
+        self.amp_dtype = torch.float16 if self.device.type == 'cuda' else torch.bfloat16
+        self.scaler = torch.cuda.amp.GradScaler() if amp and self.device.type == 'cuda' else None
+        self.compile = compile
+        self.compile_cache = compile_cache if compile_cache is not None or base_loc is None else os.path.join(base_loc, 'Models', 'compile_cache')
+        self.compiled_models = {}
+        self.warmed_up = set()
+        self.compile_failed = False
+        self.callbacks = list(callbacks)
+        self.active_callbacks = self.callbacks
+        self.model_source = model_source
+
+        self.history = {}
+        self.train_model = self.model
+        self.stop = False
+        self.epoch_seconds = 0
+        self.test_confusion = None
+        # sha256 of the checkpoint the weights were loaded from, None once they are trained (see PredictionCache.py)
+        self.checkpoint_sha256 = None
+        # validation metrics recorded with the latest checkpoint loaded or saved, None if there was none
+        self.checkpoint_metrics = None
+
+    def autocast(self):
+        if not self.amp:
+            return nullcontext()
+        return torch.autocast(self.device.type, dtype = self.amp_dtype)
+
+    def compiled(self, model):
+        '''
+        :param model: network, or the network wrapped for data parallel training
+        :return: its compiled module when compiling, model otherwise
+        '''
+        if not self.compile or self.compile_failed:
+            return model
+        if id(model) not in self.compiled_models:
+            # the model is kept with its compiled module so its id can't be reused by another object
+            self.compiled_models[id(model)] = (model, compile_model(model, self.compile_cache))
+        return self.compiled_models[id(model)][1]
+
+    def run(self, fn, model):
+        '''
+        fn(model). The first call of a compiled module in train and in eval mode is its warm-up: the graph is compiled
+        (or loaded from the compile cache) and timed. If compiling fails the trainer falls back to eager for good and
+        fn is rerun with the eager network.
+        :param fn: function of the network, ie: a forward/backward pass
+        :param model: network, possibly compiled
+        :return: output of fn
+        '''
+        eager = getattr(model, '_orig_mod', None)
+        if eager is None:
+            return fn(model)
+        if self.compile_failed:
+            return fn(eager)
+        key = (id(model), model.training)
+        if key in self.warmed_up:
+            return fn(model)
+
+        t0 = time.time()
+        try:
+            out = fn(model)
+        except Exception as e:
+            print(f'torch.compile failed ({type(e).__name__}: {e}), falling back to eager...')
+            self.compile_failed = True
+            self.optimizer.zero_grad()
+            return fn(eager)
+        self.warmed_up.add(key)
+        if is_main_process():
+            print(f'compiled {self.name} ({"train" if model.training else "eval"}) in {time.time() - t0:.1f}s')
+        return out
+
+    def callback(self, hook, *args):
+        for callback in self.active_callbacks:
+            getattr(callback, hook)(self, *args)
+
+    def record(self, split, epoch, logs):
+        '''
+        add the logs of an epoch to the history as <split>_<name>
+        '''
+        for key, value in logs.items():
+            self.history.setdefault(f'{split}_{key}', []).append((epoch, value))
+
+    def epoch_logs(self, running_loss, metric_sums, n_batches, confusion):
+        '''
+        loss and batch metrics averaged over this process's batches then over processes, confusion matrix metrics
+        from the matrix summed over processes
+        '''
+        logs = {'loss': all_reduce_mean(running_loss / max(n_batches, 1))}
+        for key, value in metric_sums.items():
+            logs[key] = all_reduce_mean(value / max(n_batches, 1))
+        logs.update(confusion.all_reduce().compute(self.metrics))
+        return logs
+
+    def update_metrics(self, pred, y, running, confusion):
+        confusion.update(pred, y)
+        for metric in self.batch_metrics:
+            running[metric.__name__] = running.get(metric.__name__, 0) + metric(pred, y).item()
+
+    def train_epoch(self, data_loader, epoch, timer = NULL_TIMER):
+        '''
+        one pass over the training data
+        :return: logs of the epoch
+        '''
+        self.train_model.train()
+        set_sampler_epoch(data_loader, epoch)
+        set_transform_epoch(self.batch_transform, epoch)
+        running_loss = 0
+        running = {}
+        confusion = ConfusionMatrix()
+
+        timer.start_epoch(epoch)
+        for step, batch in enumerate(tqdm(timer.iterate(data_loader, self.device), desc = f'TRAINING {epoch}: ', disable = not is_main_process())):
+            x, y = batch[0].float(), batch[1].float()
+            if self.batch_transform is not None:
+                with timer.stage('augment'):
+                    x, y = self.batch_transform(x, y)
+
+            self.optimizer.zero_grad()
+            pred, loss = self.run(lambda model: accumulate_gradients(model, self.loss, x, y, self.micro_batch_size, timer, self.autocast, self.scaler), self.train_model)
+            with timer.stage('optimizer'):
+                if self.scaler is not None:
+                    self.scaler.step(self.optimizer)
+                    self.scaler.update()
+                else:
+                    self.optimizer.step()
+                if self.scheduler is not None:
+                    self.scheduler.step()
+
+            with timer.stage('metrics'):
+                running_loss += loss.item()
+                self.update_metrics(pred, y, running, confusion)
+            self.callback('on_batch_end', step, loss)
+        timer.end_epoch()
+        return self.epoch_logs(running_loss, running, len(data_loader), confusion)
+
+    def evaluate(self, data_loader, max_batches = None, desc = 'VALIDATING: '):
+        '''
+        loss and metrics of the model on a data loader, without training
+        :param max_batches: evaluate on at most this many batches, None for all
+        :return: logs, the confusion matrix is kept as self.confusion
+        '''
+        model = self.compiled(self.model)
+        model.eval()
+        running_loss = 0
+        running = {}
+        confusion = ConfusionMatrix()
+        n_batches = 0
+        with torch.no_grad():
+            for batch in tqdm(limit_batches(data_loader, max_batches), desc = desc, disable = not is_main_process()):
+                n_batches += 1
+                x, y = batch[0].to(self.device).float(), batch[1].to(self.device).float()
+                with self.autocast():
+                    pred = self.run(lambda network: network(x), model)
+                    loss = self.loss(pred, y)
+                running_loss += loss.item()
+                self.update_metrics(pred, y, running, confusion)
+        self.confusion = confusion
+        return self.epoch_logs(running_loss, running, n_batches, confusion)
+
+    def fit(self, train_data_loader, val_data_loader, n_epochs, start_epoch = 0, val_every = 1, val_batches = None, callbacks = (), profile = False, trace_path = None):
+        '''
+        train from start_epoch to n_epochs, or until a callback stops it
+        :param val_every: validate every k epochs (and always on the last epoch)
+        :param val_batches: validate on at most this many batches of the (shuffled) validation loader, None for all
+        :param callbacks: Callback objects for this fit, after the trainer's own
+        :param profile: time data wait/h2d/forward/backward/optimizer/metrics per step and print a summary each epoch,
+                        the summaries are saved to Results/<name>_step_timing.csv
+        :param trace_path: optional path, also export a torch.profiler Chrome trace of the first steps there
+        :return: history
+        '''
+        timer = StepTimer(self.device, trace_path = trace_path, verbose = is_main_process()) if profile or trace_path is not None else NULL_TIMER
+        self.active_callbacks = self.callbacks + list(callbacks)
+        self.train_model = self.compiled(wrap_model(self.model))
+        self.stop = False
+        # the weights won't match the checkpoint any more
+        self.checkpoint_sha256 = None
+
+        self.callback('on_fit_start')
+        for e in range(start_epoch, n_epochs):
+            t0 = time.time()
+            self.callback('on_epoch_start', e)
+            train_logs = self.train_epoch(train_data_loader, e, timer)
+            self.record('train', e, train_logs)
+            logs = {f'train_{key}': value for key, value in train_logs.items()}
+
+            if (e + 1) % val_every == 0 or e == n_epochs - 1:
+                set_sampler_epoch(val_data_loader, e)
+                val_logs = self.evaluate(val_data_loader, val_batches)
+                self.record('val', e, val_logs)
+                logs.update({f'val_{key}': value for key, value in val_logs.items()})
+
+            self.epoch_seconds = time.time() - t0
+            if is_main_process():
+                print(f'EPOCH: {e} -- ' + ' '.join(f'{key} {value:.4f}' for key, value in logs.items()) + f' -- {self.epoch_seconds:.1f}s')
+            self.callback('on_epoch_end', e, logs)
+            if self.stop:
+                break
+
+        if timer.enabled and is_main_process() and self.base_loc is not None:
+            timer.save(os.path.join(self.base_loc, 'Results', f'{self.name}_step_timing.csv'))
+        self.callback('on_fit_end')
+        self.train_model = self.model
+        return self.history
+
+    def test(self, data_loader):
+        '''
+        evaluate on the test data and record it as test_<name>, epoch -1
+        :return: logs
+        '''
+        logs = self.evaluate(data_loader, desc = 'TESTING: ')
+        self.test_confusion = self.confusion
+        self.record('test', -1, logs)
+        if is_main_process():
+            print('TESTING: ' + ' '.join(f'{key} {value}' for key, value in logs.items()))
+        return logs
+
+    def predict(self, x):
+        '''
+        :param x: batch of images
+        :return: predicted class indices, on cpu
+        '''
+        model = self.compiled(self.model)
+        model.eval()
+        with torch.no_grad(), self.autocast():
+            pred = self.run(lambda network: network(x.to(self.device).float()), model)
+        return torch.argmax(pred.float(), dim = 1).cpu()
+
+    def checkpoint_folder(self):
+        return os.path.join(self.base_loc, 'Models', MODEL_FOLDER)
+
+    def save_checkpoint(self, epoch, metrics = None, prune = True):
+        '''
+        save the weights to the model folder, record them in the manifest and remove the older checkpoints
+        :param epoch: epoch of the weights
+        :param metrics: validation metrics of the weights to record in the manifest, ie: {'val_IOU': 0.61}
+        :param prune: remove the older checkpoints of the model
+        :return:
+        '''
+        self.checkpoint_metrics = metrics
+        if not is_main_process() or self.base_loc is None:
+            return
+        save_loc = self.checkpoint_folder()
+        os.makedirs(save_loc, exist_ok = True)
+        path = os.path.join(save_loc, f"model_{self.name}_EP{epoch}.pt")
+        torch.save(unwrap_model(self.model).state_dict(), path)
+        ModelStore(save_loc, source = None).register(self.name, epoch, path, metrics)
+        if prune:
+            prune_checkpoints(save_loc, self.name, epoch)
+        print('saving model ...')
+
+    def load_checkpoint(self, device = None):
+        '''
+        load the latest saved checkpoint, the cached one or only this model's downloaded from model_source. Under DDP
+        every rank has to call it: rank 0 fetches (and records) the checkpoint, the other ranks wait for it and only
+        read the cache
+        :param device: device to map the weights to, None for the trainer's
+        :return: epoch of the checkpoint, 0 if there is none
+        '''
+        if is_main_process():
+            store = ModelStore(self.checkpoint_folder(), source = self.model_source)
+            model_file, epoch = store.fetch(self.name)
+        barrier()
+        if not is_main_process():
+            store = ModelStore(self.checkpoint_folder(), source = self.model_source, read_only = True)
+            model_file, epoch = store.fetch(self.name)
+        if model_file is None:
+            print('No models saved to load')
+            return 0
+        print(f"Latest Model Saved: {os.path.basename(model_file)}")
+        self.model.load_state_dict(torch.load(model_file, map_location = self.device if device is None else device))
+        entry = store.read_manifest()['models'][self.name]
+        self.checkpoint_sha256 = entry['sha256']
+        self.checkpoint_metrics = entry.get('metrics', {})
+        print("Model Loaded!")
+        return epoch
@@ -0,0 +1,164 @@
+"""
+Tuner.py
+Hyperparameter probes: learning rate range test and throughput-aware batch size finder.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+
+CITATIONS:
+LR range test based on: Smith, L. N. "Cyclical Learning Rates for Training Neural Networks" (2017)
+"""
+import copy
+import resource
+import time
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+
+def lr_range_test(model, loss_fn, optimizer, data_loader, device, start_lr = 1e-7, end_lr = 1, num_iter = 100, smoothing = 0.05, diverge_threshold = 4):
+    '''
+    Train for num_iter steps while the learning rate grows exponentially from start_lr to end_lr and record the loss.
+    The model and optimizer state are restored afterwards.
+    :param model: model to test
+    :param loss_fn: loss function
+    :param optimizer: optimizer of the model, its LR is overwritten during the test
+    :param data_loader: train data loader, cycled if shorter than num_iter
+    :param device: pytorch device
+    :param start_lr: first learning rate
+    :param end_lr: last learning rate
+    :param num_iter: number of steps
+    :param smoothing: exponential smoothing factor of the recorded loss
+    :param diverge_threshold: stop once the smoothed loss is this many times the best loss
+    :return: dict with the tested lrs, smoothed losses and the suggested LR
+    '''
+    model_state = copy.deepcopy(model.state_dict())
+    opt_state = copy.deepcopy(optimizer.state_dict())
+
+    gamma = (end_lr / start_lr) ** (1 / max(num_iter - 1, 1))
+    lrs, losses = [], []
+    avg_loss, best_loss = 0, np.inf
+    batches = iter(data_loader)
+
+    model.train()
+    for i in range(num_iter):
+        try:
+            x, y = next(batches)
+        except StopIteration:
+            batches = iter(data_loader)
+            x, y = next(batches)
+        x, y = x.to(device).float(), y.to(device).float()
+
+        lr = start_lr * gamma ** i
+        for group in optimizer.param_groups:
+            group['lr'] = lr
+
+        optimizer.zero_grad()
+        loss = loss_fn(model(x), y)
+        loss.backward()
+        optimizer.step()
+
+        # bias corrected exponential moving average of the loss
+        avg_loss = smoothing * loss.item() + (1 - smoothing) * avg_loss
+        smoothed = avg_loss / (1 - (1 - smoothing) ** (i + 1))
+        lrs.append(lr)
+        losses.append(smoothed)
+
+        if not np.isfinite(smoothed) or smoothed > diverge_threshold * best_loss:
+            print(f'loss diverged at lr {lr:.2e}, stopping range test')
+            break
+        best_loss = min(best_loss, smoothed)
+
+    model.load_state_dict(model_state)
+    optimizer.load_state_dict(opt_state)
+
+    return {'lrs': lrs, 'losses': losses, 'suggested_lr': suggest_lr(lrs, losses)}
+
+
+def suggest_lr(lrs, losses, skip_start = 5, skip_end = 2):
+    '''
+    Suggest the LR where the smoothed loss falls fastest (steepest negative slope against log LR).
+    Falls back to a tenth of the LR with the lowest loss when the curve is too short.
+    :param lrs: tested learning rates
+    :param losses: smoothed losses
+    :param skip_start: points to ignore at the start of the curve (noisy)
+    :param skip_end: points to ignore at the end of the curve (diverging)
+    :return: suggested learning rate
+    '''
+    lrs, losses = np.array(lrs), np.array(losses)
+    if len(lrs) < skip_start + skip_end + 3:
+        return float(lrs[np.argmin(losses)] / 10)
+    lrs_cut = lrs[skip_start:len(lrs) - skip_end]
+    losses_cut = losses[skip_start:len(losses) - skip_end]
+    slopes = np.gradient(losses_cut, np.log10(lrs_cut))
+    return float(lrs_cut[np.argmin(slopes)])
+
+
+def find_batch_size(model, loss_fn, optimizer, dataset, device, candidates = (4, 8, 16, 32, 64), steps = 3, max_memory_mb = None):
+    '''
+    Time forward/backward/step at each candidate batch size and pick the one with the highest throughput.
+    Bigger batch sizes are skipped once one runs out of memory or goes over max_memory_mb.
+    The model and optimizer state are restored afterwards.
+    :param model: model to probe
+    :param loss_fn: loss function
+    :param optimizer: optimizer of the model
+    :param dataset: train dataset, ie: CustomDataLoader, only max(candidates) samples are loaded
+    :param device: pytorch device
+    :param candidates: batch sizes to try
+    :param steps: timed steps per batch size
+    :param max_memory_mb: optional memory cap, on CPU it's the growth of the process peak RSS since the probe started
+    :return: dict with images/second per batch size and the best batch size
+    '''
+    model_state = copy.deepcopy(model.state_dict())
+    opt_state = copy.deepcopy(optimizer.state_dict())
+
+    # load the samples once and slice them, so the probe measures compute not decoding
+    candidates = sorted(candidates)
+    loader = DataLoader(dataset, batch_size = min(candidates[-1], len(dataset)), shuffle = True)
+    x_all, y_all = next(iter(loader))
+    x_all, y_all = x_all.to(device).float(), y_all.to(device).float()
+
+    def step(x, y):
+        optimizer.zero_grad()
+        loss = loss_fn(model(x), y)
+        loss.backward()
+        optimizer.step()
+
+    model.train()
+    throughput = {}
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for batch_size in candidates:
+        if batch_size > x_all.shape[0]:
+            break
+        x, y = x_all[:batch_size], y_all[:batch_size]
+        if device.type == 'cuda':
+            torch.cuda.empty_cache()
+            torch.cuda.reset_peak_memory_stats()
+        try:
+            step(x, y) # warm up
+            t0 = time.perf_counter()
+            for _ in range(steps):
+                step(x, y)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            elapsed = time.perf_counter() - t0
+        except RuntimeError as err:
+            print(f'batch size {batch_size} failed ({str(err).splitlines()[0]}), stopping search')
+            break
+
+        if device.type == 'cuda':
+            used_mb = torch.cuda.max_memory_allocated() / 2**20
+        else:
+            used_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss) / 1024
+        if max_memory_mb is not None and used_mb > max_memory_mb:
+            print(f'batch size {batch_size} used {used_mb:.0f}MB > {max_memory_mb}MB, stopping search')
+            break
+
+        throughput[batch_size] = batch_size * steps / elapsed
+        print(f'batch size {batch_size}: {throughput[batch_size]:.2f} imgs/s')
+
+    model.load_state_dict(model_state)
+    optimizer.load_state_dict(opt_state)
+
+    best = max(throughput, key = throughput.get) if len(throughput) > 0 else None
+    return {'throughput': throughput, 'best_batch_size': best}
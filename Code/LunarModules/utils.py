@@ -2,6 +2,8 @@ from LunarModules.ImageProcessor import ImageProcessor
 from LunarModules.CustomDataLoader import CustomDataLoader
 from LunarModules.Plotter import Plotter
 from LunarModules.Model import *
+from LunarModules.Paths import ProjectPaths
+from LunarModules.PredictionCache import predict_masks, shared_cache
 import numpy as np
 from matplotlib import pyplot as plt
 import pandas as pd
@@ -12,6 +14,7 @@ from torch.optim import Adam, AdamW
 from transformers import get_scheduler
 import os
 import gc
+import json
 from tqdm.auto import tqdm
 import time
 from datetime import datetime
@@ -94,6 +97,42 @@ def do_preprocessing_checks(train_data, train_data_loader, train_img_folder, tra
 
     print(sample_mask_decoded.shape)
 
+    # Check the fused mask encoding against the original normalize -> one hot -> rescale steps
+    check_mask_encoding(train_mask_folder, imsize=train_data.imsize)
+    check_mask_encoding(real_test_mask_folder, imsize=train_data.imsize)
+
+def check_mask_encoding(mask_folder, imsize=256, first_n=20):
+    '''
+    check ImageProcessor.encode_mask gives the same one hot masks as the original preprocessing steps
+    (mask_max_pixel_normalize -> one_hot_encode -> rescale) on real mask files, at native size and resized
+    :param mask_folder: folder of mask images
+    :param imsize: resized size to check as well
+    :param first_n: number of masks to check
+    :return: True if every mask matches
+    '''
+    img_processor = ImageProcessor()
+    all_match = True
+    t_reference, t_fused = 0, 0
+    for mask_file in sorted(os.listdir(mask_folder))[:first_n]:
+        native = plt.imread(os.path.join(mask_folder, mask_file))
+        for mask in [native, cv2.resize(native, (imsize, imsize))]:
+            t0 = time.time()
+            reference = img_processor.rescale(img_processor.one_hot_encode(img_processor.mask_max_pixel_normalize(mask)))
+            t1 = time.time()
+            fused = img_processor.encode_mask(mask)
+            index = img_processor.encode_mask(mask, output='index')
+            t2 = time.time()
+            t_reference += t1 - t0
+            t_fused += t2 - t1
+
+            index_one_hot = (index[::,::,None] == np.arange(reference.shape[2])).astype(np.uint8)
+            if not (np.array_equal(reference, fused) and np.array_equal(reference, index_one_hot)):
+                print(f'mask encoding mismatch: {mask_file} {mask.shape}')
+                all_match = False
+
+    print(f'mask encoding check {"passed" if all_match else "FAILED"} on {mask_folder}, reference {t_reference:.2f}s fused {t_fused:.2f}s')
+    return all_match
+
 def update_results(model, RESULTS, RESULT_PATH):
     '''
     Update results file with training information
@@ -116,37 +155,32 @@ def update_results(model, RESULTS, RESULT_PATH):
     print("results updated")
     return RESULTS
 
-def plot_prediction(model, test_data_loader, device):
+def plot_prediction(model, test_data_loader, device, prediction_cache = None):
     '''
     plot random predictions
     :param model: model to test
     :param test_data_loader: test data loader
     :param device: pytorch device
+    :param prediction_cache: PredictionCache the predicted masks are read from/saved to, None to always predict
     :return:
     '''
     print('plotting...')
     for step, batch in enumerate(test_data_loader):
         if step == 0:
             x_test, y_test = batch[0], batch[1]
-            y_pred = model.model(x_test.to(device))
+            # class index masks, the argmax of the predictions
+            y_pred = predict_masks(model, x_test, prediction_cache, device)
 
             np.save('y_test_batch.npy', y_test.cpu().detach().numpy())
-            np.save('y_pred_batch.npy', y_pred.cpu().detach().numpy())
+            np.save('y_pred_batch.npy', y_pred)
 
-            if 'scratch' not in model.name:
-                y_pred_OHE = torch.softmax(y_pred, dim = 1)
-            else:
-                y_pred_OHE = y_pred
-
-
-            y_pred_reorder = y_pred_OHE.permute(0, 2, 3, 1)
             y_test_reorder = y_test.permute(0, 2, 3, 1)
             x_test_reorder = x_test.permute(0, 2, 3, 1)
 
             img = x_test_reorder.cpu().detach().numpy()[10]
             img_processor = ImageProcessor()
 
-            argmaxed_pred = img_processor.mask_argmax(y_pred_reorder.cpu().detach().numpy()[10])
+            argmaxed_pred = np.eye(4, dtype = np.float32)[y_pred[10]]
             argmaxed_test = y_test_reorder.cpu().detach().numpy()[10]
 
             predicted_image_decoded = img_processor.reverse_one_hot_encode(argmaxed_pred)
@@ -181,18 +215,19 @@ def get_random_prediction(test_data_loader, device):
     print('random iou: ', (running_iou/len(test_data_loader)).numpy()+0)
     return
 
-def single_real_test(test_data_loader, device, DATA_PATH):
+def single_real_test(test_data_loader, device, DATA_PATH, paths = None, prediction_cache = None):
     '''
     testing a single image - for report images
     :param test_data_loader: testing data loader
     :param device: pytorch device
     :param DATA_PATH: path to data
+    :param paths: ProjectPaths of the models/results, None for the project this file is in
+    :param prediction_cache: PredictionCache of the predicted masks, None for the one of paths
     :return:
     '''
-    CODE_PATH = os.getcwd()
-    os.chdir('..')
-    BASE_PATH = os.getcwd()
-    os.chdir(CODE_PATH)
+    paths = ProjectPaths() if paths is None else paths
+    prediction_cache = shared_cache(paths.prediction_cache) if prediction_cache is None else prediction_cache
+    BASE_PATH = paths.base
     all_models = []
     Closs = smp.utils.losses.CrossEntropyLoss()
     metrics = [
@@ -247,28 +282,27 @@ def single_real_test(test_data_loader, device, DATA_PATH):
                 continue
             for model in all_models:
                 model.model.eval()
-                y_pred = model.model(x_test.float())
-                if 'scratch' not in model.name:
-                    y_pred = torch.softmax(y_pred, dim = 1)
-                iou_score = iou(torch.argmax(y_pred.float(), dim = 1).cpu(), torch.argmax(y_test.float(), dim = 1).cpu())
+                y_pred = torch.from_numpy(predict_masks(model, x_test.float(), prediction_cache, device)).long()
+                iou_score = iou(y_pred, torch.argmax(y_test.float(), dim = 1).cpu())
                 running[model.name] += iou_score
                 res.append([model.name, count, 'real_test_iou', iou_score.numpy()+0])
             count += 1
     print(count, ' total images')
     print(res)
 
-def get_real_stats(test_data_loader, device, DATA_PATH):
+def get_real_stats(test_data_loader, device, DATA_PATH, paths = None, prediction_cache = None):
     '''
     get stats for real image testing - new function needed because of problematic real image dimensions
     :param test_data_loader: testing data loader
     :param device: pytorch device
     :param DATA_PATH: path to data
+    :param paths: ProjectPaths of the models/results, None for the project this file is in
+    :param prediction_cache: PredictionCache of the predicted masks, None for the one of paths
     :return:
     '''
-    CODE_PATH = os.getcwd()
-    os.chdir('..')
-    BASE_PATH = os.getcwd()
-    os.chdir(CODE_PATH)
+    paths = ProjectPaths() if paths is None else paths
+    prediction_cache = shared_cache(paths.prediction_cache) if prediction_cache is None else prediction_cache
+    BASE_PATH = paths.base
     all_models = []
     Closs = smp.utils.losses.CrossEntropyLoss()
     metrics = [
@@ -333,15 +367,48 @@ def get_real_stats(test_data_loader, device, DATA_PATH):
                 continue
             for model in all_models:
                 model.model.eval()
-                y_pred = model.model(x_test.float())
-                if 'scratch' not in model.name:
-                    y_pred = torch.softmax(y_pred, dim = 1)
-                iou_score = iou(torch.argmax(y_pred.float(), dim = 1).cpu(), torch.argmax(y_test.float(), dim = 1).cpu())
+                y_pred = torch.from_numpy(predict_masks(model, x_test.float(), prediction_cache, device)).long()
+                iou_score = iou(y_pred, torch.argmax(y_test.float(), dim = 1).cpu())
                 running[model.name] += iou_score
                 res.append([model.name, count, 'real_test_iou', iou_score.numpy()+0])
             count += 1
     print(count, ' total images')
 
     df = pd.DataFrame(res, columns = ['model_name', 'epoch', 'metric', 'value'])
-    df.to_csv(BASE_PATH + '/Results/real_data_results.csv')
-    return
\ No newline at end of file
+    df.to_csv(os.path.join(paths.results, 'real_data_results.csv'))
+    return
+
+def load_experiment_config(config_path):
+    '''
+    load the experiment config, per model hyperparameters written by tuning.py
+    :param config_path: path to experiment_config.json
+    :return: config dict, {'models': {}} if the file doesn't exist
+    '''
+    if not os.path.exists(config_path):
+        return {'models': {}}
+    with open(config_path) as f:
+        config = json.load(f)
+    config.setdefault('models', {})
+    return config
+
+def save_experiment_config(config, config_path):
+    '''
+    save the experiment config
+    :param config: config dict
+    :param config_path: path to experiment_config.json
+    :return:
+    '''
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent = 4)
+    print(f'experiment config saved to {config_path}')
+
+def get_model_config(config, model_key, param, default):
+    '''
+    look up a hyperparameter of a model in the experiment config
+    :param config: config dict
+    :param model_key: model key, ie: 'RESNET18'
+    :param param: hyperparameter, ie: 'LR'
+    :param default: value to use if the model or parameter isn't in the config
+    :return: hyperparameter value
+    '''
+    return config['models'].get(model_key, {}).get(param, default)
@@ -0,0 +1,128 @@
+"""
+augmentation.py
+Throughput of the augmentation stages: per sample in CustomDataLoader.__getitem__, per batch in the DataLoader
+collate_fn, and per batch on the training device (BatchAugmentation) against loading with no augmentation.
+
+Random render/mask PNGs are written to a temporary folder so the report runs without the dataset.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import pandas as pd
+import torch
+
+from LunarModules.Augmentation import default_augmentation, AugmentationCollate, BatchAugmentation
+from LunarModules.CustomDataLoader import CustomDataLoader
+from torch.utils.data import DataLoader
+
+STAGES = ['none', 'sample', 'batch', 'device']
+# mask colours of the 4 classes, see ImageProcessor.one_hot_encode
+MASK_COLOURS = np.array([[255, 0, 0], [0, 0, 255], [0, 255, 0], [0, 0, 0]], dtype = np.uint8)
+
+
+def write_images(folder, n_images, height = 480, width = 720, seed = 42):
+    '''
+    write n random renders and class masks of the native size
+    :param folder: folder to create render/ and mask/ in
+    :param n_images: number of image/mask pairs
+    :return: render folder, mask folder
+    '''
+    rng = np.random.default_rng(seed)
+    img_folder, mask_folder = os.path.join(folder, 'render'), os.path.join(folder, 'mask')
+    os.makedirs(img_folder, exist_ok = True)
+    os.makedirs(mask_folder, exist_ok = True)
+    for i in range(n_images):
+        img = rng.integers(0, 256, (height, width, 3), dtype = np.uint8)
+        classes = rng.integers(0, 4, (height // 16, width // 16))
+        mask = cv2.resize(MASK_COLOURS[classes], (width, height), interpolation = cv2.INTER_NEAREST)
+        cv2.imwrite(os.path.join(img_folder, f'render{i:04d}.png'), img)
+        cv2.imwrite(os.path.join(mask_folder, f'ground{i:04d}.png'), mask)
+    return img_folder, mask_folder
+
+
+def run_stage(stage, img_folder, mask_folder, imsize, batch_size, num_workers, device, epochs = 2):
+    '''
+    load (and augment) every batch for a few epochs and time it
+    :param stage: 'none', 'sample', 'batch' or 'device'
+    :return: dict of results
+    '''
+    data = CustomDataLoader(img_folder = img_folder, mask_folder = mask_folder, batch_size = batch_size, imsize = imsize, num_classes = 4, split = 'train', augmentation = (stage == 'sample'))
+    kwargs = {'collate_fn': AugmentationCollate(default_augmentation())} if stage == 'batch' else {}
+    loader = DataLoader(data, batch_size = batch_size, shuffle = True, num_workers = num_workers, **kwargs)
+    batch_transform = BatchAugmentation(seed = 42) if stage == 'device' else None
+
+    n_images, t0 = 0, time.perf_counter()
+    for e in range(epochs):
+        if batch_transform is not None:
+            batch_transform.set_epoch(e)
+        for x, y in loader:
+            x, y = x.to(device).float(), y.to(device).float()
+            if batch_transform is not None:
+                x, y = batch_transform(x, y)
+            n_images += x.shape[0]
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - t0
+
+    return {
+        'stage': stage,
+        'device': str(device),
+        'imsize': imsize,
+        'batch_size': batch_size,
+        'num_workers': num_workers,
+        'seconds': round(elapsed, 3),
+        'imgs_per_s': round(n_images / elapsed, 2),
+    }
+
+
+def run_report(stages = STAGES, n_images = 64, imsize = 256, batch_size = 16, num_workers = 0, save_path = None):
+    '''
+    time every augmentation stage on the same random images
+    :param stages: stages to time
+    :param n_images: number of random images to write
+    :param imsize: image size the loader resizes to
+    :param batch_size: batch size
+    :param num_workers: DataLoader workers
+    :param save_path: optional csv path to save the report to
+    :return: report dataframe
+    '''
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        img_folder, mask_folder = write_images(tmp, n_images)
+        for stage in stages:
+            row = run_stage(stage, img_folder, mask_folder, imsize, batch_size, num_workers, device)
+            print(row)
+            rows.append(row)
+
+    report = pd.DataFrame(rows)
+    if 'none' in report.stage.values:
+        base = report.loc[report.stage == 'none', 'seconds'].iloc[0]
+        report['augmentation_overhead_pct'] = (100 * (report.seconds / base - 1)).round(1)
+
+    if save_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok = True)
+        report.to_csv(save_path, index = False)
+        print(f'report saved to {save_path}')
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stages', default = ','.join(STAGES), type = str, required = False)
+    parser.add_argument('--n_images', default = 64, type = int, required = False)
+    parser.add_argument('--imsize', default = 256, type = int, required = False)
+    parser.add_argument('--batch_size', default = 16, type = int, required = False)
+    parser.add_argument('--num_workers', default = 0, type = int, required = False)
+    parser.add_argument('--save', default = 'benchmarks/results/augmentation.csv', type = str, required = False)
+    args = parser.parse_args()
+
+    report = run_report(stages = args.stages.split(','), n_images = args.n_images, imsize = args.imsize, batch_size = args.batch_size, num_workers = args.num_workers, save_path = args.save)
+    print(report.to_string(index = False))
@@ -0,0 +1,152 @@
+"""
+checkpointing_memory.py
+Memory/throughput report for activation checkpointing at several input sizes.
+
+Each (model, size, checkpointing) configuration is run in a fresh process so its peak memory can be read on its own.
+On CPU the peak is the growth of the process max RSS over the memory held before the first training step (model,
+optimizer and inputs), on GPU it is the peak allocated memory.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import time
+
+import pandas as pd
+
+SIZES = [(256, 256), (384, 384), (480, 720)]
+MODELS = ['scratch', 'vgg11_bn', 'resnet18', 'timm-mobilenetv3_large_100']
+
+
+def build_model(name, size, checkpointing):
+    '''
+    build a model for the report, smp models are built without pretrained weights so nothing is downloaded
+    :param name: 'scratch' or an smp encoder name
+    :param size: (height, width) of the input
+    :param checkpointing: turn activation checkpointing on
+    :return: model
+    '''
+    import segmentation_models_pytorch as smp
+    from LunarModules.Model import UNet_scratch, enable_encoder_checkpointing
+
+    if name == 'scratch':
+        return UNet_scratch(out_sz = size, checkpointing = checkpointing)
+    model = smp.Unet(encoder_name = name, encoder_weights = None, classes = 4, activation = None)
+    if checkpointing:
+        enable_encoder_checkpointing(model.encoder)
+    return model
+
+
+def run_config(name, size, checkpointing, batch_size, steps, queue):
+    '''
+    run a few training steps for one configuration and report peak memory and step time
+    '''
+    import torch
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    if name != 'scratch':
+        # smp encoders downsample 5 times, pad the input up to a multiple of 32
+        size = tuple(int(32 * -(-s // 32)) for s in size)
+
+    model = build_model(name, size, checkpointing).to(device)
+    model.train()
+    opt = torch.optim.SGD(model.parameters(), lr = 0.001)
+    loss_fn = torch.nn.CrossEntropyLoss()
+    x = torch.rand(batch_size, 3, *size, device = device)
+    y = torch.randint(0, 4, (batch_size, *size), device = device)
+
+    def step():
+        opt.zero_grad()
+        loss = loss_fn(model(x), y)
+        loss.backward()
+        opt.step()
+
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats()
+        base_cuda = torch.cuda.memory_allocated()
+
+    # warm up so allocator/kernel setup doesn't count towards the timing
+    step()
+
+    t0 = time.perf_counter()
+    for _ in range(steps):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    step_time = (time.perf_counter() - t0) / steps
+
+    if device.type == 'cuda':
+        peak_mb = (torch.cuda.max_memory_allocated() - base_cuda) / 2**20
+    else:
+        # ru_maxrss is in KB on linux
+        peak_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss) / 1024
+
+    queue.put({
+        'model': name,
+        'height': size[0],
+        'width': size[1],
+        'checkpointing': checkpointing,
+        'batch_size': batch_size,
+        'peak_mem_mb': round(peak_mb, 1),
+        'step_time_s': round(step_time, 4),
+        'imgs_per_s': round(batch_size / step_time, 2),
+    })
+
+
+def run_report(models = MODELS, sizes = SIZES, batch_size = 4, steps = 3, save_path = None):
+    '''
+    run every (model, size, checkpointing) configuration in its own process and collect the results
+    :param models: models to report on
+    :param sizes: list of (height, width) input sizes
+    :param batch_size: batch size per step
+    :param steps: number of timed steps
+    :param save_path: optional csv path to save the report to
+    :return: report dataframe
+    '''
+    ctx = mp.get_context('spawn')
+    rows = []
+    for name in models:
+        for size in sizes:
+            for checkpointing in [False, True]:
+                queue = ctx.Queue()
+                p = ctx.Process(target = run_config, args = (name, size, checkpointing, batch_size, steps, queue))
+                p.start()
+                p.join()
+                if p.exitcode != 0 or queue.empty():
+                    print(f'{name} {size} checkpointing={checkpointing} failed (exit code {p.exitcode})')
+                    continue
+                row = queue.get()
+                print(row)
+                rows.append(row)
+
+    report = pd.DataFrame(rows)
+    if len(report) > 0:
+        base = report[~report.checkpointing].set_index(['model', 'height', 'width'])
+        report = report.join(base[['peak_mem_mb', 'step_time_s']], on = ['model', 'height', 'width'], rsuffix = '_no_ckpt')
+        report['mem_saving_pct'] = (100 * (1 - report.peak_mem_mb / report.peak_mem_mb_no_ckpt)).round(1)
+        report['slowdown'] = (report.step_time_s / report.step_time_s_no_ckpt).round(2)
+        report = report.drop(columns = ['peak_mem_mb_no_ckpt', 'step_time_s_no_ckpt'])
+
+    if save_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok = True)
+        report.to_csv(save_path, index = False)
+        print(f'report saved to {save_path}')
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', default = ','.join(MODELS), type = str, required = False)
+    parser.add_argument('--sizes', default = ','.join(f'{h}x{w}' for h, w in SIZES), type = str, required = False)
+    parser.add_argument('--batch_size', default = 4, type = int, required = False)
+    parser.add_argument('--steps', default = 3, type = int, required = False)
+    parser.add_argument('--save', default = 'benchmarks/results/checkpointing_memory.csv', type = str, required = False)
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in s.split('x')) for s in args.sizes.split(',')]
+    report = run_report(models = args.models.split(','), sizes = sizes, batch_size = args.batch_size, steps = args.steps, save_path = args.save)
+    print(report.to_string(index = False))
@@ -0,0 +1,149 @@
+"""
+compile.py
+Steady state train/eval step time of every architecture, eager against torch.compile (Trainer.compile_model).
+
+Each (model, compile) configuration runs in a fresh process, so a compiled run can't reuse the graphs of the previous
+one in memory. `warmup_s` is the first train step and the first eval step, which compile the graphs when compiling (or
+load them from --cache_dir, run the benchmark twice to see the warm cache). The timed steps come after the warm-up.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+MODELS = ['scratch', 'vgg11_bn', 'resnet18', 'timm-mobilenetv3_large_100']
+
+
+def build_model(name, imsize):
+    '''
+    build a model for the benchmark, smp models are built without pretrained weights so nothing is downloaded
+    :param name: 'scratch' or an smp encoder name
+    :param imsize: input size
+    :return: model
+    '''
+    import segmentation_models_pytorch as smp
+    from LunarModules.Model import UNet_scratch
+
+    if name == 'scratch':
+        return UNet_scratch(out_sz = (imsize, imsize))
+    return smp.Unet(encoder_name = name, encoder_weights = None, classes = 4, activation = None)
+
+
+def run_config(name, compile, imsize, batch_size, steps, cache_dir, queue):
+    '''
+    warm up then time train and eval steps of one configuration
+    '''
+    import torch
+    from LunarModules.Trainer import compile_model, accumulate_gradients
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    model = build_model(name, imsize).to(device)
+    network = compile_model(model, cache_dir) if compile else model
+    opt = torch.optim.SGD(model.parameters(), lr = 0.001)
+    loss_fn = torch.nn.CrossEntropyLoss()
+    x = torch.rand(batch_size, 3, imsize, imsize, device = device)
+    y = torch.nn.functional.one_hot(torch.randint(0, 4, (batch_size, imsize, imsize), device = device), 4).permute(0, 3, 1, 2).float()
+
+    def train_step():
+        opt.zero_grad()
+        accumulate_gradients(network, loss_fn, x, y)
+        opt.step()
+
+    def eval_step():
+        with torch.no_grad():
+            network(x)
+
+    def timed(step, mode):
+        network.train(mode == 'train')
+        times = []
+        for _ in range(steps):
+            t0 = time.perf_counter()
+            step()
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            times.append(time.perf_counter() - t0)
+        return float(np.median(times))
+
+    t0 = time.perf_counter()
+    network.train()
+    train_step()
+    network.eval()
+    eval_step()
+    warmup = time.perf_counter() - t0
+
+    train_s = timed(train_step, 'train')
+    eval_s = timed(eval_step, 'eval')
+    queue.put({
+        'model': name,
+        'compile': compile,
+        'imsize': imsize,
+        'batch_size': batch_size,
+        'threads': torch.get_num_threads(),
+        'warmup_s': round(warmup, 2),
+        'train_step_s': round(train_s, 4),
+        'eval_step_s': round(eval_s, 4),
+    })
+
+
+def run_benchmark(models = MODELS, imsize = 256, batch_size = 4, steps = 10, cache_dir = None, save_path = None):
+    '''
+    run every (model, compile) configuration in its own process and collect the results
+    :param models: models to benchmark
+    :param imsize: input size
+    :param batch_size: batch size per step
+    :param steps: number of timed steps after the warm-up
+    :param cache_dir: compile cache folder, None for inductor's default
+    :param save_path: optional csv path to save the results to
+    :return: results dataframe
+    '''
+    ctx = mp.get_context('spawn')
+    rows = []
+    for name in models:
+        for compile in [False, True]:
+            queue = ctx.Queue()
+            p = ctx.Process(target = run_config, args = (name, compile, imsize, batch_size, steps, cache_dir, queue))
+            p.start()
+            p.join()
+            if p.exitcode != 0 or queue.empty():
+                print(f'{name} compile={compile} failed (exit code {p.exitcode})')
+                continue
+            row = queue.get()
+            print(row)
+            rows.append(row)
+
+    results = pd.DataFrame(rows)
+    if len(results) > 0:
+        eager = results[~results.compile].set_index('model')[['warmup_s', 'train_step_s', 'eval_step_s']]
+        results = results.join(eager, on = 'model', rsuffix = '_eager')
+        results['train_speedup'] = (results.train_step_s_eager / results.train_step_s).round(2)
+        results['eval_speedup'] = (results.eval_step_s_eager / results.eval_step_s).round(2)
+        # train steps needed to pay back the extra warm-up time
+        saved = results.train_step_s_eager - results.train_step_s
+        results['break_even_steps'] = np.ceil((results.warmup_s - results.warmup_s_eager) / saved.where(saved > 0))
+        results = results.drop(columns = ['warmup_s_eager', 'train_step_s_eager', 'eval_step_s_eager'])
+
+    if save_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok = True)
+        results.to_csv(save_path, index = False)
+        print(f'results saved to {save_path}')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', default = ','.join(MODELS), type = str, required = False)
+    parser.add_argument('--imsize', default = 256, type = int, required = False)
+    parser.add_argument('--batch_size', default = 4, type = int, required = False)
+    parser.add_argument('--steps', default = 10, type = int, required = False)
+    parser.add_argument('--cache_dir', default = '../Models/compile_cache', type = str, required = False)
+    parser.add_argument('--save', default = 'benchmarks/results/compile.csv', type = str, required = False)
+    args = parser.parse_args()
+
+    results = run_benchmark(models = args.models.split(','), imsize = args.imsize, batch_size = args.batch_size, steps = args.steps, cache_dir = args.cache_dir, save_path = args.save)
+    print(results.to_string(index = False))
@@ -0,0 +1,185 @@
+"""
+cpu_threads.py
+Sweep of the CPU profiles (LunarModules/CPUProfile.py) of a core count: how many DataLoader workers, how many torch
+threads and whether to pin them, timed on end to end train steps. The best profile can be written to the "cpu" section
+of experiment_config.json, where modeling.py reads it.
+
+Each profile runs in a fresh process restricted to the first --cores cores, so the thread settings of one don't carry
+over to the next and a smaller machine can be simulated. `default` is the run without a profile: torch's own thread
+count, OpenCV's own pool in every worker and no pinning, with the same number of workers as the default profile.
+Synthetic lunar-style renders/masks (benchmarks/pipeline.py) are written to a temporary folder.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.pipeline import write_dataset, build_model
+
+
+def worker_counts(n_cores):
+    '''
+    :param n_cores: core count
+    :return: DataLoader worker counts to try, 0 then powers of 2 up to half the cores
+    '''
+    counts, n = [0], 1
+    while n <= max(n_cores // 2, 1):
+        counts.append(n)
+        n *= 2
+    return counts
+
+
+def run_profile(label, profile_values, cores, name, img_folder, mask_folder, imsize, batch_size, steps, warmup, queue):
+    '''
+    time train steps with one profile, profile_values None for the default settings
+    '''
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    import torch
+    from torch.utils.data import DataLoader
+    from LunarModules.CPUProfile import CPUProfile, default_profile
+    from LunarModules.CustomDataLoader import CustomDataLoader
+
+    if profile_values is None:
+        profile = default_profile(cores)
+        loader_kwargs = {'num_workers': profile.num_workers, 'persistent_workers': True} if profile.num_workers > 0 else {}
+    else:
+        profile = CPUProfile.from_dict(profile_values, cores).apply()
+        loader_kwargs = profile.loader_kwargs()
+
+    torch.manual_seed(42)
+    model, loss_fn = build_model(name, imsize)
+    model.train()
+    opt = torch.optim.SGD(model.parameters(), lr = 0.001, momentum = 0.9)
+    data = CustomDataLoader(img_folder = img_folder, mask_folder = mask_folder, batch_size = batch_size, imsize = imsize, num_classes = 4, split = 'train', encoded_masks = False)
+    loader = DataLoader(data, batch_size = batch_size, shuffle = True, drop_last = True, **loader_kwargs)
+
+    def batches():
+        while True:
+            for batch in loader:
+                yield batch
+
+    stream = batches()
+    times = []
+    for i in range(warmup + steps):
+        t0 = time.perf_counter()
+        x, y = next(stream)
+        opt.zero_grad()
+        loss = loss_fn(model(x.float()), torch.argmax(y.float(), dim = 1))
+        loss.backward()
+        opt.step()
+        if i >= warmup:
+            times.append(time.perf_counter() - t0)
+
+    step_s = float(np.median(times))
+    queue.put(dict({
+        'profile': label,
+        'cores': len(cores),
+        'model': name,
+        'torch_threads': torch.get_num_threads(),
+        'num_workers': profile.num_workers,
+        'step_s': round(step_s, 4),
+        'imgs_per_s': round(batch_size / step_s, 2),
+    }, **({} if profile_values is None else profile_values)))
+
+
+def run_sweep(n_cores = None, name = 'scratch', n_images = 32, imsize = 256, batch_size = 8, steps = 10, warmup = 3, pin = (False, True), save_path = None):
+    '''
+    time the default settings and every profile of a core count
+    :param n_cores: number of cores to use, None for every core of this process
+    :param name: architecture, 'scratch' or an smp encoder name
+    :param n_images: number of synthetic images to write
+    :param imsize: image size the loader resizes to
+    :param batch_size: batch size
+    :param steps: timed train steps
+    :param warmup: untimed train steps first (worker start up, first batches)
+    :param pin: pinning settings to try
+    :param save_path: optional csv path to save the results to
+    :return: results dataframe, best first
+    '''
+    from LunarModules.CPUProfile import available_cores
+
+    cores = available_cores()
+    cores = cores[:n_cores] if n_cores is not None else cores
+    configs = [('default', None)]
+    for num_workers in worker_counts(len(cores)):
+        for pinned in pin:
+            values = {'intra_op_threads': max(len(cores) - num_workers, 1), 'inter_op_threads': 1, 'num_workers': num_workers, 'cv2_threads': 1, 'pin': pinned}
+            configs.append((f'w{num_workers}_t{values["intra_op_threads"]}' + ('_pin' if pinned else ''), values))
+
+    ctx = mp.get_context('spawn')
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        img_folder, mask_folder = write_dataset(tmp, n_images)
+        for label, values in configs:
+            queue = ctx.Queue()
+            p = ctx.Process(target = run_profile, args = (label, values, cores, name, img_folder, mask_folder, imsize, batch_size, steps, warmup, queue))
+            p.start()
+            p.join()
+            if p.exitcode != 0 or queue.empty():
+                print(f'{label} failed (exit code {p.exitcode})')
+                continue
+            row = queue.get()
+            print(row)
+            rows.append(row)
+
+    results = pd.DataFrame(rows)
+    if len(results) > 0:
+        default = results.loc[results.profile == 'default', 'step_s']
+        if len(default) > 0:
+            results['speedup'] = (default.iloc[0] / results.step_s).round(2)
+        results = results.sort_values(by = 'step_s').reset_index(drop = True)
+
+    if save_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok = True)
+        results.to_csv(save_path, index = False)
+        print(f'results saved to {save_path}')
+    return results
+
+
+def best_profile(results):
+    '''
+    :param results: run_sweep results
+    :return: dict of the fastest profile for the config, None if the default settings were the fastest
+    '''
+    profiles = results[results.profile != 'default']
+    if len(profiles) == 0 or profiles.step_s.min() > results.step_s.min():
+        return None
+    best = profiles.iloc[profiles.step_s.argmin()]
+    return {'intra_op_threads': int(best.intra_op_threads), 'inter_op_threads': int(best.inter_op_threads), 'num_workers': int(best.num_workers), 'cv2_threads': int(best.cv2_threads), 'pin': bool(best.pin)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cores', default = None, type = int, required = False, help = 'cores to sweep for, default every core')
+    parser.add_argument('--model', default = 'scratch', type = str, required = False)
+    parser.add_argument('--n_images', default = 32, type = int, required = False)
+    parser.add_argument('--imsize', default = 256, type = int, required = False)
+    parser.add_argument('--batch_size', default = 8, type = int, required = False)
+    parser.add_argument('--steps', default = 10, type = int, required = False)
+    parser.add_argument('--write_config', action = 'store_true', required = False, help = 'write the best profile to experiment_config.json')
+    parser.add_argument('--save', default = 'benchmarks/results/cpu_threads.csv', type = str, required = False)
+    args = parser.parse_args()
+
+    results = run_sweep(n_cores = args.cores, name = args.model, n_images = args.n_images, imsize = args.imsize, batch_size = args.batch_size, steps = args.steps, save_path = args.save)
+    print(results.to_string(index = False))
+
+    if args.write_config:
+        from LunarModules.Paths import ProjectPaths
+        from LunarModules.utils import load_experiment_config, save_experiment_config
+
+        best = best_profile(results)
+        if best is None:
+            print('the default settings were the fastest, nothing written')
+        else:
+            config_path = ProjectPaths().experiment_config
+            config = load_experiment_config(config_path)
+            config.setdefault('cpu', {})[str(int(results.cores.iloc[0]))] = best
+            save_experiment_config(config, config_path)
@@ -0,0 +1,106 @@
+"""
+import_time.py
+Import time of the modules every main.py step loads, from `python -X importtime` run in a fresh interpreter per
+module, with the heaviest packages behind each one.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+# main.py step -> module it imports
+TARGETS = {
+    'split': 'LunarModules.TrainTestSplit',
+    'eda': 'EDA',
+    'download_data': 'google_drive_data_download',
+    'download_models': 'trained_model_dl',
+    'synthetic': 'LunarModules.SyntheticData',
+    'pyramid': 'LunarModules.ImagePyramid',
+    'modeling': 'modeling',
+}
+
+
+def parse_importtime(stderr):
+    '''
+    parse the -X importtime report
+    :param stderr: stderr of the interpreter
+    :return: list of (package, self us, cumulative us, depth)
+    '''
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def time_import(module, python = sys.executable):
+    '''
+    import a module in a fresh interpreter
+    :param module: module name, imported from the Code directory
+    :return: wall time in s, parsed importtime rows
+    '''
+    t0 = time.perf_counter()
+    result = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'], capture_output = True, text = True, cwd = os.getcwd())
+    wall = time.perf_counter() - t0
+    if result.returncode != 0:
+        print(f'importing {module} failed:\n{result.stderr.splitlines()[-1] if result.stderr else ""}')
+    return wall, parse_importtime(result.stderr)
+
+
+def run_report(targets = TARGETS, top = 5, repeats = 3, save_path = None):
+    '''
+    time the import of every target, the fastest of some runs is kept (the first one also pays the disk cache)
+    :param targets: dict step -> module
+    :param top: number of heaviest packages to list per target
+    :param repeats: runs per target
+    :param save_path: optional csv path to save the report to
+    :return: report dataframe
+    '''
+    baseline = min(time_import('os')[0] for _ in range(repeats))
+    rows = []
+    for step, module in targets.items():
+        runs = [time_import(module) for _ in range(repeats)]
+        wall, imports = min(runs, key = lambda run: run[0])
+        target = [i for i, row in enumerate(imports) if row[0] == module and row[3] == 0]
+        # importtime lists the imports of a module right before it, one level deeper
+        direct = []
+        for row in reversed(imports[:target[0]] if target else []):
+            if row[3] == 0:
+                break
+            if row[3] == 1:
+                direct.append(row)
+        direct.sort(key = lambda row: -row[2])
+        rows.append({
+            'step': step,
+            'module': module,
+            'startup_s': round(wall - baseline, 3),
+            'import_s': round(imports[target[0]][2] / 1e6, 3) if target else None,
+            'heaviest': ', '.join(f'{name} {cumulative / 1e6:.2f}s' for name, _, cumulative, _ in direct[:top]),
+        })
+        print(f"{step:16s} {module:32s} {rows[-1]['startup_s']:6.2f}s  {rows[-1]['heaviest']}")
+
+    report = pd.DataFrame(rows)
+    if save_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok = True)
+        report.to_csv(save_path, index = False)
+        print(f'report saved to {save_path}')
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--steps', default = ','.join(TARGETS.keys()), type = str, required = False)
+    parser.add_argument('--top', default = 5, type = int, required = False)
+    parser.add_argument('--repeats', default = 3, type = int, required = False)
+    parser.add_argument('--save', default = 'benchmarks/results/import_time.csv', type = str, required = False)
+    args = parser.parse_args()
+    run_report(targets = {step: TARGETS[step] for step in args.steps.split(',')}, top = args.top, repeats = args.repeats, save_path = args.save)
@@ -0,0 +1,338 @@
+"""
+pipeline.py
+Throughput suite for the hot paths of the pipeline, each timed in isolation and end to end:
+CustomDataLoader.__getitem__, ImageProcessor.one_hot_encode / reverse_one_hot_encode / data_augmentation, the forward
+and backward pass of every architecture, and full train steps from the DataLoader to the optimizer.
+
+Synthetic lunar-style renders and masks (LunarModules/SyntheticData.py) are written to a temporary folder so the suite runs without the dataset.
+Results are saved as JSON (timings plus the commit, versions and settings they were taken with), and two result files
+can be compared to spot regressions between commits.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from LunarModules.SyntheticData import lunar_pair, write_rgb
+
+ARCHITECTURES = ['scratch', 'vgg11_bn', 'resnet18', 'timm-mobilenetv3_large_100']
+
+
+def write_dataset(folder, n_images, height = 480, width = 720, seed = 42):
+    '''
+    write n synthetic render/mask pairs with the dataset's file names (render0001.png, ground0001.png)
+    :param folder: folder to create render/ and mask/ in
+    :param n_images: number of pairs
+    :return: render folder, mask folder
+    '''
+    rng = np.random.default_rng(seed)
+    img_folder, mask_folder = os.path.join(folder, 'render'), os.path.join(folder, 'mask')
+    os.makedirs(img_folder, exist_ok = True)
+    os.makedirs(mask_folder, exist_ok = True)
+    for i in range(1, n_images + 1):
+        render, mask = lunar_pair(rng, height, width)
+        write_rgb(os.path.join(img_folder, f'render{i:04d}.png'), render)
+        write_rgb(os.path.join(mask_folder, f'ground{i:04d}.png'), mask)
+    return img_folder, mask_folder
+
+
+def time_fn(fn, repeats = 10, warmup = 2, device = None):
+    '''
+    time a function, CUDA is synchronized around every call
+    :param fn: function without arguments
+    :param repeats: timed calls
+    :param warmup: untimed calls first
+    :return: dict of timing stats in ms
+    '''
+    def sync():
+        if device is not None and device.type == 'cuda':
+            torch.cuda.synchronize(device)
+
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        sync()
+        t0 = time.perf_counter()
+        fn()
+        sync()
+        times.append(1000 * (time.perf_counter() - t0))
+    return summarize(times)
+
+
+def summarize(times):
+    '''
+    :param times: list of times in ms
+    :return: dict of timing stats in ms
+    '''
+    times = np.array(times)
+    return {
+        'median_ms': round(float(np.median(times)), 3),
+        'mean_ms': round(float(times.mean()), 3),
+        'std_ms': round(float(times.std()), 3),
+        'min_ms': round(float(times.min()), 3),
+        'repeats': len(times),
+    }
+
+
+def build_model(name, imsize):
+    '''
+    build a model without pretrained weights so nothing is downloaded
+    :param name: 'scratch' or an smp encoder name
+    :return: model, loss
+    '''
+    import segmentation_models_pytorch as smp
+    from LunarModules.Model import UNet_scratch
+
+    if name == 'scratch':
+        return UNet_scratch(verbose = False, out_sz = (imsize, imsize)), torch.nn.CrossEntropyLoss()
+    model = smp.Unet(encoder_name = name, encoder_weights = None, classes = 4, activation = None)
+    return model, torch.nn.CrossEntropyLoss()
+
+
+def plt_imread(path):
+    '''
+    read a PNG like CustomDataLoader does (RGB, values between 0 and 1)
+    '''
+    import matplotlib.pyplot as plt
+    return plt.imread(path)
+
+
+def bench_processing(img_folder, mask_folder, imsize, repeats, warmup):
+    '''
+    time __getitem__ and the ImageProcessor functions on one sample
+    :return: dict of results
+    '''
+    from LunarModules.CustomDataLoader import CustomDataLoader
+    from LunarModules.ImageProcessor import ImageProcessor
+
+    results = {}
+    data = CustomDataLoader(img_folder = img_folder, mask_folder = mask_folder, batch_size = 1, imsize = imsize, num_classes = 4, split = 'train', encoded_masks = False)
+    idx = iter(np.random.default_rng(0).integers(0, len(data), warmup + repeats))
+    results['getitem'] = time_fn(lambda: data[next(idx)], repeats, warmup)
+
+    augmented = CustomDataLoader(img_folder = img_folder, mask_folder = mask_folder, batch_size = 1, imsize = imsize, num_classes = 4, split = 'train', encoded_masks = False, augmentation = True)
+    idx = iter(np.random.default_rng(0).integers(0, len(data), warmup + repeats))
+    results['getitem_augmented'] = time_fn(lambda: augmented[next(idx)], repeats, warmup)
+
+    processor = ImageProcessor()
+    mask = cv2.resize(plt_imread(os.path.join(mask_folder, data.masks_list[0])), (imsize, imsize), interpolation = cv2.INTER_NEAREST)
+    image = cv2.resize(plt_imread(os.path.join(img_folder, data.images_list[0])), (imsize, imsize))
+    one_hot = processor.one_hot_encode(mask)
+
+    results['one_hot_encode'] = time_fn(lambda: processor.one_hot_encode(mask), repeats, warmup)
+    results['encode_mask'] = time_fn(lambda: processor.encode_mask(mask), repeats, warmup)
+    results['reverse_one_hot_encode'] = time_fn(lambda: processor.reverse_one_hot_encode(one_hot), repeats, warmup)
+    results['data_augmentation'] = time_fn(lambda: processor.data_augmentation(image, one_hot), repeats, warmup)
+    return results
+
+
+def bench_model(name, imsize, batch_size, device, repeats, warmup):
+    '''
+    time the forward pass (with the loss) and the backward pass of one architecture on a random batch
+    :return: dict of results
+    '''
+    torch.manual_seed(42)
+    model, loss_fn = build_model(name, imsize)
+    model = model.to(device)
+    model.train()
+    x = torch.rand(batch_size, 3, imsize, imsize, device = device)
+    y = torch.randint(0, 4, (batch_size, imsize, imsize), device = device)
+
+    def sync():
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+
+    forward, backward = [], []
+    for i in range(warmup + repeats):
+        model.zero_grad()
+        sync()
+        t0 = time.perf_counter()
+        loss = loss_fn(model(x), y)
+        sync()
+        t1 = time.perf_counter()
+        loss.backward()
+        sync()
+        t2 = time.perf_counter()
+        if i >= warmup:
+            forward.append(1000 * (t1 - t0))
+            backward.append(1000 * (t2 - t1))
+
+    results = {f'forward_{name}': summarize(forward), f'backward_{name}': summarize(backward)}
+    for key in results:
+        results[key]['imgs_per_s'] = round(1000 * batch_size / results[key]['median_ms'], 2)
+    return results
+
+
+def bench_end_to_end(name, img_folder, mask_folder, imsize, batch_size, device, steps, warmup):
+    '''
+    time full train steps: fetch a batch from the DataLoader, move it to the device, forward, backward, optimizer step
+    :return: dict of results
+    '''
+    from LunarModules.CustomDataLoader import CustomDataLoader
+    from torch.utils.data import DataLoader
+
+    torch.manual_seed(42)
+    model, loss_fn = build_model(name, imsize)
+    model = model.to(device)
+    model.train()
+    opt = torch.optim.SGD(model.parameters(), lr = 0.001, momentum = 0.9)
+    data = CustomDataLoader(img_folder = img_folder, mask_folder = mask_folder, batch_size = batch_size, imsize = imsize, num_classes = 4, split = 'train', encoded_masks = False)
+    loader = DataLoader(data, batch_size = batch_size, shuffle = True, drop_last = True, generator = torch.Generator().manual_seed(42))
+
+    def batches():
+        while True:
+            for batch in loader:
+                yield batch
+
+    stream = batches()
+
+    def step():
+        x, y = next(stream)
+        x, y = x.to(device).float(), y.to(device).float()
+        opt.zero_grad()
+        loss = loss_fn(model(x), torch.argmax(y, dim = 1))
+        loss.backward()
+        opt.step()
+
+    result = time_fn(step, steps, warmup, device)
+    result['imgs_per_s'] = round(1000 * batch_size / result['median_ms'], 2)
+    return {f'train_step_{name}': result}
+
+
+def git_commit():
+    '''
+    :return: short hash of the checked out commit, None outside a git repo
+    '''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(architectures = ARCHITECTURES, n_images = 16, imsize = 256, batch_size = 4, repeats = 10, warmup = 2, steps = 5, threads = None, save_path = None):
+    '''
+    run every benchmark on the same synthetic images
+    :param architectures: architectures to time the forward/backward pass and train steps of
+    :param n_images: number of synthetic render/mask pairs to write
+    :param imsize: image size the data loader resizes to and the models are run at
+    :param batch_size: batch size of the model benchmarks
+    :param repeats: timed calls per benchmark
+    :param warmup: untimed calls before each benchmark
+    :param steps: timed train steps per architecture in the end to end benchmark
+    :param threads: torch CPU threads, None to keep the default
+    :param save_path: optional JSON path to save the results to
+    :return: dict with 'meta' and 'results'
+    '''
+    if threads is not None:
+        torch.set_num_threads(threads)
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    np.random.seed(42)
+    torch.manual_seed(42)
+
+    suite = {
+        'meta': {
+            'commit': git_commit(),
+            'date': dt.datetime.now().isoformat(timespec = 'seconds'),
+            'python': sys.version.split()[0],
+            'torch': torch.__version__,
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'device': str(device) if device.type == 'cpu' else torch.cuda.get_device_name(device),
+            'torch_threads': torch.get_num_threads(),
+            'cpu_count': os.cpu_count(),
+            'settings': {'n_images': n_images, 'imsize': imsize, 'batch_size': batch_size, 'repeats': repeats, 'warmup': warmup, 'steps': steps},
+        },
+        'results': {},
+    }
+    results = suite['results']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        img_folder, mask_folder = write_dataset(tmp, n_images)
+        print('----- processing')
+        results.update(bench_processing(img_folder, mask_folder, imsize, repeats, warmup))
+        for name in architectures:
+            print(f'----- {name}')
+            results.update(bench_model(name, imsize, batch_size, device, repeats, warmup))
+            results.update(bench_end_to_end(name, img_folder, mask_folder, imsize, batch_size, device, steps, warmup))
+
+    for key, value in results.items():
+        print(f"{key:40s} {value['median_ms']:10.2f} ms")
+
+    if save_path is not None:
+        save_path = save_path.format(commit = suite['meta']['commit'] or 'nogit')
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok = True)
+        with open(save_path, 'w') as f:
+            json.dump(suite, f, indent = 2)
+        print(f'results saved to {save_path}')
+    return suite
+
+
+def compare(base_path, new_path, tolerance = 10.0):
+    '''
+    compare the median times of two result files
+    :param base_path: JSON results to compare against, ie: from the previous commit
+    :param new_path: JSON results to check
+    :param tolerance: change in % of the median above which a benchmark counts as a regression (or improvement)
+    :return: list of benchmark names that regressed
+    '''
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    for key in ['device', 'torch_threads', 'settings']:
+        if base['meta'].get(key) != new['meta'].get(key):
+            print(f"warning: {key} differs ({base['meta'].get(key)} vs {new['meta'].get(key)}), timings may not be comparable")
+    print(f"{'benchmark':40s} {base['meta'].get('commit') or 'base':>12s} {new['meta'].get('commit') or 'new':>12s} {'change':>9s}")
+
+    regressions = []
+    for key in sorted(set(base['results']) | set(new['results'])):
+        if key not in base['results'] or key not in new['results']:
+            print(f"{key:40s} only in {'base' if key in base['results'] else 'new'}")
+            continue
+        old_ms, new_ms = base['results'][key]['median_ms'], new['results'][key]['median_ms']
+        change = 100 * (new_ms / old_ms - 1)
+        status = ''
+        if change > tolerance:
+            status = 'REGRESSION'
+            regressions.append(key)
+        elif change < -tolerance:
+            status = 'faster'
+        print(f'{key:40s} {old_ms:10.2f}ms {new_ms:10.2f}ms {change:+8.1f}% {status}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--architectures', default = ','.join(ARCHITECTURES), type = str, required = False)
+    parser.add_argument('--n_images', default = 16, type = int, required = False)
+    parser.add_argument('--imsize', default = 256, type = int, required = False)
+    parser.add_argument('--batch_size', default = 4, type = int, required = False)
+    parser.add_argument('--repeats', default = 10, type = int, required = False)
+    parser.add_argument('--warmup', default = 2, type = int, required = False)
+    parser.add_argument('--steps', default = 5, type = int, required = False)
+    parser.add_argument('--threads', default = None, type = int, required = False)
+    parser.add_argument('--save', default = 'benchmarks/results/pipeline_{commit}.json', type = str, required = False)
+    parser.add_argument('--compare', default = None, nargs = 2, type = str, required = False, metavar = ('BASE', 'NEW'))
+    parser.add_argument('--tolerance', default = 10.0, type = float, required = False)
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        regressions = compare(args.compare[0], args.compare[1], tolerance = args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+    run_suite(architectures = [a for a in args.architectures.split(',') if a], n_images = args.n_images, imsize = args.imsize, batch_size = args.batch_size, repeats = args.repeats, warmup = args.warmup, steps = args.steps, threads = args.threads, save_path = args.save)
@@ -0,0 +1,168 @@
+"""
+serving_load.py
+Load test of the inference server (serve.py / LunarModules/Serving.py): several client threads post images to
+/predict/<model> as fast as the server answers, at each concurrency level, and report client side throughput and
+latency next to the server's own batching metrics.
+
+Without --url a server is started in this process, with --random_weights its networks are not loaded from
+checkpoints (nothing downloaded, only throughput matters).
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from LunarModules.SyntheticData import lunar_pair
+
+
+def load_images(folder = None, n_images = 16, seed = 42):
+    '''
+    PNG bytes to post, from a folder of images or synthetic renders
+    :param folder: folder of images, None for synthetic renders
+    :return: list of PNG bytes
+    '''
+    if folder is not None:
+        images = []
+        for file in sorted(x for x in os.listdir(folder) if x.lower().endswith(('.png', '.jpg', '.jpeg')))[:n_images]:
+            with open(os.path.join(folder, file), 'rb') as f:
+                images.append(f.read())
+        return images
+    images = []
+    for i in range(n_images):
+        render, _ = lunar_pair(np.random.default_rng([seed, i]))
+        images.append(cv2.imencode('.png', cv2.cvtColor(render, cv2.COLOR_RGB2BGR))[1].tobytes())
+    return images
+
+
+def get_json(url):
+    with urlopen(url, timeout = 30) as response:
+        return json.loads(response.read())
+
+
+def run_clients(url, model, images, concurrency, n_requests):
+    '''
+    post n_requests images from `concurrency` threads
+    :return: dict of client side results
+    '''
+    latencies = []
+    batch_sizes = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(n_requests))
+
+    def client():
+        for i in counter:
+            request = Request(f'{url}/predict/{model}', data = images[i % len(images)], headers = {'Content-Type': 'image/png'}, method = 'POST')
+            t0 = time.perf_counter()
+            try:
+                with urlopen(request, timeout = 60) as response:
+                    response.read()
+                    batch_size = int(response.headers.get('X-Batch-Size', 0))
+            except (HTTPError, OSError) as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+                batch_sizes.append(batch_size)
+
+    threads = [threading.Thread(target = client) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - t0
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': len(latencies) / wall,
+        'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) > 0 else None,
+        'latency_p90_ms': float(np.percentile(latencies, 90)) if len(latencies) > 0 else None,
+        'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) > 0 else None,
+        'mean_batch_size': float(np.mean(batch_sizes)) if len(batch_sizes) > 0 else None,
+    }
+
+
+def start_local_server(model, imsize, max_batch_size, max_wait_ms, random_weights, base_path = None):
+    '''
+    inference server on a free port of this process
+    :return: InferenceServer
+    '''
+    from LunarModules.Serving import InferenceServer, DynamicBatcher, load_batchers
+    from LunarModules.Inference import build_network
+    from LunarModules.Paths import ProjectPaths
+
+    if random_weights:
+        batchers = {model: DynamicBatcher(model, build_network(model, imsize).eval(), imsize, max_batch_size, max_wait_ms).start()}
+    else:
+        batchers = load_batchers([model], paths = ProjectPaths(base_path), imsize = imsize, max_batch_size = max_batch_size, max_wait_ms = max_wait_ms)
+    return InferenceServer(batchers, port = 0).start()
+
+
+def run_load_test(url, model, images, concurrency = (1, 4, 16), n_requests = 64, save_path = None):
+    '''
+    run the clients at every concurrency level
+    :return: results dataframe
+    '''
+    rows = []
+    for level in concurrency:
+        before = get_json(f'{url}/metrics')[model]
+        row = run_clients(url, model, images, level, n_requests)
+        after = get_json(f'{url}/metrics')[model]
+        # server side batching of this level only
+        batches = after['batches'] - before['batches']
+        row['server_batches'] = batches
+        row['server_mean_batch_size'] = (after['requests'] - before['requests']) / batches if batches > 0 else None
+        row['server_max_queue_depth'] = after['max_queue_depth']
+        rows.append(row)
+        print(f"concurrency {level:3d}: {row['throughput_rps']:7.2f} req/s  p50 {row['latency_p50_ms']:8.1f} ms  p99 {row['latency_p99_ms']:8.1f} ms  mean batch {row['mean_batch_size']:.2f}  errors {row['errors']}")
+
+    results = pd.DataFrame(rows)
+    if save_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok = True)
+        results.to_csv(save_path, index = False)
+        print(f'results saved to {save_path}')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default = None, type = str, required = False, help = 'running server, ie: http://127.0.0.1:8080, None to start one here')
+    parser.add_argument('--model', default = 'RESNET18_ground', type = str, required = False)
+    parser.add_argument('--images', default = None, type = str, required = False, help = 'folder of images to post, None for synthetic renders')
+    parser.add_argument('--n_images', default = 16, type = int, required = False)
+    parser.add_argument('--concurrency', default = '1,4,16', type = str, required = False)
+    parser.add_argument('--requests', default = 64, type = int, required = False)
+    parser.add_argument('--imsize', default = 256, type = int, required = False)
+    parser.add_argument('--max_batch_size', default = 8, type = int, required = False)
+    parser.add_argument('--max_wait_ms', default = 10, type = float, required = False)
+    parser.add_argument('--random_weights', action = 'store_true', required = False)
+    parser.add_argument('--base_path', default = None, type = str, required = False)
+    parser.add_argument('--save', default = 'benchmarks/results/serving_load.csv', type = str, required = False)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = start_local_server(args.model, args.imsize, args.max_batch_size, args.max_wait_ms, args.random_weights, args.base_path)
+        url = server.url
+        print(f'started a server for {args.model} on {url}, max_batch_size={args.max_batch_size} max_wait_ms={args.max_wait_ms}')
+    try:
+        run_load_test(url, args.model, load_images(args.images, args.n_images), [int(c) for c in args.concurrency.split(',')], args.requests, args.save)
+    finally:
+        if server is not None:
+            server.shutdown()
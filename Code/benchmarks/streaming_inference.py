@@ -0,0 +1,76 @@
+"""
+streaming_inference.py
+Throughput of offline prediction over a folder of images: one step at a time (Inference.predict_files, read a batch,
+predict it, write it) against the overlapped asyncio pipeline (StreamingInference.StreamingPredictor), with the stage
+report of the pipeline.
+
+Synthetic renders are written to a temporary folder and the network has random weights, so the report runs without
+the dataset or a checkpoint.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from LunarModules.Inference import build_network, predict_files, list_images
+from LunarModules.StreamingInference import StreamingPredictor
+from LunarModules.SyntheticData import lunar_pair, write_rgb
+
+
+def write_renders(folder, n_images, seed = 42):
+    os.makedirs(folder, exist_ok = True)
+    for i in range(n_images):
+        render, _ = lunar_pair(np.random.default_rng([seed, i]))
+        write_rgb(os.path.join(folder, f'render{i:04d}.png'), render)
+    return folder
+
+
+def run_benchmark(model = 'Unet_scratch', n_images = 64, imsize = 256, batch_size = 8, decode_workers = 4, write_workers = 2, queue_size = 32, save_path = None):
+    '''
+    :return: results dataframe, one row per method
+    '''
+    network = build_network(model, imsize).eval()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        files = list_images(write_renders(os.path.join(tmp, 'render'), n_images))
+
+        t0 = time.perf_counter()
+        predict_files(network, files, os.path.join(tmp, 'sequential'), imsize, batch_size)
+        sequential = time.perf_counter() - t0
+        rows.append({'method': 'sequential', 'seconds': sequential, 'images_per_s': n_images / sequential})
+
+        predictor = StreamingPredictor(network, imsize, batch_size, decode_workers, write_workers, queue_size)
+        predictor.run(files, os.path.join(tmp, 'streaming'))
+        rows.append({'method': 'streaming', 'seconds': predictor.wall, 'images_per_s': n_images / predictor.wall})
+
+    results = pd.DataFrame(rows)
+    results['speedup'] = sequential / results.seconds
+    print(results.to_string(index = False))
+    print('\nstreaming stages:')
+    predictor.print_report()
+    if save_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(save_path)), exist_ok = True)
+        results.to_csv(save_path, index = False)
+        predictor.report().to_csv(save_path.replace('.csv', '_stages.csv'), index = False)
+        print(f'results saved to {save_path}')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default = 'Unet_scratch', type = str, required = False)
+    parser.add_argument('--n_images', default = 64, type = int, required = False)
+    parser.add_argument('--imsize', default = 256, type = int, required = False)
+    parser.add_argument('--batch_size', default = 8, type = int, required = False)
+    parser.add_argument('--decode_workers', default = 4, type = int, required = False)
+    parser.add_argument('--write_workers', default = 2, type = int, required = False)
+    parser.add_argument('--queue_size', default = 32, type = int, required = False)
+    parser.add_argument('--save', default = 'benchmarks/results/streaming_inference.csv', type = str, required = False)
+    args = parser.parse_args()
+    run_benchmark(args.model, args.n_images, args.imsize, args.batch_size, args.decode_workers, args.write_workers, args.queue_size, args.save)
@@ -5,48 +5,37 @@ Script to download data from Google Drive link
 author: @saharae, @justjoshtings
 created: 12/09/2022
 """
-import gdown
-import os
-import shutil
-from zipfile import ZipFile
+import argparse
+from LunarModules.DataFetcher import fetch_dataset, DEFAULT_SOURCE
+from LunarModules.Paths import ProjectPaths
 
-def download_data_gdrive(data_url="https://drive.google.com/drive/folders/1UrBuQcoW8i6hzPzpzVWnRyfqVtR2VfoD?usp=sharing"):
+def download_data_gdrive(data_url=DEFAULT_SOURCE, workers=8, paths=None):
     '''
     Function to download data from Google Drive link
-    '''
 
+    Existing data is kept: Data.zip is only downloaded if it is missing or fails verification, and only the files
+    missing from the data folder (paths.data) are extracted (see LunarModules/DataFetcher.py). data_url can also be an http(s) base URL,
+    file:// URL or local directory holding Data.zip.
+    paths is the ProjectPaths to download to, None for the project this file is in.
     '''
-    Set paths
-    '''
-    CODE_PATH = os.getcwd()
-    os.chdir('..')
-    BASE_PATH = os.getcwd()
-    os.chdir(CODE_PATH)
-    DATA_PATH = os.path.join(BASE_PATH, 'Data')
-    ZIP_PATH = os.path.join(BASE_PATH,'lunar_surface_image_data')
-
-    if os.path.exists(DATA_PATH):
-        shutil.rmtree(DATA_PATH)
-    if os.path.exists(ZIP_PATH):
-        shutil.rmtree(ZIP_PATH)
 
     '''
-    Download 
+    Set paths
     '''
-    os.chdir(BASE_PATH)
-    print('Downloading data...')
-    gdown.download_folder(data_url, quiet=True, use_cookies=False)
+    paths = ProjectPaths() if paths is None else paths
+    BASE_PATH = paths.base
+    DATA_PATH = paths.data
 
     '''
-    Unzip: https://www.geeksforgeeks.org/unzipping-files-in-python/
+    Download and unzip
     '''
-    print('Unzipping data...')
-    with ZipFile(BASE_PATH+'/lunar_surfce_image_data/Data.zip', 'r') as zObject:
-    
-        # Extracting all of the zip into a specific location.
-        zObject.extractall(path=BASE_PATH)
+    fetch_dataset(BASE_PATH, source=data_url, workers=workers, DATA_PATH=DATA_PATH)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', default = DEFAULT_SOURCE, type = str, required = False)
+    parser.add_argument('--workers', default = 8, type = int, required = False)
+    args = parser.parse_args()
     print('Running google_drive_data_download.py')
-    download_data_gdrive()
\ No newline at end of file
+    download_data_gdrive(data_url=args.source, workers=args.workers)
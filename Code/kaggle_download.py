@@ -7,12 +7,10 @@ created: 11/11/2022
 """
 
 from LunarModules.KaggleAPI import KaggleAPI
+from LunarModules.Paths import ProjectPaths
 import os
 
-CODE_PATH = os.getcwd()
-os.chdir('..')
-BASE_PATH = os.getcwd()
-os.chdir(CODE_PATH)
+BASE_PATH = ProjectPaths().base
 DATA_PATH = os.path.join(BASE_PATH, 'Data_test')
 
 def kaggle_download():
@@ -1,77 +1,189 @@
-from LunarModules.TrainTestSplit import *
-from google_drive_data_download import *
-from trained_model_dl import *
-from modeling import *
-from EDA import *
-import os
+# Only the standard library is imported up front. Each step imports its modules when it runs, so the split/eda commands
+# start without loading torch, smp, transformers or the modeling code (see benchmarks/import_time.py)
+import sys
 import time
 import argparse
 
-if __name__ == '__main__':
-    CODE_PATH = os.getcwd()
-    os.chdir('..')
-    BASE_PATH = os.getcwd()
-    os.chdir(CODE_PATH)
-    TRAINED_MODELS_PATH = os.path.join(BASE_PATH, 'Models')
-    DATA_PATH = os.path.join(BASE_PATH, 'Data')
-    SPLIT_DATA_PATH = os.path.join(DATA_PATH, 'images', 'train')
-
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--method', default = 'test', type = str, required = False)
-    parser.add_argument('--EDA', default = False, type = bool, required = False)
-    args = parser.parse_args()
-    print('RUNNING WITH METHOD: ', args.method, ' EDA: ', args.EDA)
-
-    TRAIN = False
-    debug = False
-    plot = False
-
-    if args.method == 'test':
-        TRAIN = False
-        debug = False
-        plot = True
-    if args.method == 'train':
-        TRAIN = True
-        debug = False
-        plot = True
-    if args.method == 'debug':
-        TRAIN = True
-        debug = True
-        plot = True
-
-    # download data from google drive
-    if not os.path.exists(DATA_PATH) or len([x for x in os.listdir(DATA_PATH) if x not in ['.DS_Store']]) == 0:
+BENCHMARKS = ['checkpointing_memory', 'augmentation', 'pipeline', 'import_time', 'serving_load', 'streaming_inference', 'compile', 'cpu_threads']
+# --method of the original CLI -> command, debug
+METHODS = {'test': ('evaluate', False), 'train': ('train', False), 'debug': ('train', True), 'split': ('split', False), 'eda': ('eda', False)}
+
+
+def get_data(paths, synthetic = 0, is_main_process = lambda: True):
+    '''
+    make sure the dataset is in paths.data: generate a synthetic one if asked (offline runs and load tests), otherwise
+    download it from google drive (only the missing/unverified archives are downloaded and missing files extracted)
+    :param paths: ProjectPaths
+    :param synthetic: number of synthetic images to generate instead of downloading, 0 to download
+    :return: none
+    '''
+    if not is_main_process() or paths.has_data():
+        return
+    if synthetic > 0:
+        from LunarModules.SyntheticData import generate_dataset
         data_t1 = time.time()
-        print('DOWNLOADING DATA ....')
-        download_data_gdrive()
+        print('GENERATING SYNTHETIC DATA ....')
+        generate_dataset(paths.data, synthetic)
         data_t2 = time.time()
-        print('DOWNLOAD COMPLETE -- ', ((data_t2 - data_t1)/60), ' minutes')
+        print('GENERATION COMPLETE -- ', ((data_t2 - data_t1)/60), ' minutes')
+        return
+
+    from google_drive_data_download import download_data_gdrive
+    data_t1 = time.time()
+    print('DOWNLOADING DATA ....')
+    download_data_gdrive(paths = paths)
+    data_t2 = time.time()
+    print('DOWNLOAD COMPLETE -- ', ((data_t2 - data_t1)/60), ' minutes')
+
+
+def split_data(paths, source = 'ground', resplit = False, encode_masks = 'png', pyramid = False, stratify = False, is_main_process = lambda: True):
+    '''
+    train/val/test split of the data, and the image pyramid if asked
+    :param paths: ProjectPaths
+    :param pyramid: store the split images pre-resized, the data loaders read them instead of resizing every epoch
+    :param stratify: keep the same mix of rock-rich and rock-poor images in every split (LunarModules/Sampling.py)
+    :return: none
+    '''
+    if not is_main_process():
+        return
+    if resplit or not paths.is_split():
+        from LunarModules.TrainTestSplit import run_datasplit
+        print('SPLITTING DATA ....')
+        run_datasplit(SOURCE = source, RESPLIT = resplit, ENCODE_MASKS = encode_masks, paths = paths, STRATIFY = stratify)
+    if pyramid:
+        from LunarModules.ImagePyramid import build_pyramid
+        print('BUILDING IMAGE PYRAMID ....')
+        build_pyramid(paths.data, PYRAMID_PATH = paths.pyramid)
+
+
+def run_eda(paths):
+    from EDA import RUN_EDA
+    print('Running EDA script ....')
+    eda_t1 = time.time()
+    RUN_EDA(paths = paths)
+    eda_t2 = time.time()
+    print('EDA complete -- ', (eda_t2 - eda_t1)/60, ' minutes -- You can now run the EDA notebook if desired')
+
+
+def run_benchmark(name, benchmark_args):
+    '''
+    run a benchmark script of benchmarks/ as if it was started with python -m benchmarks.<name> <benchmark_args>
+    '''
+    import runpy
+    sys.argv = [f'benchmarks/{name}.py'] + benchmark_args
+    runpy.run_module(f'benchmarks.{name}', run_name = '__main__', alter_sys = True)
+
+
+def add_common_arguments(parser, suppress = False):
+    '''
+    options of every command, with suppress the defaults are left to the top level parser (so an option given before
+    the command isn't reset by the command's default)
+    '''
+    default = lambda value: argparse.SUPPRESS if suppress else value
+    parser.add_argument('--base_path', default = default(None), type = str, required = False, help = 'project root, default the folder above Code/')
+    parser.add_argument('--data_path', default = default(None), type = str, required = False, help = 'data folder, default <base_path>/Data')
+    parser.add_argument('--synthetic', default = default(0), type = int, required = False, help = 'generate N synthetic images instead of downloading the data')
+    parser.add_argument('--pyramid', action = 'store_true', default = default(False), required = False)
+    parser.add_argument('--distributed', action = 'store_true', default = default(False), required = False)
+
 
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description = 'Lunar surface segmentation pipeline')
+    # original CLI, used when no command is given
+    parser.add_argument('--method', default = 'test', type = str, required = False, choices = list(METHODS.keys()))
+    parser.add_argument('--EDA', action = 'store_true', required = False)
+    parser.add_argument('--debug', action = 'store_true', required = False)
+    add_common_arguments(parser)
+    commands = parser.add_subparsers(dest = 'command')
 
-    # download trained models from google drive
-    os.chdir(CODE_PATH)
-    if not os.path.exists(TRAINED_MODELS_PATH) or len(os.listdir(TRAINED_MODELS_PATH)) == 0:
+    split = commands.add_parser('split', help = 'get the data and split it into train/val/test')
+    split.add_argument('--source', default = 'ground', type = str, required = False, choices = ['ground', 'clean'])
+    split.add_argument('--resplit', action = 'store_true', required = False)
+    split.add_argument('--encode_masks', default = 'png', type = str, required = False)
+    split.add_argument('--stratify', action = 'store_true', required = False, help = 'stratify the split on the big/small rock pixels of every image')
+    # --method split has no split options, it runs with the split command's defaults
+    parser.set_defaults(**{action.dest: action.default for action in split._actions if action.dest in ['source', 'resplit', 'encode_masks', 'stratify']})
+    commands.add_parser('eda', help = 'get the data and run the EDA')
+    for name, description in [('train', 'train every model, then test them'), ('evaluate', 'test the trained models')]:
+        command = commands.add_parser(name, help = description)
+        command.add_argument('--EDA', action = 'store_true', default = argparse.SUPPRESS, required = False)
+        command.add_argument('--debug', action = 'store_true', default = argparse.SUPPRESS, required = False)
+    predict = commands.add_parser('predict', help = 'predict the masks of images with a trained model')
+    predict.add_argument('--model', default = 'RESNET18_ground', type = str, required = False)
+    predict.add_argument('--input', type = str, required = True, help = 'image or folder of images')
+    predict.add_argument('--output', type = str, required = True, help = 'folder to write the masks to')
+    predict.add_argument('--imsize', default = 256, type = int, required = False)
+    predict.add_argument('--batch_size', default = 8, type = int, required = False)
+    predict.add_argument('--streaming', action = 'store_true', required = False, help = 'overlap decoding, inference and writing (LunarModules/StreamingInference.py)')
+    benchmark = commands.add_parser('benchmark', help = 'run a benchmark script from benchmarks/ (run from Code/)')
+    benchmark.add_argument('name', choices = BENCHMARKS)
+    benchmark.add_argument('benchmark_args', nargs = argparse.REMAINDER, help = 'arguments of the benchmark script')
+    for command in commands.choices.values():
+        add_common_arguments(command, suppress = True)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args.command, debug = METHODS[args.method]
+        args.debug = args.debug or debug
+    return args
+
+
+def main(argv = None):
+    args = parse_args(argv)
+    if args.command == 'benchmark':
+        run_benchmark(args.name, args.benchmark_args)
+        return
+
+    from LunarModules.Paths import ProjectPaths
+    paths = ProjectPaths(args.base_path, data = args.data_path)
+    print('RUNNING COMMAND: ', args.command, ' EDA: ', args.EDA, ' DEBUG: ', args.debug, ' DISTRIBUTED: ', args.distributed, ' PYRAMID: ', args.pyramid, ' SYNTHETIC: ', args.synthetic, ' PATHS: ', paths)
+
+    if args.command == 'predict':
+        if args.streaming:
+            from LunarModules.StreamingInference import stream_predict_folder
+            stream_predict_folder(args.model, args.input, args.output, paths = paths, imsize = args.imsize, batch_size = args.batch_size)
+        else:
+            from LunarModules.Inference import predict_folder
+            predict_folder(args.model, args.input, args.output, paths = paths, imsize = args.imsize, batch_size = args.batch_size)
+        return
+
+    # under torchrun every rank runs this script, only rank 0 downloads/splits while the others wait
+    if args.distributed:
+        from LunarModules.Distributed import setup_distributed, is_main_process, barrier
+        setup_distributed(backend = 'gloo')
+    else:
+        # single process, no need to import torch.distributed for the data steps
+        is_main_process = lambda: True
+        barrier = lambda: None
+
+    get_data(paths, args.synthetic, is_main_process)
+
+    # trained models are downloaded one at a time when a model is loaded and isn't cached (LunarModules/ModelStore.py),
+    # under torchrun rank 0 prefetches them so the ranks don't download the same files at once
+    if is_main_process() and args.distributed:
+        from trained_model_dl import download_trained_models
         models_t1 = time.time()
         print('DOWNLOADING MODELS ....')
-        download_trained_models()
+        download_trained_models(paths = paths)
         models_t2 = time.time()
         print('DOWNLOAD COMPLETE -- ', ((models_t2 - models_t1)/60), ' minutes')
 
-    # do EDA
-    os.chdir(CODE_PATH)
-    if args.EDA:
-        print('Running EDA script ....')
-        eda_t1 = time.time()
-        RUN_EDA()
-        eda_t2 = time.time()
-        print('EDA complete -- ', (eda_t2 - eda_t1)/60, ' minutes -- You can now run the EDA notebook if desired')
-
-    # do traintestsplit
-    if not os.path.exists(SPLIT_DATA_PATH):
-        print('SPLITTING DATA ....')
-        run_datasplit(SOURCE = 'ground' )
+    if (args.EDA or args.command == 'eda') and is_main_process():
+        run_eda(paths)
+    if args.command == 'eda':
+        return
+
+    if args.command == 'split':
+        split_data(paths, source = args.source, resplit = args.resplit, encode_masks = None if args.encode_masks == 'None' else args.encode_masks, pyramid = args.pyramid, stratify = args.stratify)
+        return
+    split_data(paths, pyramid = args.pyramid, is_main_process = is_main_process)
+    barrier()
+
     # Run Modeling and Evaluation
-    RUN_MODEL_LOOP(TRAIN = TRAIN, debug = debug, plot = plot)
-    print("EXITING")
+    from modeling import RUN_MODEL_LOOP
+    RUN_MODEL_LOOP(TRAIN = args.command == 'train', debug = args.debug, plot = True, distributed = args.distributed, paths = paths)
 
 
+if __name__ == '__main__':
+    main()
+    print("EXITING")
@@ -12,6 +12,13 @@ from LunarModules.CustomDataLoader import CustomDataLoader
 from LunarModules.Plotter import Plotter
 from LunarModules.Model import *
 from LunarModules.utils import *
+from LunarModules.Distributed import setup_distributed, cleanup_distributed, is_main_process, barrier, make_data_loader
+from LunarModules.Augmentation import default_augmentation, AugmentationCollate, BatchAugmentation
+from LunarModules.Paths import ProjectPaths
+from LunarModules.PredictionCache import shared_cache
+from LunarModules.Metrics import METRICS
+from LunarModules.CPUProfile import cpu_profile
+from LunarModules.Sampling import BalancedSampler, class_counts, dataset_weights
 from torch.utils.data import Dataset, DataLoader
 from torch.optim import Adam, AdamW
 from transformers import get_scheduler
@@ -28,30 +35,48 @@ import segmentation_models_pytorch as smp
 import segmentation_models_pytorch.utils as smp_utils
 
 
-def RUN_MODEL_LOOP(TRAIN = True, debug = False, plot = True, data_source = 'ground'):
+def RUN_MODEL_LOOP(TRAIN = True, debug = False, plot = True, data_source = 'ground', distributed = False, paths = None):
     '''
     Main loop to run modeling code -- called from main function or from command line
     :param TRAIN: if True the loop will run the full training code
     :param debug:  if True the utility checking functions will be run in the begining before training
     :param plot:  if True the predictions will be plotted from the models as well as the training curves
+    :param distributed: if True, run as one rank of a DistributedDataParallel job on CPU (gloo), launched with torchrun.
+                        Each rank gets a shard of every split, metrics are averaged over ranks, and only rank 0
+                        saves models, writes results and plots
+    :param paths: ProjectPaths of the data/models/results to use, None for the project this file is in
     :return:
     '''
 
     # ---------------------------- SET PATHS
-    CODE_PATH = os.getcwd()
-    os.chdir('..')
-    BASE_PATH = os.getcwd()
-    os.chdir(CODE_PATH)
-    DATA_PATH = os.path.join(BASE_PATH, 'Data')
+    paths = ProjectPaths() if paths is None else paths
+    BASE_PATH = paths.base
+    DATA_PATH = paths.data
 
-    RESULT_PATH = os.path.join(BASE_PATH, 'Results')
+    RESULT_PATH = paths.results
 
     if not os.path.exists(RESULT_PATH):
         os.mkdir(RESULT_PATH)
 
+    # masks predicted by the plots, kept between runs so only new images/checkpoints are predicted again
+    prediction_cache = shared_cache(paths.prediction_cache)
+
     # ----------------------------- SET UP DEVICE
-    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    if distributed:
+        setup_distributed(backend = 'gloo')
+        device = torch.device("cpu")
+    else:
+        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
     print('Using device..', device)
+    # per model LR/batch size/optimizer written by tuning.py and CPU thread splits written by benchmarks/cpu_threads.py,
+    # anything missing falls back to the values below
+    config = load_experiment_config(paths.experiment_config)
+    # share the cores between torch, the DataLoader workers and OpenCV instead of each using all of them
+    loader_kwargs = {}
+    if device.type == 'cpu':
+        profile = cpu_profile(config).apply()
+        loader_kwargs = profile.loader_kwargs()
+        print('Using CPU profile..', profile)
     torch.manual_seed(42)
     np.random.seed(42)
     torch.backends.cudnn.deterministic = True
@@ -62,40 +87,51 @@ def RUN_MODEL_LOOP(TRAIN = True, debug = False, plot = True, data_source = 'grou
 
 
     # ----------------------------- SET PARAMETERS
-    train_img_folder = DATA_PATH + '/images/train/render'
-    train_mask_folder = DATA_PATH + '/images/train/mask'
-    val_img_folder = DATA_PATH + '/images/val/render'
-    val_mask_folder = DATA_PATH + '/images/val/mask'
-    test_img_folder = DATA_PATH + '/images/test/render'
-    test_mask_folder = DATA_PATH + '/images/test/mask'
-    real_test_img_folder = DATA_PATH + '/images/real/real_img'
-    real_test_mask_folder = DATA_PATH + '/images/real/real_mask'
+    train_img_folder, train_mask_folder = paths.split('train')
+    val_img_folder, val_mask_folder = paths.split('val')
+    test_img_folder, test_mask_folder = paths.split('test')
+    real_test_img_folder, real_test_mask_folder = paths.split('real')
+    # pre-resized images from LunarModules/ImagePyramid.py, used if it was built
+    pyramid_root = paths.pyramid if os.path.exists(paths.pyramid) else None
 
     batch_size = 32
     imsize = 256
     num_classes = 4
     all_models = []
+    # 'sample' augments each train image as it is loaded (the original behaviour), opt in to 'batch' to augment whole
+    # collated batches in the DataLoader or 'device' to augment each batch on the training device right before the model
+    # (reseeded every epoch), both change the random stream of the augmentation
+    augmentation = 'sample'
+    # draw the train images weighted by their class pixel counts so rock-rich images come up more often, 0 for uniform
+    # shuffling, 1 to balance the pixels of every class (LunarModules/Sampling.py)
+    balanced_sampling = 0
 
 
     # ----------------------------- GET DATA
-    train_data = CustomDataLoader(img_folder=train_img_folder, mask_folder=train_mask_folder, batch_size=batch_size, imsize=imsize, num_classes=num_classes, split='train', augmentation=True)
-    train_data_loader = DataLoader(train_data, batch_size=batch_size, shuffle=True)
+    train_data = CustomDataLoader(img_folder=train_img_folder, mask_folder=train_mask_folder, batch_size=batch_size, imsize=imsize, num_classes=num_classes, split='train', augmentation=(augmentation == 'sample'), pyramid_root=pyramid_root)
+    train_loader_kwargs = dict(loader_kwargs, collate_fn = AugmentationCollate(default_augmentation())) if augmentation == 'batch' else loader_kwargs
+    batch_transform = BatchAugmentation(default_augmentation(), seed = 42) if augmentation == 'device' else None
+    if balanced_sampling > 0:
+        train_weights = dataset_weights(train_data, class_counts(DATA_PATH, train_mask_folder), power = balanced_sampling)
+        train_loader_kwargs = dict(train_loader_kwargs, sampler = BalancedSampler(train_weights, seed = 42))
+        print(f'Balanced sampling of the train images, weights {train_weights.min():.2f} - {train_weights.max():.2f}')
+    train_data_loader = make_data_loader(train_data, batch_size=batch_size, shuffle=True, **train_loader_kwargs)
 
-    val_data = CustomDataLoader(img_folder=val_img_folder, mask_folder=val_mask_folder, batch_size=batch_size, imsize=imsize, num_classes=num_classes, split='validation', augmentation=False)
-    val_data_loader = DataLoader(val_data, batch_size=batch_size, shuffle=True)
+    val_data = CustomDataLoader(img_folder=val_img_folder, mask_folder=val_mask_folder, batch_size=batch_size, imsize=imsize, num_classes=num_classes, split='validation', augmentation=False, pyramid_root=pyramid_root)
+    val_data_loader = make_data_loader(val_data, batch_size=batch_size, shuffle=True, **loader_kwargs)
 
-    test_data = CustomDataLoader(img_folder=test_img_folder, mask_folder=test_mask_folder, batch_size=batch_size, imsize=imsize, num_classes=num_classes, split='test', augmentation=False)
-    test_data_loader = DataLoader(test_data, batch_size=batch_size, shuffle=True)
+    test_data = CustomDataLoader(img_folder=test_img_folder, mask_folder=test_mask_folder, batch_size=batch_size, imsize=imsize, num_classes=num_classes, split='test', augmentation=False, pyramid_root=pyramid_root)
+    test_data_loader = make_data_loader(test_data, batch_size=batch_size, shuffle=True, **loader_kwargs)
 
-    real_test_data = CustomDataLoader(img_folder=real_test_img_folder, mask_folder=real_test_mask_folder, batch_size=batch_size, imsize=imsize, num_classes=num_classes, split='test', augmentation=False)
-    real_test_data_loader = DataLoader(real_test_data, batch_size=batch_size, shuffle=True)
+    real_test_data = CustomDataLoader(img_folder=real_test_img_folder, mask_folder=real_test_mask_folder, batch_size=batch_size, imsize=imsize, num_classes=num_classes, split='test', augmentation=False, pyramid_root=pyramid_root)
+    real_test_data_loader = make_data_loader(real_test_data, batch_size=batch_size, shuffle=True, **loader_kwargs)
 
 
     # ----------------------------- DEBUGGING
-    if debug:
+    if debug and is_main_process():
         print('debugging')
-        #single_real_test(real_test_data_loader, device, DATA_PATH)
-        #get_real_stats(real_test_data_loader, device, DATA_PATH)
+        #single_real_test(real_test_data_loader, device, DATA_PATH, paths, prediction_cache)
+        #get_real_stats(real_test_data_loader, device, DATA_PATH, paths, prediction_cache)
         #get_random_prediction(test_data_loader, device)
         do_preprocessing_checks(train_data, train_data_loader, train_img_folder, train_mask_folder, real_test_img_folder, real_test_mask_folder)
         test(test_data_loader)
@@ -104,14 +140,42 @@ def RUN_MODEL_LOOP(TRAIN = True, debug = False, plot = True, data_source = 'grou
     # ----------------------------- HYPERPARAMS
     n_epochs = 20
     LR = 0.001
-
-    metrics = {
-        "Dice": Dice(num_classes = 4),
-        "IOU": JaccardIndex(num_classes = 4, task = 'multiclass')
-    }
+    # set to e.g. 8 on memory-limited nodes, gradients are accumulated so the effective batch size stays batch_size
+    micro_batch_size = None
+    # recompute activations in the backward pass instead of storing them, for training at larger imsize
+    checkpointing = False
+    # stop a model after `patience` validations without val IoU improvement, validate every `val_every` epochs on at
+    # most `val_batches` batches, and stop before an epoch that would run past `time_budget` seconds (None = no limit,
+    # patience None = always run n_epochs)
+    patience = None
+    val_every = 1
+    val_batches = None
+    time_budget = None
+    # print a per-stage step timing table every epoch (saved to Results/<name>_step_timing.csv), and with trace also
+    # export a Chrome trace of the first steps of each model to Results/<name>_trace.json
+    profile = False
+    trace = False
+    # mixed precision forward passes (bfloat16 on CPU, float16 on CUDA), see LunarModules/Trainer.py
+    amp = False
+    # torch.compile the networks for training and testing, the compiled graphs are cached in Models/compile_cache
+    compile = False
+
+    def trace_path(name):
+        return os.path.join(RESULT_PATH, f'{name}_trace.json') if trace else None
+
+    def get_loaders(model_key):
+        '''
+        train/val loaders at the batch size configured for a model
+        '''
+        model_batch_size = get_model_config(config, model_key, 'batch_size', batch_size)
+        if model_batch_size == batch_size:
+            return train_data_loader, val_data_loader
+        return make_data_loader(train_data, batch_size=model_batch_size, shuffle=True, **train_loader_kwargs), make_data_loader(val_data, batch_size=model_batch_size, shuffle=True, **loader_kwargs)
+
+    # dataset level metrics from the confusion matrix of each epoch, for every model (LunarModules/Metrics.py)
+    metrics = METRICS
 
     lossCE = torch.nn.CrossEntropyLoss()
-    num_training_steps = n_epochs * len(train_data_loader)
 
     total_t0 = time.time()
 
@@ -119,25 +183,29 @@ def RUN_MODEL_LOOP(TRAIN = True, debug = False, plot = True, data_source = 'grou
     RESULTS = []
 
     # ----------------------------- SCRATCH MODEL
-    Unet = UNet_scratch(verbose = False).to(device)
-    opt = Adam(Unet.parameters(), lr = LR)
+    model_train_loader, model_val_loader = get_loaders('Unet_scratch')
+    num_training_steps = n_epochs * len(model_train_loader)
+    Unet = UNet_scratch(verbose = False, checkpointing = checkpointing).to(device)
+    opt = Adam(Unet.parameters(), lr = get_model_config(config, 'Unet_scratch', 'LR', LR))
     lr_scheduler = get_scheduler(name="linear", optimizer=opt, num_warmup_steps=0, num_training_steps=num_training_steps)
-    model = Model(Unet, loss = lossCE, opt = opt, scheduler = lr_scheduler, metrics = metrics, random_seed = 42, train_data_loader = train_data_loader, val_data_loader = val_data_loader, test_data_loader = test_data_loader, real_test_data_loader = real_test_data_loader, device = device, base_loc = BASE_PATH, name = f"Unet_scratch_{data_source}", log_file=None)
+    model = Model(Unet, loss = lossCE, opt = opt, scheduler = lr_scheduler, metrics = metrics, random_seed = 42, train_data_loader = model_train_loader, val_data_loader = model_val_loader, test_data_loader = test_data_loader, real_test_data_loader = real_test_data_loader, device = device, base_loc = BASE_PATH, name = f"Unet_scratch_{data_source}", log_file=None, batch_transform = batch_transform, amp = amp, compile = compile)
 
 
 
     if TRAIN:
         print('Training ', num_training_steps, 'steps!!')
-        model.run_training(n_epochs = n_epochs, save_on = 'val_IOU', load = False)
+        model.run_training(n_epochs = n_epochs, save_on = 'val_IOU', load = False, micro_batch_size = micro_batch_size, patience = patience, val_every = val_every, val_batches = val_batches, time_budget = time_budget, profile = profile, trace_path = trace_path(model.name))
 
 
     # ----------------------------- TEST
+    barrier() # make sure rank 0 finished saving before every rank loads
     _ = model.load() # always load latest model
     model.run_test()
-    _ = update_results(model, RESULTS, RESULT_PATH)
+    if is_main_process():
+        _ = update_results(model, RESULTS, RESULT_PATH)
 
-    if debug:
-        plot_prediction(model, test_data_loader, device)
+    if debug and is_main_process():
+        plot_prediction(model, test_data_loader, device, prediction_cache)
     all_models.append(model)
 
 
@@ -149,21 +217,23 @@ def RUN_MODEL_LOOP(TRAIN = True, debug = False, plot = True, data_source = 'grou
     activation = None
 
     Closs = smp.utils.losses.CrossEntropyLoss()
-    metrics = [
-        smp_utils.metrics.IoU(threshold=0.5)
-    ]
-    pretrained_vgg = Pretrained_Model(backbone = backbone, train_data_loader = train_data_loader, val_data_loader = val_data_loader, test_data_loader = test_data_loader, real_test_data_loader = real_test_data_loader, encoder_weights = encoder_weights, activation = activation, metrics = metrics, LR = LR, loss = Closs, device = device, base_loc = BASE_PATH, name = f'VGG11_BN_{data_source}')
+    # the IOU/Dice/pixel_accuracy/fwIOU of the confusion matrix are recorded without smp metrics
+    metrics = []
+    model_train_loader, model_val_loader = get_loaders('VGG11_BN')
+    pretrained_vgg = Pretrained_Model(backbone = backbone, train_data_loader = model_train_loader, val_data_loader = model_val_loader, test_data_loader = test_data_loader, real_test_data_loader = real_test_data_loader, encoder_weights = encoder_weights, activation = activation, metrics = metrics, LR = get_model_config(config, 'VGG11_BN', 'LR', LR), loss = Closs, device = device, base_loc = BASE_PATH, name = f'VGG11_BN_{data_source}', checkpointing = checkpointing, optimizer = get_model_config(config, 'VGG11_BN', 'optimizer', 'sgd'), batch_transform = batch_transform, amp = amp, compile = compile)
 
     if TRAIN:
-        pretrained_vgg.run_training(n_epochs, load = False)
+        pretrained_vgg.run_training(n_epochs, load = False, micro_batch_size = micro_batch_size, patience = patience, val_every = val_every, val_batches = val_batches, time_budget = time_budget, profile = profile, trace_path = trace_path(pretrained_vgg.name))
 
     # ----------------------------- TEST
+    barrier()
     _ = pretrained_vgg.load() # always load the best model
     pretrained_vgg.run_testing()
-    _ = update_results(pretrained_vgg, RESULTS, RESULT_PATH)
+    if is_main_process():
+        _ = update_results(pretrained_vgg, RESULTS, RESULT_PATH)
 
-    if debug:
-        plot_prediction(pretrained_vgg, test_data_loader, device)
+    if debug and is_main_process():
+        plot_prediction(pretrained_vgg, test_data_loader, device, prediction_cache)
     all_models.append(pretrained_vgg)
 
     # ----------------------------- RESNET
@@ -174,21 +244,23 @@ def RUN_MODEL_LOOP(TRAIN = True, debug = False, plot = True, data_source = 'grou
     activation = None
 
     Closs = smp.utils.losses.CrossEntropyLoss()
-    metrics = [
-        smp_utils.metrics.IoU(threshold=0.5)
-    ]
-    pretrained_resnet = Pretrained_Model(backbone = backbone, train_data_loader = train_data_loader, val_data_loader = val_data_loader, test_data_loader = test_data_loader, real_test_data_loader = real_test_data_loader, encoder_weights = encoder_weights, activation = activation, metrics = metrics, LR = LR, loss = Closs, device = device, base_loc = BASE_PATH, name = f'RESNET18_{data_source}')
+    # the IOU/Dice/pixel_accuracy/fwIOU of the confusion matrix are recorded without smp metrics
+    metrics = []
+    model_train_loader, model_val_loader = get_loaders('RESNET18')
+    pretrained_resnet = Pretrained_Model(backbone = backbone, train_data_loader = model_train_loader, val_data_loader = model_val_loader, test_data_loader = test_data_loader, real_test_data_loader = real_test_data_loader, encoder_weights = encoder_weights, activation = activation, metrics = metrics, LR = get_model_config(config, 'RESNET18', 'LR', LR), loss = Closs, device = device, base_loc = BASE_PATH, name = f'RESNET18_{data_source}', checkpointing = checkpointing, optimizer = get_model_config(config, 'RESNET18', 'optimizer', 'sgd'), batch_transform = batch_transform, amp = amp, compile = compile)
 
     if TRAIN:
-        pretrained_resnet.run_training(n_epochs, load = False)
+        pretrained_resnet.run_training(n_epochs, load = False, micro_batch_size = micro_batch_size, patience = patience, val_every = val_every, val_batches = val_batches, time_budget = time_budget, profile = profile, trace_path = trace_path(pretrained_resnet.name))
 
     # ----------------------------- TEST
+    barrier()
     _ = pretrained_resnet.load() # always load the best model
     pretrained_resnet.run_testing()
-    _ = update_results(pretrained_resnet, RESULTS, RESULT_PATH)
+    if is_main_process():
+        _ = update_results(pretrained_resnet, RESULTS, RESULT_PATH)
 
-    if debug:
-        plot_prediction(pretrained_resnet, test_data_loader, device)
+    if debug and is_main_process():
+        plot_prediction(pretrained_resnet, test_data_loader, device, prediction_cache)
     all_models.append(pretrained_resnet)
 
     # ----------------------------- Mobilenet
@@ -197,43 +269,50 @@ def RUN_MODEL_LOOP(TRAIN = True, debug = False, plot = True, data_source = 'grou
     activation = None
 
     Closs = smp.utils.losses.CrossEntropyLoss()
-    metrics = [
-        smp_utils.metrics.IoU(threshold = 0.5),
-    ]
-    pretrained_mobilenet = Pretrained_Model(backbone = backbone, train_data_loader = train_data_loader, val_data_loader = val_data_loader, test_data_loader = test_data_loader, real_test_data_loader = real_test_data_loader, encoder_weights = encoder_weights, activation = activation, metrics = metrics, LR = LR, loss = Closs, device = device, base_loc = BASE_PATH, name = f'mobilenetv3_large_100_{data_source}')
+    # the IOU/Dice/pixel_accuracy/fwIOU of the confusion matrix are recorded without smp metrics
+    metrics = []
+    model_train_loader, model_val_loader = get_loaders('mobilenetv3_large_100')
+    pretrained_mobilenet = Pretrained_Model(backbone = backbone, train_data_loader = model_train_loader, val_data_loader = model_val_loader, test_data_loader = test_data_loader, real_test_data_loader = real_test_data_loader, encoder_weights = encoder_weights, activation = activation, metrics = metrics, LR = get_model_config(config, 'mobilenetv3_large_100', 'LR', LR), loss = Closs, device = device, base_loc = BASE_PATH, name = f'mobilenetv3_large_100_{data_source}', checkpointing = checkpointing, optimizer = get_model_config(config, 'mobilenetv3_large_100', 'optimizer', 'sgd'), batch_transform = batch_transform, amp = amp, compile = compile)
 
     if TRAIN:
-        pretrained_mobilenet.run_training(n_epochs, load = False)
+        pretrained_mobilenet.run_training(n_epochs, load = False, micro_batch_size = micro_batch_size, patience = patience, val_every = val_every, val_batches = val_batches, time_budget = time_budget, profile = profile, trace_path = trace_path(pretrained_mobilenet.name))
 
     # ----------------------------- TEST
+    barrier()
     _ = pretrained_mobilenet.load() # always load the best model
     pretrained_mobilenet.run_testing()
-    _ = update_results(pretrained_mobilenet, RESULTS, RESULT_PATH)
+    if is_main_process():
+        _ = update_results(pretrained_mobilenet, RESULTS, RESULT_PATH)
 
-    if debug:
-        plot_prediction(pretrained_mobilenet, test_data_loader, device)
+    if debug and is_main_process():
+        plot_prediction(pretrained_mobilenet, test_data_loader, device, prediction_cache)
     all_models.append(pretrained_mobilenet)
 
 
     # ----------------------------- PLOT
-    if plot:
+    if plot and is_main_process():
     # Plot some test results' class channel breakdowns
-        check_plotter_channels_breakdown = Plotter()
+        check_plotter_channels_breakdown = Plotter(prediction_cache=prediction_cache)
         for mod in all_models:
             for i in range(5):
                 try:
                     print('Plotting breakdown channels')
                     # Plot every model made
-                    check_plotter_channels_breakdown.sanity_check(test_img_folder+'/' , test_mask_folder+'/', predicted_breakdown=True, predict=True, imsize=imsize, model=mod, test_type=f'render_test_{mod.name}')
-                    check_plotter_channels_breakdown.sanity_check(real_test_img_folder+'/' , real_test_mask_folder+'/', predicted_breakdown=True, predict=True, imsize=imsize, model=mod, test_type=f'real_test_{mod.name}')
+                    check_plotter_channels_breakdown.sanity_check(test_img_folder+'/' , test_mask_folder+'/', predicted_breakdown=True, predict=True, imsize=imsize, model=mod, test_type=f'render_test_{mod.name}', pyramid_root=pyramid_root)
+                    check_plotter_channels_breakdown.sanity_check(real_test_img_folder+'/' , real_test_mask_folder+'/', predicted_breakdown=True, predict=True, imsize=imsize, model=mod, test_type=f'real_test_{mod.name}', pyramid_root=pyramid_root)
 
                 except RuntimeError:
                     continue
 
+        print('prediction cache: ', prediction_cache.stats())
+
     total_t1 = time.time()
     total_time = (total_t1 - total_t0)/60
     print(f'TOTAL RUNTIME: {total_time} minutes')
 
+    if distributed:
+        cleanup_distributed()
+
 if __name__ == '__main__':
     print('Running modeling.py')
     RUN_MODEL_LOOP(TRAIN = False, debug = True, plot = True, data_source = 'ground')
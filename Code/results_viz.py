@@ -12,21 +12,21 @@ import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
 from LunarModules.Model import *
+from LunarModules.Paths import ProjectPaths
 
 ## path setup
-CODE_PATH = os.getcwd()
-os.chdir('..')
-BASE_PATH = os.getcwd()
-os.chdir(CODE_PATH)
+BASE_PATH = ProjectPaths().base
 plots_path = os.path.join(BASE_PATH, 'Results')
 results_path = os.path.join(BASE_PATH, 'Results/RESULTS.csv')
 
-# loading results
+# loading results, results saved before the models shared a Trainer (LunarModules/Trainer.py) have the smp names for
+# the pretrained models, renamed once here so every model has the same metric names
 res = pd.read_csv(results_path)
+res['metric'] = res.metric.replace({'train_cross_entropy_loss': 'train_loss', 'val_cross_entropy_loss': 'val_loss', 'train_iou_score': 'train_IOU', 'val_iou_score': 'val_IOU', 'test_iou_score': 'test_IOU'})
 
 ## CUSTOM LOSS
 fig, ax = plt.subplots(nrows = 1, ncols = 1, figsize = (8,6))
-loss = res[res.metric.isin(['train_loss', 'val_loss'])]
+loss = res[res.metric.isin(['train_loss', 'val_loss']) & (res.model_name == 'Unet_scratch_ground')]
 pal = {'train_loss': 'cornflowerblue', 'val_loss': 'salmon'}
 sns.lineplot(data = loss, x = 'epoch', y = 'value', hue = 'metric', palette = pal)
 ax.set_title('Custom U-Net Loss')
@@ -37,11 +37,11 @@ plt.show()
 
 ## VGG STATS
 fig, axes = plt.subplots(nrows = 1, ncols = 2, figsize = (8,5))
-lossvgg = res[res.metric.isin(['train_cross_entropy_loss', 'val_cross_entropy_loss']) & (res.model_name == 'VGG11_BN_ground')]
-pal = {'train_cross_entropy_loss': 'cornflowerblue', 'val_cross_entropy_loss': 'salmon'}
+lossvgg = res[res.metric.isin(['train_loss', 'val_loss']) & (res.model_name == 'VGG11_BN_ground')]
+pal = {'train_loss': 'cornflowerblue', 'val_loss': 'salmon'}
 sns.lineplot(data = lossvgg, x = 'epoch', y = 'value', hue = 'metric', ax = axes[0], palette = pal)
-pal = {'train_iou_score': 'cornflowerblue', 'val_iou_score': 'salmon'}
-iouvgg = res[res.metric.isin(['train_iou_score', 'val_iou_score']) & (res.model_name == 'VGG11_BN_ground')]
+pal = {'train_IOU': 'cornflowerblue', 'val_IOU': 'salmon'}
+iouvgg = res[res.metric.isin(['train_IOU', 'val_IOU']) & (res.model_name == 'VGG11_BN_ground')]
 sns.lineplot(data = iouvgg, x = 'epoch', y = 'value', hue = 'metric', ax = axes[1], palette = pal)
 axes[0].set_title('VGG11 Loss')
 axes[1].set_title('VGG11 IoU')
@@ -54,11 +54,11 @@ plt.show()
 
 ## RESNET STATS
 fig, axes = plt.subplots(nrows = 1, ncols = 2, figsize = (8,5))
-lossvgg = res[res.metric.isin(['train_cross_entropy_loss', 'val_cross_entropy_loss']) & (res.model_name == 'RESNET18_ground')]
-pal = {'train_cross_entropy_loss': 'cornflowerblue', 'val_cross_entropy_loss': 'salmon'}
+lossvgg = res[res.metric.isin(['train_loss', 'val_loss']) & (res.model_name == 'RESNET18_ground')]
+pal = {'train_loss': 'cornflowerblue', 'val_loss': 'salmon'}
 sns.lineplot(data = lossvgg, x = 'epoch', y = 'value', hue = 'metric', ax = axes[0], palette = pal)
-pal = {'train_iou_score': 'cornflowerblue', 'val_iou_score': 'salmon'}
-iouvgg = res[res.metric.isin(['train_iou_score', 'val_iou_score']) & (res.model_name == 'RESNET18_ground')]
+pal = {'train_IOU': 'cornflowerblue', 'val_IOU': 'salmon'}
+iouvgg = res[res.metric.isin(['train_IOU', 'val_IOU']) & (res.model_name == 'RESNET18_ground')]
 sns.lineplot(data = iouvgg, x = 'epoch', y = 'value', hue = 'metric', ax = axes[1], palette = pal)
 axes[0].set_title('ResNet Loss')
 axes[1].set_title('ResNet IoU')
@@ -71,11 +71,11 @@ plt.show()
 
 ## Mobilenet Stats
 fig, axes = plt.subplots(nrows = 1, ncols = 2, figsize = (8,5))
-lossvgg = res[res.metric.isin(['train_cross_entropy_loss', 'val_cross_entropy_loss']) & (res.model_name == 'mobilenetv3_large_100_ground')]
-pal = {'train_cross_entropy_loss': 'cornflowerblue', 'val_cross_entropy_loss': 'salmon'}
+lossvgg = res[res.metric.isin(['train_loss', 'val_loss']) & (res.model_name == 'mobilenetv3_large_100_ground')]
+pal = {'train_loss': 'cornflowerblue', 'val_loss': 'salmon'}
 sns.lineplot(data = lossvgg, x = 'epoch', y = 'value', hue = 'metric', ax = axes[0], palette = pal)
-pal = {'train_iou_score': 'cornflowerblue', 'val_iou_score': 'salmon'}
-iouvgg = res[res.metric.isin(['train_iou_score', 'val_iou_score']) & (res.model_name == 'mobilenetv3_large_100_ground')]
+pal = {'train_IOU': 'cornflowerblue', 'val_IOU': 'salmon'}
+iouvgg = res[res.metric.isin(['train_IOU', 'val_IOU']) & (res.model_name == 'mobilenetv3_large_100_ground')]
 sns.lineplot(data = iouvgg, x = 'epoch', y = 'value', hue = 'metric', ax = axes[1], palette = pal)
 axes[0].set_title('MobileNet Loss')
 axes[1].set_title('MobileNet IoU')
@@ -87,7 +87,7 @@ plt.savefig(plots_path + '/mobilenet_stats')
 plt.show()
 
 ## CUSTOM IOU
-iou = res[res.metric.isin(['train_IOU', 'val_IOU'])]
+iou = res[res.metric.isin(['train_IOU', 'val_IOU']) & (res.model_name == 'Unet_scratch_ground')]
 pal = {'train_IOU': 'cornflowerblue', 'val_IOU': 'salmon'}
 fig, ax = plt.subplots(nrows = 1, ncols = 1, figsize = (8,6))
 sns.lineplot(data = iou, x = 'epoch', y = 'value', hue = 'metric', palette = pal)
@@ -99,28 +99,21 @@ plt.savefig(plots_path + '/custom_iou')
 plt.show()
 
 
-# renaming the stats so they're the same across models
-res2 = res.replace(to_replace = 'train_cross_entropy_loss', value = 'train_loss')
-res2 = res2.replace(to_replace = 'val_cross_entropy_loss', value = 'val_loss')
-res2 = res2.replace(to_replace = 'train_iou_score', value = 'train_IOU')
-res2 = res2.replace(to_replace = 'val_iou_score', value = 'val_IOU')
-
 ## TRAINING COMPARE
-loss_t = res2[res2.metric.isin(['train_loss', 'val_loss'])]
+loss_t = res[res.metric.isin(['train_loss', 'val_loss'])]
 h = sns.relplot(data = loss_t, x = 'epoch', y = 'value', hue = 'model_name', col = 'metric', kind = 'line')
 h.fig.savefig(plots_path + '/training_compare')
 plt.show()
 
 ## IOU COMPARE
-iou_t = res2[res2.metric.isin(['train_IOU', 'val_IOU'])]
+iou_t = res[res.metric.isin(['train_IOU', 'val_IOU'])]
 h = sns.relplot(data = iou_t, x = 'epoch', y = 'value', hue = 'model_name', col = 'metric', kind = 'line')
 h.fig.savefig(plots_path + '/iou_compare')
 plt.show()
 
 
 ## TEST
-res2 = res2.replace('test_iou_score', 'test_IOU')
-test = res2[res2.metric.isin(['test_IOU'])]
+test = res[res.metric.isin(['test_IOU'])]
 test = pd.concat([test, pd.DataFrame([['RANDOM', -1, 'test_IOU', 0.09]], columns = ['model_name', 'epoch', 'metric', 'value'])])
 test.drop_duplicates(subset = 'model_name', keep = 'last', inplace = True)
 
@@ -0,0 +1,34 @@
+"""
+serve.py
+Script to serve trained models over HTTP with dynamic batching (see LunarModules/Serving.py)
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+from LunarModules.Paths import ProjectPaths
+from LunarModules.ModelStore import DEFAULT_MODEL_SOURCE
+from LunarModules.Serving import InferenceServer, load_batchers
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', default = 'RESNET18_ground', type = str, required = False, help = 'comma separated model names')
+    parser.add_argument('--host', default = '127.0.0.1', type = str, required = False)
+    parser.add_argument('--port', default = 8080, type = int, required = False)
+    parser.add_argument('--imsize', default = 256, type = int, required = False)
+    parser.add_argument('--max_batch_size', default = 8, type = int, required = False)
+    parser.add_argument('--max_wait_ms', default = 10, type = float, required = False)
+    parser.add_argument('--max_queue', default = 256, type = int, required = False)
+    parser.add_argument('--base_path', default = None, type = str, required = False)
+    parser.add_argument('--model_source', default = DEFAULT_MODEL_SOURCE, type = str, required = False)
+    args = parser.parse_args()
+
+    batchers = load_batchers(args.models.split(','), paths = ProjectPaths(args.base_path), imsize = args.imsize, max_batch_size = args.max_batch_size, max_wait_ms = args.max_wait_ms, max_queue = args.max_queue, model_source = None if args.model_source == 'None' else args.model_source)
+    server = InferenceServer(batchers, host = args.host, port = args.port)
+    print(f'serving {list(batchers.keys())} on {server.url} (POST /predict/<model>, GET /metrics, GET /health)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('shutting down')
+    finally:
+        server.shutdown()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules are imported the way the scripts in Code/ import them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
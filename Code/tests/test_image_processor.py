@@ -0,0 +1,87 @@
+"""
+test_image_processor.py
+ImageProcessor.encode_mask (lookup table encoder) against the original mask preprocessing,
+mask_max_pixel_normalize -> one_hot_encode -> rescale, on synthetic RGB masks with off palette and anti-aliased pixels.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+
+from LunarModules.ImageProcessor import ImageProcessor, CLASS_MAP, IGNORE_INDEX
+
+# colours that are no class: yellow, dark red, grey, white
+OFF_PALETTE = np.array([[255, 255, 0], [128, 0, 0], [100, 100, 100], [255, 255, 255]])
+
+
+def synthetic_mask(size = 64, seed = 0, off_palette = 0.05, blur = False, scale = 1.0, alpha = False):
+    '''
+    RGB mask with values 0-1 as loaded by plt.imread: blocks of class colours, some off palette pixels
+    :param off_palette: share of pixels set to an off palette colour
+    :param blur: resize down and up with bilinear interpolation, blends the colours along every edge (anti-aliasing)
+    :param scale: multiply the mask, the channel maxima end up below 1 (mask_max_pixel_normalize thresholds on them)
+    :param alpha: add an alpha channel like PNGs saved with one
+    '''
+    rng = np.random.default_rng(seed)
+    palette = CLASS_MAP[['r', 'g', 'b']].values
+    blocks = rng.integers(0, len(palette), (size // 8, size // 8))
+    mask = palette[np.kron(blocks, np.ones((8, 8), dtype = int))]
+    off = rng.random((size, size)) < off_palette
+    mask[off] = OFF_PALETTE[rng.integers(0, len(OFF_PALETTE), off.sum())]
+    mask = (mask / 255).astype(np.float32)
+    if blur:
+        mask = cv2.resize(cv2.resize(mask, (size // 2 + 3, size // 2 + 3), interpolation = cv2.INTER_LINEAR), (size, size), interpolation = cv2.INTER_LINEAR)
+    mask = mask * np.float32(scale)
+    if alpha:
+        mask = np.dstack([mask, np.ones(mask.shape[:2], dtype = np.float32)])
+    return mask
+
+
+def reference_one_hot(processor, mask, class_map = None):
+    return processor.rescale(processor.one_hot_encode(processor.mask_max_pixel_normalize(mask), class_map))
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'off_palette': 0.3},
+    {'blur': True},
+    {'blur': True, 'scale': 0.9},
+    {'scale': 0.5, 'off_palette': 0.2},
+    {'alpha': True, 'blur': True},
+    {'size': 256, 'seed': 3, 'blur': True},
+])
+def test_encode_mask_matches_reference(kwargs):
+    processor = ImageProcessor()
+    mask = synthetic_mask(**kwargs)
+    reference = reference_one_hot(processor, mask)
+
+    one_hot = processor.encode_mask(mask, output = 'one_hot')
+    assert one_hot.shape == reference.shape
+    assert np.array_equal(one_hot, reference)
+
+    index = processor.encode_mask(mask, output = 'index')
+    unmatched = ~reference.any(axis = 2)
+    assert np.all(index[unmatched] == IGNORE_INDEX)
+    assert np.array_equal(index[~unmatched], reference.argmax(axis = 2)[~unmatched])
+    assert np.array_equal(processor.preprocessor_masks(mask), reference)
+
+
+def test_encode_mask_has_unmatched_pixels():
+    # the masks above do exercise pixels that match no class
+    processor = ImageProcessor()
+    for kwargs in [{'off_palette': 0.3}, {'blur': True}]:
+        assert (processor.encode_mask(synthetic_mask(**kwargs), output = 'index') == IGNORE_INDEX).any()
+
+
+def test_encode_mask_fallback_class_map():
+    # colours that aren't pure 0/255 channels go through the per class comparison instead of the lookup tables
+    processor = ImageProcessor()
+    class_map = pd.DataFrame({'name': ['a', 'b'], 'r': [255, 0], 'g': [0, 128], 'b': [0, 0]})
+    mask = synthetic_mask(blur = True)
+    reference = reference_one_hot(processor, mask, class_map)
+    assert np.array_equal(processor.encode_mask(mask, class_map = class_map), reference)
+    index = processor.encode_mask(mask, class_map = class_map, output = 'index')
+    assert np.all(index[~reference.any(axis = 2)] == IGNORE_INDEX)
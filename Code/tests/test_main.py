@@ -0,0 +1,55 @@
+"""
+test_main.py
+Every --method of the original CLI still runs end to end on a small synthetic dataset (the modeling loop and the EDA
+are recorded instead of run).
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import pytest
+
+import main
+from main import METHODS
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    import modeling
+
+    calls = []
+    monkeypatch.setattr(modeling, 'RUN_MODEL_LOOP', lambda **kwargs: calls.append(('model', kwargs)))
+    monkeypatch.setattr(main, 'run_eda', lambda paths: calls.append(('eda', paths)))
+    return calls
+
+
+@pytest.mark.parametrize('method', list(METHODS.keys()))
+def test_method(method, tmp_path, calls):
+    main.main(['--method', method, '--base_path', str(tmp_path), '--synthetic', '6'])
+
+    command, debug = METHODS[method]
+    assert (tmp_path / 'Data' / 'images' / 'render').is_dir()
+    if command in ['train', 'evaluate']:
+        assert (tmp_path / 'Data' / 'images' / 'train').is_dir()
+        assert [(name, kwargs['TRAIN'], kwargs['debug']) for name, kwargs in calls] == [('model', command == 'train', debug)]
+    elif command == 'split':
+        assert (tmp_path / 'Data' / 'images' / 'train').is_dir()
+        assert calls == []
+    elif command == 'eda':
+        assert [name for name, _ in calls] == ['eda']
+
+
+@pytest.mark.parametrize('argv, expected', [
+    (['train'], {'debug': False, 'EDA': False, 'distributed': False, 'pyramid': False}),
+    (['train', '--debug', '--pyramid'], {'debug': True, 'EDA': False, 'distributed': False, 'pyramid': True}),
+    (['--debug', '--distributed', 'train', '--EDA'], {'debug': True, 'EDA': True, 'distributed': True, 'pyramid': False}),
+    (['--method', 'debug'], {'debug': True, 'EDA': False, 'distributed': False, 'pyramid': False}),
+    (['split', '--resplit'], {'resplit': True, 'stratify': False}),
+])
+def test_flags(argv, expected):
+    args = main.parse_args(argv)
+    assert {key: getattr(args, key) for key in expected} == expected
+
+
+def test_flags_take_no_value():
+    with pytest.raises(SystemExit):
+        main.parse_args(['train', '--distributed', 'False'])
@@ -5,37 +5,46 @@ Script to download trained models from Google Drive link
 author: @saharae, @justjoshtings
 created: 12/09/2022
 """
-import gdown
-import os
+import argparse
+from LunarModules.ModelStore import ModelStore, DEFAULT_MODEL_SOURCE
+from LunarModules.DataFetcher import is_gdrive_folder
+from LunarModules.Paths import ProjectPaths
 
-def download_trained_models(trained_models_url="https://drive.google.com/drive/folders/1x8qjoZVuTyvvi7FqkTLpNOimdBWLgapF?usp=sharing"):
+def download_trained_models(trained_models_url=DEFAULT_MODEL_SOURCE, names=None, paths=None):
     '''
     Function to download trained models from Google Drive link
+
+    Models are also downloaded on demand when Model.load()/Pretrained_Model.load() can't find them in the cache, this
+    prefetches them. Cached checkpoints that pass verification are kept, nothing is deleted.
+    :param trained_models_url: model source, Google Drive folder URL, http(s) base URL, file:// URL or local directory
+    :param names: model names to download, ie: ['RESNET18_ground'], None for every model of the source
+    :param paths: ProjectPaths to download to, None for the project this file is in
     '''
 
     '''
     Set paths
     '''
-    CODE_PATH = os.getcwd()
-    os.chdir('..')
-    BASE_PATH = os.getcwd()
-    os.chdir(CODE_PATH)
-    TRAINED_MODELS_PATH = os.path.join(BASE_PATH, 'Models')
-
-    if not os.path.exists(TRAINED_MODELS_PATH):
-            os.makedirs(TRAINED_MODELS_PATH)
-
-    for root, dirs, files in os.walk(os.path.join(TRAINED_MODELS_PATH, 'lunar_surface_segmentation_models')):
-        for file in files:
-            os.remove(os.path.join(root, file))
+    paths = ProjectPaths() if paths is None else paths
 
     '''
     Download 
     '''
-    os.chdir(TRAINED_MODELS_PATH)
-    gdown.download_folder(trained_models_url, quiet=True, use_cookies=False)
+    # every model is wanted here, so a Drive folder without per model file ids is downloaded whole
+    store = ModelStore(paths.model_cache, source=trained_models_url, folder_fallback=True)
+    if names is None:
+        names = list(store.source_manifest().keys())
+    if len(names) == 0 and is_gdrive_folder(trained_models_url):
+        # Drive folder without a manifest, the whole folder is the only unit that can be downloaded
+        names = list(store.download_folder()['models'].keys())
+    for name in names:
+        path, epoch = store.fetch(name)
+        print(f'{name}: {path} (epoch {epoch})')
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', default = DEFAULT_MODEL_SOURCE, type = str, required = False)
+    parser.add_argument('--names', default = None, type = str, required = False)
+    args = parser.parse_args()
     print('Running trained_model_dl.py')
-    download_trained_models()
\ No newline at end of file
+    download_trained_models(trained_models_url=args.source, names=None if args.names is None else args.names.split(','))
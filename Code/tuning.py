@@ -0,0 +1,123 @@
+"""
+tuning.py
+Script to find a learning rate and batch size for each model and write them into experiment_config.json
+
+For each model it runs a max-throughput batch size probe, then an LR range test at that batch size, both on a short
+slice of the train data. modeling.py reads the recommended values from experiment_config.json.
+
+author: @saharae, @justjoshtings
+created: 10/19/2026
+"""
+import argparse
+import datetime as dt
+import torch
+import segmentation_models_pytorch as smp
+import segmentation_models_pytorch.utils as smp_utils
+from torch.optim import Adam, SGD
+from LunarModules.CustomDataLoader import CustomDataLoader
+from LunarModules.Model import UNet_scratch
+from LunarModules.Tuner import lr_range_test, find_batch_size
+from LunarModules.utils import load_experiment_config, save_experiment_config
+from LunarModules.Paths import ProjectPaths
+from torch.utils.data import DataLoader
+
+# [config key, smp backbone (None for the scratch U-Net)]
+MODELS = [
+    ['Unet_scratch', None],
+    ['VGG11_BN', 'vgg11_bn'],
+    ['RESNET18', 'resnet18'],
+    ['mobilenetv3_large_100', 'timm-mobilenetv3_large_100'],
+]
+
+
+def build_model(backbone, imsize, encoder_weights, optimizer_name, LR):
+    '''
+    build a network, loss and optimizer the same way modeling.py does
+    :param backbone: smp backbone, None for the scratch U-Net
+    :param imsize: image size
+    :param encoder_weights: smp encoder weights
+    :param optimizer_name: 'adam' or 'sgd'
+    :param LR: initial learning rate
+    :return: model, loss, optimizer
+    '''
+    if backbone is None:
+        model = UNet_scratch(verbose = False, out_sz = (imsize, imsize))
+        loss = torch.nn.CrossEntropyLoss()
+    else:
+        model = smp.Unet(encoder_name = backbone, encoder_weights = encoder_weights, classes = 4, activation = None)
+        loss = smp_utils.losses.CrossEntropyLoss()
+    if optimizer_name == 'adam':
+        opt = Adam(model.parameters(), lr = LR)
+    else:
+        opt = SGD(model.parameters(), lr = LR, momentum = 0.9)
+    return model, loss, opt
+
+
+def RUN_TUNING(models = None, imsize = 256, n_samples = 256, batch_sizes = (4, 8, 16, 32, 64), num_iter = 100, max_memory_mb = None, encoder_weights = 'imagenet', paths = None):
+    '''
+    Run the batch size probe and LR range test for each model and save the results to experiment_config.json
+    :param models: config keys of the models to tune, None for all
+    :param imsize: image size
+    :param n_samples: number of train images to use
+    :param batch_sizes: batch sizes to try
+    :param num_iter: steps of the LR range test
+    :param max_memory_mb: optional memory cap for the batch size probe
+    :param encoder_weights: smp encoder weights
+    :param paths: ProjectPaths of the data and experiment config, None for the project this file is in
+    :return: updated config
+    '''
+    paths = ProjectPaths() if paths is None else paths
+    DATA_PATH = paths.data
+    CONFIG_PATH = paths.experiment_config
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    print('Using device..', device)
+    torch.manual_seed(42)
+
+    train_data = CustomDataLoader(img_folder = DATA_PATH + '/images/train/render', mask_folder = DATA_PATH + '/images/train/mask', batch_size = 1, imsize = imsize, num_classes = 4, split = 'train', first_n = n_samples, augmentation = True)
+
+    config = load_experiment_config(CONFIG_PATH)
+    for key, backbone in MODELS:
+        if models is not None and key not in models:
+            continue
+        print(f'----- TUNING: {key}')
+        current = config['models'].get(key, {})
+        optimizer_name = current.get('optimizer', 'adam' if backbone is None else 'sgd')
+        model, loss, opt = build_model(backbone, imsize, encoder_weights, optimizer_name, current.get('LR', 0.001))
+        model = model.to(device)
+
+        bs_result = find_batch_size(model, loss, opt, train_data, device, candidates = batch_sizes, max_memory_mb = max_memory_mb)
+        batch_size = bs_result['best_batch_size'] or current.get('batch_size', 32)
+
+        train_loader = DataLoader(train_data, batch_size = batch_size, shuffle = True)
+        lr_result = lr_range_test(model, loss, opt, train_loader, device, num_iter = num_iter)
+
+        print(f'{key}: batch size {batch_size}, LR {lr_result["suggested_lr"]:.2e}')
+        config['models'][key] = {
+            'LR': lr_result['suggested_lr'],
+            'batch_size': int(batch_size),
+            'optimizer': optimizer_name,
+            'tuned': {
+                'date': dt.datetime.now().isoformat(timespec = 'seconds'),
+                'device': str(device),
+                'imsize': imsize,
+                'throughput': {str(k): round(v, 2) for k, v in bs_result['throughput'].items()},
+            },
+        }
+        save_experiment_config(config, CONFIG_PATH)
+
+    return config
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', default = None, type = str, required = False)
+    parser.add_argument('--imsize', default = 256, type = int, required = False)
+    parser.add_argument('--n_samples', default = 256, type = int, required = False)
+    parser.add_argument('--batch_sizes', default = '4,8,16,32,64', type = str, required = False)
+    parser.add_argument('--num_iter', default = 100, type = int, required = False)
+    parser.add_argument('--max_memory_mb', default = None, type = float, required = False)
+    parser.add_argument('--encoder_weights', default = 'imagenet', type = str, required = False)
+    args = parser.parse_args()
+    print('Running tuning.py')
+    RUN_TUNING(models = None if args.models is None else args.models.split(','), imsize = args.imsize, n_samples = args.n_samples, batch_sizes = [int(b) for b in args.batch_sizes.split(',')], num_iter = args.num_iter, max_memory_mb = args.max_memory_mb, encoder_weights = None if args.encoder_weights == 'None' else args.encoder_weights)